@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compares the gir indexer with the previous XPath-based implementation.
+
+Usage: gir_indexing.py [-n REPEAT] [-r REVISION ...]
+                       /usr/share/gir-1.0/Gtk-3.0.gir [...]
+
+The indexers of other git revisions of the tree can be timed as well,
+for example the streaming indexer which preceded the single pass one.
+"""
+
+import argparse
+import imp
+import os
+import subprocess
+import sys
+import timeit
+
+from lxml import etree
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+# pylint: disable=wrong-import-position
+from hotdoc_gi_extension.gir_index import index_gir, NSMAP, NS_C
+
+
+def _get_klass_name(klass):
+    klass_name = klass.attrib.get('{%s}type' % NS_C)
+    if not klass_name:
+        klass_name = klass.attrib.get('{http://www.gtk.org/introspection/'
+                                      'glib/1.0}type-name')
+    return klass_name
+
+
+def xpath_index_gir(gir_file):
+    """The five traversals GIExtension used to run over each gir tree."""
+    gir_root = etree.parse(gir_file).getroot()
+    nodes = {}
+
+    for node in gir_root.xpath('.//*[@c:identifier]', namespaces=NSMAP):
+        nodes[node.attrib['{%s}identifier' % NS_C]] = node
+
+    for node in gir_root.xpath(
+            './/*[not(self::core:type) and not (self::core:array)][@c:type]',
+            namespaces=NSMAP):
+        nodes[node.attrib['{%s}type' % NS_C]] = node
+
+    for fmt, path in (('%s:%s', './/core:property'),
+                      ('%s::%s', './/glib:signal'),
+                      ('%s:::%s', './/core:virtual-method')):
+        for node in gir_root.xpath(path, namespaces=NSMAP):
+            name = fmt % (_get_klass_name(node.getparent()),
+                          node.attrib['name'])
+            nodes[name] = node
+
+    return nodes
+
+
+def load_revision(revision):
+    """Returns the gir_index module of a git `revision` of the tree."""
+    path = 'hotdoc_gi_extension/gir_index.py'
+    source = subprocess.check_output(
+        ['git', 'show', '%s:%s' % (revision, path)], cwd=ROOT)
+    module = imp.new_module('gir_index_%s' % revision)
+    module.__file__ = path
+    # pylint: disable=exec-used
+    exec compile(source, path, 'exec') in module.__dict__
+    return module
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--repeat', type=int, default=5)
+    parser.add_argument('-r', '--revision', action='append', default=[],
+                        help='Also time the indexer of this git revision')
+    parser.add_argument('gir_files', nargs='+')
+    args = parser.parse_args()
+
+    indexers = [('xpath', xpath_index_gir), ('single-pass', index_gir)]
+    # Modules are kept around, their globals are cleared once collected
+    modules = [load_revision(revision) for revision in args.revision]
+    for revision, module in zip(args.revision, modules):
+        indexers.append((revision, module.index_gir))
+
+    for gir_file in args.gir_files:
+        print os.path.basename(gir_file)
+        for name, func in indexers:
+            timer = timeit.Timer(lambda: func(gir_file))
+            best = min(timer.repeat(repeat=args.repeat, number=1))
+            print '  %-12s %8.1f ms' % (name, best * 1000)
+
+
+if __name__ == '__main__':
+    main()
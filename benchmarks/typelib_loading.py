@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compares indexing gir files with reading their typelibs.
+
+Usage: typelib_loading.py [-n REPEAT] /usr/share/gir-1.0/Gtk-3.0.gir [...]
+
+Typelibs are looked up like the extension does, see
+`hotdoc_gi_extension.typelib_index.find_typelib`.
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# pylint: disable=wrong-import-position
+from hotdoc_gi_extension.gir_index import index_gir
+from hotdoc_gi_extension.typelib_index import index_gir_typelib
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--repeat', type=int, default=5)
+    parser.add_argument('gir_files', nargs='+')
+    args = parser.parse_args()
+
+    for gir_file in args.gir_files:
+        print os.path.basename(gir_file)
+        partial_index = index_gir_typelib(gir_file)
+        if partial_index is None:
+            print '  no usable typelib'
+            continue
+
+        gir_index = index_gir(gir_file)
+        print '  %-12s %8d nodes' % ('gir', len(gir_index.nodes))
+        print '  %-12s %8d nodes' % ('typelib', len(partial_index.nodes))
+
+        for name, func in (('gir', index_gir),
+                           ('typelib', index_gir_typelib)):
+            timer = timeit.Timer(lambda: func(gir_file))
+            best = min(timer.repeat(repeat=args.repeat, number=1))
+            print '  %-12s %8.1f ms' % (name, best * 1000)
+
+
+if __name__ == '__main__':
+    main()
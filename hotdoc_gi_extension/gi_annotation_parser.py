@@ -16,6 +16,8 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this library.  If not, see <http://www.gnu.org/licenses/>.
 
+from collections import namedtuple, defaultdict
+
 ALLOW_NONE_HELP = \
 "NULL is OK, both for passing and returning"
 
@@ -78,14 +80,53 @@ OPTIONAL_HELP = \
 TYPE_HELP = \
 "Override the parsed C type with given type"
 
-class GIAnnotation (object):
-    def __init__(self, nick, help_text, value=None):
-        self.nick = nick
-        self.help_text = help_text
-        self.value = value
+
+class GIAnnotation (namedtuple('GIAnnotation', ['nick', 'help_text', 'value'])):
+    """An immutable gobject-introspection annotation.
+
+    Annotations are interned, equal annotations are the same object.
+    """
+    __slots__ = ()
+    __interned = {}
+
+    def __new__(cls, nick, help_text, value=None):
+        key = (nick, help_text, value)
+        annotation = cls.__interned.get(key)
+        if annotation is None:
+            annotation = super(GIAnnotation, cls).__new__(cls, nick,
+                                                          help_text, value)
+            annotation = cls.__interned.setdefault(key, annotation)
+        return annotation
+
+    def __reduce__(self):
+        # Unpickled annotations are interned too, whatever the protocol
+        return (GIAnnotation, tuple(self))
+
+
+class _DictArgument(tuple):
+    """The (name, value) items of a dict argument, in their order."""
+    __slots__ = ()
+
+
+def _canonical_argument(argument):
+    # Arguments make part of the keys parsed annotations are shared by,
+    # whatever their nesting
+    if type(argument) == list:
+        return tuple(_canonical_argument(val) for val in argument)
+    if type(argument) == dict:
+        return _DictArgument((name, _canonical_argument(val))
+                             for name, val in argument.iteritems())
+    return argument
 
 
 class GIAnnotationParser(object):
+    """Turns the annotations of comments into `GIAnnotation` tuples.
+
+    Comments with the same annotations share the same tuple, which is
+    only built once. The annotations no factory knows about are gathered
+    in `unknown_annotations`, with the arguments they were seen with,
+    rather than printed.
+    """
     def __init__(self):
         self.__annotation_factories = \
                 {"allow-none": self.__make_allow_none_annotation,
@@ -102,6 +143,8 @@ class GIAnnotationParser(object):
                  "optional": self.__make_optional_annotation,
                  "default": self.__make_default_annotation,
                 }
+        self.__parsed = {}
+        self.unknown_annotations = defaultdict(set)
 
     def __make_type_annotation (self, annotation, value):
         if not value:
@@ -141,20 +184,20 @@ class GIAnnotationParser(object):
 
     def __make_element_type_annotation (self, annotation, value):
         annotation_val = None
-        if type(value) == list:
+        if type(value) == tuple:
             annotation_val = value[0]
         return GIAnnotation ("element-type", ELEMENT_TYPE_HELP, annotation_val)
 
     def __make_array_annotation (self, annotation, value):
         annotation_val = None
-        if type(value) == dict:
+        if type(value) == _DictArgument:
             annotation_val = ""
-            for name, val in value.iteritems():
+            for name, val in value:
                 annotation_val += "%s=%s" % (name, val)
         return GIAnnotation ("array", ARRAY_HELP, annotation_val)
 
     def __make_scope_annotation (self, annotation, value):
-        if type (value) != list or not value:
+        if type (value) != tuple or not value:
             return None
 
         if value[0] == "async":
@@ -166,7 +209,7 @@ class GIAnnotationParser(object):
         return None
 
     def __make_closure_annotation (self, annotation, value):
-        if type (value) != list or not value:
+        if type (value) != tuple or not value:
             return GIAnnotation ("closure", CLOSURE_DATA_HELP)
 
         return GIAnnotation ("closure", CLOSURE_HELP % value[0])
@@ -183,27 +226,43 @@ class GIAnnotationParser(object):
             return None
         return factory (annotation_name, annotation_value)
 
-    def make_annotations (self, parameter):
-        if not parameter.comment:
-            return []
-
-        if not parameter.comment.annotations:
-            return []
-
+    def __parse_annotations (self, key):
         annotations = []
 
-        for ann, val in parameter.comment.annotations.iteritems():
-            if ann == "skip":
-                continue
-            annotation = self.__create_annotation (ann, val.argument)
+        for ann, val in key:
+            annotation = self.__create_annotation (ann, val)
             if not annotation:
                 # Special case for silly specification
-                if (ann == 'not' and len(val.argument) == 1 and
-                        val.argument[0] == 'nullable'):
+                if ann == 'not' and val == ('nullable',):
                     annotations.append(self.__make_not_nullable_annotation())
                 else:
-                    print "This parameter annotation is unknown :[" + ann + "]", val.argument
+                    self.unknown_annotations[ann].add(val)
                 continue
             annotations.append (annotation)
 
+        return tuple(annotations)
+
+    def make_annotations (self, parameter):
+        """Returns the `GIAnnotation` tuple of `parameter`."""
+        comment = parameter.comment
+        if not comment:
+            return ()
+
+        if not comment.annotations:
+            return ()
+
+        attrs = comment.extension_attrs['gi-extension']
+        annotations = attrs.get('annotations')
+        if annotations is not None:
+            return annotations
+
+        key = tuple((ann, _canonical_argument(val.argument))
+                    for ann, val in comment.annotations.iteritems()
+                    if ann != "skip")
+        annotations = self.__parsed.get(key)
+        if annotations is None:
+            annotations = self.__parse_annotations(key)
+            self.__parsed[key] = annotations
+
+        attrs['annotations'] = annotations
         return annotations
@@ -43,30 +43,68 @@ GIHtmlFormatter will make sense of at format-time.
 
 This approach allows incremental rebuilding to be way faster
 than the initial build.
+
+To keep it that way when gir files change, we remember a digest
+of the gir nodes each symbol was built from, and only mark stale
+the pages of the symbols whose nodes changed.
+
+The C symbols themselves may also be created from the gir files of
+the project, which know the C types of what they describe, in which
+case the headers they describe completely aren't parsed with clang
+by the C extension.
 """
 
 import os
+import socket
+import hashlib
+import threading
+import multiprocessing
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 from lxml import etree
-from collections import defaultdict
 
 from hotdoc.core.symbols import *
 from hotdoc.core.base_extension import BaseExtension, ExtDependency
 from hotdoc.core.base_formatter import Formatter
 from hotdoc.core.file_includer import find_md_file
 from hotdoc.core.links import Link, LinkResolver
-from hotdoc.core.doc_tree import Page
+from hotdoc.core.doc_tree import Page, DocTree
 from hotdoc.core.comment_block import Comment
-from hotdoc.core.exceptions import BadInclusionException
-from hotdoc.utils.loggable import warn, Logger
+from hotdoc.core.exceptions import BadInclusionException, HotdocException
+from hotdoc.parsers.gtk_doc_parser import GtkDocParser
+from hotdoc.utils.loggable import warn, error, Logger
+from hotdoc.utils.utils import get_mtime
 
-from .gi_html_formatter import GIHtmlFormatter
+from .gi_html_formatter import GIHtmlFormatter, make_link_slot
 from .gi_annotation_parser import GIAnnotationParser
 from .fundamentals import PY_FUNDAMENTALS, JS_FUNDAMENTALS
+from .gir_index import (index_gir, read_gir_header, get_record_state,
+                        GirRepository, GirIndex, PartialGirIndex, GirType)
+from .gir_cache import GirCache, SharedGirCache, make_stamp, check_stamp
+from .gir_hierarchy import GirHierarchy
+from .gtkdoc_links import GtkDocLinkIndex
+from .gir_watcher import GirWatcher
+from .gir_server import (get_default_socket_path, GirIndexClient,
+                         RemoteGirRepository, RemoteLinkIndex,
+                         make_gir_repository)
+from .typelib_index import index_gir_typelib
+from .gir_declarations import index_declarations, match_header, scan_header
 
 
 Logger.register_warning_code('missing-gir-include', BadInclusionException,
                              'gi-extension')
+Logger.register_error_code('format-worker-failed', HotdocException,
+                           'gi-extension')
+
+
+# Bump this whenever the way gir dependencies are digested changes
+GIR_DEPS_VERSION = 3
 
 
 class Flag (object):
@@ -119,6 +157,64 @@ class ConstructOnlyFlag (Flag):
         Flag.__init__ (self, "Construct Only", None)
 
 
+# Flags are stored on symbols as a mask of these, and only turned into
+# Flag objects when the symbol is formatted
+FLAG_RUN_FIRST = 1 << 0
+FLAG_RUN_LAST = 1 << 1
+FLAG_RUN_CLEANUP = 1 << 2
+FLAG_NO_HOOKS = 1 << 3
+FLAG_READABLE = 1 << 4
+FLAG_WRITABLE = 1 << 5
+FLAG_CONSTRUCT_ONLY = 1 << 6
+FLAG_CONSTRUCT = 1 << 7
+
+# In the order flags are displayed in
+_FLAG_CLASSES = [(FLAG_RUN_FIRST, RunFirstFlag),
+                 (FLAG_RUN_LAST, RunLastFlag),
+                 (FLAG_RUN_CLEANUP, RunCleanupFlag),
+                 (FLAG_NO_HOOKS, NoHooksFlag),
+                 (FLAG_READABLE, ReadableFlag),
+                 (FLAG_WRITABLE, WritableFlag),
+                 (FLAG_CONSTRUCT_ONLY, ConstructOnlyFlag),
+                 (FLAG_CONSTRUCT, ConstructFlag)]
+
+
+def make_flags(mask):
+    """Returns the `Flag` objects set in `mask`, in display order."""
+    return [flag_class() for bit, flag_class in _FLAG_CLASSES
+            if mask & bit]
+
+
+def get_signal_flags(node):
+    """Returns the mask of the flags of gir signal `node`."""
+    flags = 0
+
+    when = node.when
+    if when == "first":
+        flags |= FLAG_RUN_FIRST
+    elif when == "last":
+        flags |= FLAG_RUN_LAST
+    elif when == "cleanup":
+        flags |= FLAG_RUN_CLEANUP
+
+    if node.no_hooks:
+        flags |= FLAG_NO_HOOKS
+
+    return flags
+
+
+def get_property_flags(node):
+    """Returns the mask of the flags of gir property `node`."""
+    flags = FLAG_READABLE
+    if node.writable:
+        flags |= FLAG_WRITABLE
+    if node.construct_only:
+        flags |= FLAG_CONSTRUCT_ONLY
+    elif node.construct:
+        flags |= FLAG_CONSTRUCT
+    return flags
+
+
 DESCRIPTION=\
 """
 Parse a gir file and add signals, properties, classes
@@ -131,65 +227,109 @@ Must be used in combination with the C extension.
 """
 
 
+class LanguageContext(namedtuple('LanguageContext',
+                                 ['language', 'fundamentals'])):
+    """What formatting documentation in `language` depends on."""
+    __slots__ = ()
+
+
+LANGUAGE_CONTEXTS = {
+    # Leaves link refs and titles as slots, see GIHtmlFormatter
+    None: LanguageContext(None, {}),
+    'c': LanguageContext('c', {}),
+    'python': LanguageContext('python', PY_FUNDAMENTALS),
+    'javascript': LanguageContext('javascript', JS_FUNDAMENTALS),
+}
+
+
 class GIExtension(BaseExtension):
     extension_name = "gi-extension"
     argument_prefix = "gi"
     smart_index = False
     languages = None
+    lazy_includes = False
+    jobs = 1
+    parallel_languages = False
+    watch = False
+    index_server = None
+    typelibs = False
+    symbols_from_gir = False
 
     def __init__(self, doc_repo):
         BaseExtension.__init__(self, doc_repo)
 
-        self.language = 'c'
-
-        self.__nsmap = {'core': 'http://www.gtk.org/introspection/core/1.0',
-                      'c': 'http://www.gtk.org/introspection/c/1.0',
-                      'glib': 'http://www.gtk.org/introspection/glib/1.0'}
+        # Holds the bound LanguageContext, if any. hotdoc emits the link
+        # and symbol signals without it, so it can't be passed along; only
+        # the thread which bound it sees it, see language_context
+        self.__local = threading.local()
 
         self.__parsed_girs = set()
-        self.__node_cache = {}
-
-        # If generating the index ourselves, we will filter these functions
-        # out.
-        self.__get_type_functions = set({})
-        # We need to collect all class nodes and build the
-        # hierarchy beforehand, because git class nodes do not
-        # know about their children
-        self.__class_nodes = {}
+        self.__gir_cache = GirCache(os.path.join(
+            doc_repo.get_private_folder(), 'gi-extension', 'girs'))
+        self.__shared_gir_cache = self.__make_shared_gir_cache()
+        self.__gir_repo = GirRepository(self.__load_gir_index)
+
+        # Parsing gtk-doc books is independent from indexing girs, it
+        # is started along with it, see __index_girs, and only waited
+        # for when a link needs it
+        self.__gtkdoc_hrefs = GtkDocLinkIndex(
+            os.path.join(doc_repo.datadir, 'gtk-doc', 'html'),
+            self.__get_shared_cache_folder())
 
         # Only used to reduce debug verbosity
         self.__dropped_symbols = set({})
 
-        self.__smart_filters = set()
-
-        for gir_file in GIExtension.sources:
-            gir_root = etree.parse(gir_file).getroot()
-            self.__cache_nodes(gir_root)
+        # The gir files indexed anew in this run, whose nodes may differ
+        # from those the symbols of the previous run were built from
+        self.__reindexed_girs = set()
+        # gir file -> its loaded index, to replace it when it changes
+        self.__gir_indexes = {}
+        self.__watching = False
 
-        self.__gir_hierarchies = {}
-        self.__gir_children_map = defaultdict(dict)
-        self.__create_hierarchies()
+        self.__load_girs(GIExtension.sources)
 
-        self.__c_names = {}
-        self.__python_names = {}
-        self.__javascript_names = {}
+        # We need to build the hierarchy beforehand, because
+        # gir class nodes do not know about their children
+        self.__gir_hierarchy = GirHierarchy(self.__gir_repo)
+        self.__gir_hierarchy.build()
 
         self.__annotation_parser = GIAnnotationParser()
 
+        # symbol name -> digest of the gir nodes it was built from, as
+        # of the last time its page was resolved, and gir file -> its
+        # gir_cache stamp as of then
+        self.__gir_deps_path = os.path.join(doc_repo.get_private_folder(),
+                                            'gi-extension', 'gir-deps.p')
+        self.__gir_deps, self.__gir_stamps = self.__load_gir_deps()
+
         self.formatters["html"] = GIHtmlFormatter(self,
                 self.doc_repo.link_resolver)
 
-        self.__translated_names = {}
-        self.__gtkdoc_hrefs = {}
 
-        self._fundamentals = {}
+        # language -> (process, queue of the pages it has to format)
+        self.__format_workers = {}
+        # In format workers, the database session of the parent
+        self.__inherited_session = None
+
+        # (language, link id) -> what links to that id resolve to. They
+        # only depend on the gir nodes and the gtk-doc links, not on the
+        # symbols, so this is cleared when the gir files are reloaded
+        self.__link_resolutions = {}
+        self.__link_resolution_hits = 0
+        self.__link_resolution_misses = 0
 
         self.__gen_index_path = None
 
+        # header -> (gir declarations, scan) of the headers whose symbols
+        # are created from the gir files rather than by the C extension
+        self.__gir_headers = OrderedDict()
+
         if GIExtension.sources:
             from hotdoc_c_extension.c_extension import ClangScanner
             c_extension = doc_repo.extensions.get('c-extension')
             c_extension.scanner.set_extension(self)
+            if GIExtension.symbols_from_gir:
+                self.__take_gir_headers()
 
         self.__maybe_generate_index()
 
@@ -203,6 +343,38 @@ class GIExtension(BaseExtension):
                 nargs='*',
                 help="Languages to translate documentation in (c, python,"
                      "javascript), default is to make all languages")
+        group.add_argument ("--gi-lazy-includes", action="store_true",
+                dest="gi_lazy_includes",
+                help="Only load included gir files when a symbol is "
+                     "looked up in them")
+        group.add_argument ("--gi-jobs", action="store", type=int,
+                dest="gi_jobs",
+                help="Number of processes to parse gir files with, "
+                     "default is the number of CPUs")
+        group.add_argument ("--gi-parallel-languages", action="store_true",
+                dest="gi_parallel_languages",
+                help="Format the pages of each language other than the "
+                     "first one in a separate process")
+        group.add_argument ("--gi-watch", action="store_true",
+                dest="gi_watch",
+                help="Once the documentation is built, keep the gir "
+                     "indexes in memory, and update the pages of the "
+                     "symbols whose gir nodes change")
+        group.add_argument ("--gi-index-server", action="store",
+                dest="gi_index_server",
+                help="Socket of the gir index server to look gir nodes "
+                     "up from, when it is running, default is %s" %
+                     get_default_socket_path())
+        group.add_argument ("--gi-typelibs", action="store_true",
+                dest="gi_typelibs",
+                help="Index included gir files from their typelibs when "
+                     "they are installed, only reading the gir files "
+                     "for what typelibs leave out")
+        group.add_argument ("--gi-symbols-from-gir", action="store_true",
+                dest="gi_symbols_from_gir",
+                help="Create the C symbols of the headers the gir files "
+                     "describe completely from the gir files, only "
+                     "parsing the other headers with clang")
 
     @staticmethod
     def parse_config(doc_repo, config):
@@ -215,6 +387,16 @@ class GIExtension(BaseExtension):
             GIExtension.languages.insert (0, 'c')
         if not GIExtension.languages:
             GIExtension.languages = ['c', 'python', 'javascript']
+        GIExtension.lazy_includes = bool(config.get('gi_lazy_includes'))
+        GIExtension.jobs = int(config.get('gi_jobs') or
+                               multiprocessing.cpu_count())
+        GIExtension.parallel_languages = bool(
+            config.get('gi_parallel_languages'))
+        GIExtension.watch = bool(config.get('gi_watch'))
+        GIExtension.index_server = config.get('gi_index_server') or \
+            get_default_socket_path()
+        GIExtension.typelibs = bool(config.get('gi_typelibs'))
+        GIExtension.symbols_from_gir = bool(config.get('gi_symbols_from_gir'))
 
     @staticmethod
     def get_dependencies ():
@@ -235,222 +417,446 @@ class GIExtension(BaseExtension):
         if not GIExtension.sources:
             return
 
-        self.info('Gathering legacy gtk-doc links')
-        self.__gather_gtk_doc_links()
         Page.resolving_symbol_signal.connect (self.__resolving_symbol)
+        DocTree.update_signal.connect(self.__update_doc_tree)
+
+        self.doc_repo.formatted_signal.connect(self.__report_link_resolutions)
+        self.doc_repo.formatted_signal.connect(self.__report_fragment_cache)
+        self.doc_repo.formatted_signal.connect(
+            self.__report_unknown_annotations)
+        self.doc_repo.formatted_signal.connect(self.__join_format_workers)
+        self.doc_repo.formatted_signal.connect(self.__store_gir_deps)
+        if GIExtension.watch:
+            # This only returns when interrupted, let everything else
+            # that happens once formatting is done happen first
+            self.doc_repo.formatted_signal.connect_after(self.__watch_girs)
+
+        # These only act while a language context is bound, that is
+        # while formatting the pages of this extension
+        Link.resolving_link_signal.connect(self.__translate_link_ref)
+        Link.resolving_title_signal.connect(self.__translate_link_title)
+        Formatter.formatting_symbol_signal.connect(self.__formatting_symbol)
+        # Whereas links to gtk-doc books are found whatever the page
+        LinkResolver.get_link_signal.connect(self.__search_legacy_links)
+
+        if self.__gir_headers:
+            self.__create_gir_symbols()
+
+    def get_language_context(self):
+        """The `LanguageContext` bound in the current thread, or `None`."""
+        return getattr(self.__local, 'context', None)
+
+    @contextmanager
+    def language_context(self, language):
+        """Binds the context of `language` in the current thread.
+
+        Contexts can be nested. This doesn't make formatting thread-safe,
+        the formatter and its caches are shared: pages are formatted in a
+        single thread, languages only run concurrently in format workers,
+        which are separate processes.
+        """
+        previous = self.get_language_context()
+        self.__local.context = LANGUAGE_CONTEXTS[language]
+        try:
+            yield self.__local.context
+        finally:
+            self.__local.context = previous
+
+    @property
+    def language(self):
+        context = self.get_language_context()
+        return context.language if context else None
+
+    @property
+    def _fundamentals(self):
+        context = self.get_language_context()
+        return context.fundamentals if context else {}
 
     def format_page(self, page, link_resolver, output):
-        LinkResolver.get_link_signal.connect(self.__search_legacy_links)
-        Formatter.formatting_symbol_signal.connect(self.__formatting_symbol)
-        formatter = self.get_formatter('html')
-        for l in self.languages:
-            self.setup_language (l)
+        languages = self.languages
+        if GIExtension.parallel_languages and len(languages) > 1:
+            if not self.__format_workers:
+                self.__start_format_workers(languages[1:], link_resolver,
+                        output)
+            for _, queue in self.__format_workers.values():
+                queue.put(id(page))
+            languages = languages[:1]
+
+        for l in languages:
+            self.__format_page_in_language(page, l, link_resolver, output)
+
+    def __format_page_in_language(self, page, language, link_resolver,
+            output):
+        with self.language_context(language) as context:
+            if language != 'c' and self.__is_empty_in_bindings(context, page):
+                self.debug('Not formatting %s in %s, nothing is introspectable'
+                        % (page.source_file, language))
+                # Links to the page lead to its C documentation instead
+                if page.is_stale:
+                    self.get_formatter('html').write_stub_page(page, output)
+                return
             BaseExtension.format_page (self, page, link_resolver, output)
 
-        self.setup_language(None)
+    # Workers are forked before the first page gets formatted, they
+    # inherit the resolved doc tree and only receive the ids of the
+    # pages to format, which are the same in the forked copy of the
+    # tree, then write the output of their language on their own.
+    def __start_format_workers(self, languages, link_resolver, output):
+        self.info('Formatting %s in separate processes' %
+                ', '.join(languages))
+        # Don't fork while links are being gathered in a thread
+        self.__gtkdoc_hrefs.wait()
+        for language in languages:
+            queue = multiprocessing.Queue()
+            worker = multiprocessing.Process(target=self.__format_worker,
+                    args=(language, queue, link_resolver, output))
+            worker.daemon = True
+            worker.start()
+            self.__format_workers[language] = (worker, queue)
+
+    def __format_worker(self, language, queue, link_resolver, output):
+        # The session, engine and sqlite connection of the database are
+        # the parent's, which has pending changes: disposing of them
+        # would roll these back. They are kept alive, workers exit
+        # without cleaning up, and the database is opened anew, symbols
+        # which aren't already loaded are read from a fresh connection.
+        doc_db = self.doc_repo.doc_database
+        self.__inherited_session = doc_db.get_session()
+        doc_db.setup(self.doc_repo.get_private_folder())
+
+        pages = {id(page): page for page in
+                self.doc_repo.doc_tree.get_pages().values()}
+        while True:
+            page_id = queue.get()
+            if page_id is None:
+                break
+            self.__format_page_in_language(pages[page_id], language,
+                    link_resolver, output)
 
-        LinkResolver.get_link_signal.disconnect(self.__search_legacy_links)
-        Formatter.formatting_symbol_signal.disconnect(self.__formatting_symbol)
+    def __join_format_workers(self, doc_repo):
+        for _, queue in self.__format_workers.values():
+            queue.put(None)
+
+        for language, (worker, _) in self.__format_workers.items():
+            worker.join()
+            if worker.exitcode != 0:
+                error('format-worker-failed',
+                      'Formatting pages in %s failed (exit code %d)' %
+                      (language, worker.exitcode))
+
+        self.__format_workers = {}
+
+    def __is_empty_in_bindings(self, context, page):
+        # Generated pages only document their symbols
+        if not page.generated or not page.symbols:
+            return False
+
+        for symbol in page.symbols:
+            if symbol is not None and \
+                    self.__is_introspectable(context, symbol.unique_name):
+                return False
+
+        return True
 
     def __maybe_generate_index(self):
         if not GIExtension.sources:
             return
 
+    def __get_system_gir_dirs(self):
+        xdg_dirs = os.getenv('XDG_DATA_DIRS') or ''
+        xdg_dirs = [p for p in xdg_dirs.split(':') if p]
+        xdg_dirs.append(self.doc_repo.datadir)
+        return [os.path.join(dir_, 'gir-1.0') for dir_ in xdg_dirs]
+
     def __find_gir_file(self, gir_name):
         for source in self.sources:
             if os.path.basename(source) == gir_name:
                 return source
 
-        xdg_dirs = os.getenv('XDG_DATA_DIRS') or ''
-        xdg_dirs = [p for p in xdg_dirs.split(':') if p]
-        xdg_dirs.append(self.doc_repo.datadir)
-        for dir_ in xdg_dirs:
-            gir_file = os.path.join(dir_, 'gir-1.0', gir_name)
+        for dir_ in self.__get_system_gir_dirs():
+            gir_file = os.path.join(dir_, gir_name)
             if os.path.exists(gir_file):
                 return gir_file
         return None
 
-    def __generate_smart_filters(self, id_prefixes, sym_prefixes, node):
-        sym_prefix = node.attrib['{%s}symbol-prefix' % self.__nsmap['c']]
-        self.__smart_filters.add(('%s_IS_%s' % (sym_prefixes, sym_prefix)).upper())
-        self.__smart_filters.add(('%s_TYPE_%s' % (sym_prefixes, sym_prefix)).upper())
-        self.__smart_filters.add(('%s_%s' % (sym_prefixes, sym_prefix)).upper())
-        self.__smart_filters.add(('%s_%s_CLASS' % (sym_prefixes, sym_prefix)).upper())
-        self.__smart_filters.add(('%s_IS_%s_CLASS' % (sym_prefixes, sym_prefix)).upper())
-        self.__smart_filters.add(('%s_%s_GET_CLASS' % (sym_prefixes, sym_prefix)).upper())
-        self.__smart_filters.add(('%s_%s_GET_IFACE' % (sym_prefixes, sym_prefix)).upper())
-
-    def __cache_nodes(self, gir_root):
-        ns_node = gir_root.find('./{%s}namespace' % self.__nsmap['core'])
-        id_prefixes = ns_node.attrib['{%s}identifier-prefixes' % self.__nsmap['c']]
-        sym_prefixes = ns_node.attrib['{%s}symbol-prefixes' % self.__nsmap['c']]
-
-        id_key = '{%s}identifier' % self.__nsmap['c']
-        for node in gir_root.xpath(
-                './/*[@c:identifier]',
-                namespaces=self.__nsmap):
-            self.__node_cache[node.attrib[id_key]] = node
-
-        id_type = '{%s}type' % self.__nsmap['c']
-        class_tag = '{%s}class' % self.__nsmap['core']
-        interface_tag = '{%s}interface' % self.__nsmap['core']
-        for node in gir_root.xpath(
-                './/*[not(self::core:type) and not (self::core:array)][@c:type]',
-                namespaces=self.__nsmap):
-            name = node.attrib[id_type]
-            self.__node_cache[name] = node
-            if node.tag in [class_tag, interface_tag]:
-                gi_name = '.'.join(self.__get_gi_name_components(node))
-                self.__class_nodes[gi_name] = node
-                get_type_function = node.attrib.get('{%s}get-type' %
-                    self.__nsmap['glib'])
-                self.__get_type_functions.add(get_type_function)
-                self.__node_cache['%s::%s' % (name, name)] = node
-                self.__generate_smart_filters(id_prefixes, sym_prefixes, node)
-
-        for node in gir_root.xpath(
-                './/core:property',
-                namespaces=self.__nsmap):
-            name = '%s:%s' % (self.__get_klass_name(node.getparent()),
-                              node.attrib['name'])
-            self.__node_cache[name] = node
-
-        for node in gir_root.xpath(
-                './/glib:signal',
-                namespaces=self.__nsmap):
-            name = '%s::%s' % (self.__get_klass_name(node.getparent()),
-                               node.attrib['name'])
-            self.__node_cache[name] = node
-
-        for node in gir_root.xpath(
-                './/core:virtual-method',
-                namespaces=self.__nsmap):
-            name = '%s:::%s' % (self.__get_klass_name(node.getparent()),
-                                node.attrib['name'])
-            self.__node_cache[name] = node
-
-        for inc in gir_root.findall('./core:include',
-                namespaces = self.__nsmap):
-            inc_name = inc.attrib["name"]
-            inc_version = inc.attrib["version"]
-            gir_file = self.__find_gir_file('%s-%s.gir' % (inc_name,
+    def __make_shared_gir_cache(self):
+        cache_home = os.getenv('XDG_CACHE_HOME') or os.path.join(
+            os.path.expanduser('~'), '.cache')
+        try:
+            return SharedGirCache(os.path.join(cache_home, 'hotdoc',
+                                               'gi-extension'))
+        except OSError as exc:
+            self.debug('Not sharing system gir indexes: %s' % exc)
+            return None
+
+    def __get_shared_cache_folder(self):
+        # What is installed on the system is cached along with the girs
+        if self.__shared_gir_cache is not None:
+            return self.__shared_gir_cache.folder
+        return self.__gir_cache.folder
+
+    def __get_gir_cache(self, gir_file):
+        # The girs installed on the system are the same for every
+        # project, their indexes are shared through the user cache
+        if self.__shared_gir_cache is not None and \
+                gir_file not in self.sources:
+            gir_dir = os.path.realpath(os.path.dirname(gir_file))
+            for dir_ in self.__get_system_gir_dirs():
+                if os.path.realpath(dir_) == gir_dir:
+                    return self.__shared_gir_cache
+        return self.__gir_cache
+
+    def __store_gir_index(self, gir_file, gir_index):
+        try:
+            self.__get_gir_cache(gir_file).store(gir_file, gir_index)
+        except (OSError, IOError) as exc:
+            self.debug("Couldn't cache the index of %s: %s" % (gir_file,
+                                                                exc))
+
+    def __index_typelib(self, gir_file):
+        # Partial indexes are only loaded again to be completed
+        if not GIExtension.typelibs or gir_file in self.sources or \
+                isinstance(self.__gir_indexes.get(gir_file),
+                           PartialGirIndex):
+            return None
+
+        gir_index = index_gir_typelib(gir_file)
+        if gir_index is not None:
+            self.debug('Indexed %s from its typelib' % gir_file)
+        return gir_index
+
+    def __load_gir_index(self, gir_file):
+        gir_index = self.__get_gir_cache(gir_file).load(gir_file)
+        if gir_index is not None:
+            self.debug('Loaded cached index for %s' % gir_file)
+        else:
+            # Only complete indexes are cached
+            gir_index = self.__index_typelib(gir_file)
+            if gir_index is None:
+                self.debug('Indexing %s' % gir_file)
+                gir_index = index_gir(gir_file)
+                self.__store_gir_index(gir_file, gir_index)
+            self.__reindexed_girs.add(gir_file)
+
+        self.__gir_indexes[gir_file] = gir_index
+        return gir_index
+
+    def __collect_girs(self, gir_file, girs, is_include, headers_only):
+        header = None
+        if not ((is_include and GIExtension.lazy_includes) or headers_only):
+            header = self.__get_gir_cache(gir_file).load(gir_file)
+        if header is None:
+            header = read_gir_header(gir_file)
+
+        girs.append((gir_file, header, is_include))
+
+        for inc_name, inc_version in header.includes:
+            inc_file = self.__find_gir_file('%s-%s.gir' % (inc_name,
                 inc_version))
-            if not gir_file:
+            if not inc_file:
                 warn('missing-gir-include', "Couldn't find a gir for %s-%s.gir" %
                         (inc_name, inc_version))
                 continue
 
-            if gir_file in self.__parsed_girs:
+            if inc_file in self.__parsed_girs:
                 continue
 
-            self.__parsed_girs.add(gir_file)
-            inc_gir_root = etree.parse(gir_file).getroot()
-            self.__cache_nodes(inc_gir_root)
-
-    def __create_hierarchies(self):
-        for gi_name, klass in self.__class_nodes.iteritems():
-            hierarchy = self.__create_hierarchy (klass)
-            self.__gir_hierarchies[gi_name] = hierarchy
-
-    def __get_klass_name(self, klass):
-        klass_name = klass.attrib.get('{%s}type' % self.__nsmap['c'])
-        if not klass_name:
-            klass_name = klass.attrib.get('{%s}type-name' % self.__nsmap['glib'])
-        return klass_name
-
-    def __create_hierarchy (self, klass):
-        klaass = klass
-        hierarchy = []
-        while (True):
-            parent_name = klass.attrib.get('parent')
-            if not parent_name:
-                break
+            self.__parsed_girs.add(inc_file)
+            self.__collect_girs(inc_file, girs, True, headers_only)
 
-            if not '.' in parent_name:
-                namespace = klass.getparent().attrib['name']
-                parent_name = '%s.%s' % (namespace, parent_name)
-            parent_class = self.__class_nodes[parent_name]
-            children = self.__gir_children_map[parent_name]
-            klass_name = self.__get_klass_name (klass)
+    def __start_gathering_links(self):
+        if GIExtension.sources:
+            self.__gtkdoc_hrefs.start(GIExtension.jobs)
+
+    def __index_girs(self, gir_files):
+        # Typelibs are read much faster than gir files are parsed, there
+        # is nothing to gain from reading them in parallel
+        partial_indexes = {}
+        for gir_file in gir_files:
+            gir_index = self.__index_typelib(gir_file)
+            if gir_index is not None:
+                partial_indexes[gir_file] = gir_index
+        self.__reindexed_girs.update(partial_indexes)
+        gir_files = [gir_file for gir_file in gir_files
+                     if gir_file not in partial_indexes]
+
+        if GIExtension.jobs > 1 and len(gir_files) > 1:
+            self.info('Indexing %d gir files with %d processes' %
+                    (len(gir_files), min(GIExtension.jobs, len(gir_files))))
+            pool = multiprocessing.Pool(min(GIExtension.jobs, len(gir_files)))
+            # Only start threads once the pool is forked
+            self.__start_gathering_links()
+            try:
+                gir_indexes = pool.map(index_gir, gir_files)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            self.__start_gathering_links()
+            gir_indexes = [index_gir(gir_file) for gir_file in gir_files]
 
-            if not klass_name in children:
-                link = Link(None, klass_name, klass_name)
-                sym = QualifiedSymbol(type_tokens=[link])
-                children[klass_name] = sym
+        self.__reindexed_girs.update(gir_files)
+        for gir_file, gir_index in zip(gir_files, gir_indexes):
+            self.__store_gir_index(gir_file, gir_index)
 
-            klass_name = self.__get_klass_name(parent_class)
-            link = Link(None, klass_name, klass_name)
-            sym = QualifiedSymbol(type_tokens=[link])
-            hierarchy.append (sym)
+        res = dict(zip(gir_files, gir_indexes))
+        res.update(partial_indexes)
+        return res
 
-            klass = parent_class
+    def __connect_index_server(self):
+        # Watching needs the indexes in this process
+        if not GIExtension.sources or GIExtension.watch:
+            return None
 
-        hierarchy.reverse()
-        return hierarchy
+        try:
+            client = GirIndexClient(GIExtension.index_server)
+        except (socket.error, OSError) as exc:
+            self.debug('Not using the gir index server at %s: %s' %
+                       (GIExtension.index_server, exc))
+            return None
 
-    def __gather_gtk_doc_links (self):
-        gtkdoc_dir = os.path.join(self.doc_repo.datadir, "gtk-doc", "html")
-        if not os.path.exists(gtkdoc_dir):
-            print "no gtk doc to gather links from in %s" % gtkdoc_dir
-            return
+        self.info('Looking gir nodes up from the server at %s' %
+                  GIExtension.index_server)
+        return client
 
-        for node in os.listdir(gtkdoc_dir):
-            dir_ = os.path.join(gtkdoc_dir, node)
-            if os.path.isdir(dir_):
-                if not self.__parse_devhelp_index(dir_):
-                    try:
-                        self.__parse_sgml_index(dir_)
-                    except IOError:
-                        pass
-
-    def __parse_devhelp_index(self, dir_):
-        path = os.path.join(dir_, os.path.basename(dir_) + '.devhelp2')
-        if not os.path.exists(path):
-            return False
+    def __use_index_server(self, client, girs):
+        link_index = self.__gtkdoc_hrefs
 
-        dh_root = etree.parse(path).getroot()
-        online = dh_root.attrib.get('online')
-        if not online:
-            return False
+        # Should the server go away, look things up in this process
+        def _make_repo(exc):
+            self.info('Lost the gir index server, indexing here: %s' % exc)
+            return make_gir_repository(girs, self.__load_gir_index)
 
-        keywords = dh_root.findall('.//{http://www.devhelp.net/book}keyword')
-        for kw in keywords:
-            self.__gtkdoc_hrefs[kw.attrib["name"]] = online + kw.attrib["link"]
+        def _make_link_index(exc):
+            # pylint: disable=unused-argument
+            return link_index
 
-        self.debug('Gathered %d links from devhelp index %s' % (len(keywords), path)) 
+        gir_repo = RemoteGirRepository(client, girs, _make_repo)
+        self.__gtkdoc_hrefs = RemoteLinkIndex(
+            client, link_index.gtkdoc_dir, _make_link_index)
+        self.__gir_repo = gir_repo
+        # We can't tell which girs the server indexed again
+        self.__reindexed_girs.update(gir_file for gir_file, _ in girs)
 
-        return True
+    def __load_girs(self, sources):
+        client = self.__connect_index_server()
+
+        # First find out the whole include graph from the headers, so
+        # that the girs which aren't cached can be indexed in parallel
+        girs = []
+        for gir_file in sources:
+            if gir_file in self.__parsed_girs:
+                continue
+            self.__parsed_girs.add(gir_file)
+            self.__collect_girs(gir_file, girs, False, client is not None)
 
-    def __parse_sgml_index(self, dir_):
-        remote_prefix = ""
-        n_links = 0
-        path = os.path.join(dir_, "index.sgml")
-        with open(path, 'r') as f:
-            for l in f:
-                if l.startswith("<ONLINE"):
-                    remote_prefix = l.split('"')[1]
-                elif not remote_prefix:
-                    break
-                elif l.startswith("<ANCHOR"):
-                    split_line = l.split('"')
-                    filename = split_line[3].split('/', 1)[-1]
-                    title = split_line[1].replace('-', '_')
-
-                    if title.endswith (":CAPS"):
-                        title = title [:-5]
-                    if remote_prefix:
-                        href = '%s/%s' % (remote_prefix, filename)
-                    else:
-                        href = filename
-
-                    self.__gtkdoc_hrefs[title] = href
-                    n_links += 1
-
-        if n_links > 0:
-            self.debug('Gathered %d links from sgml index %s' % (n_links, path)) 
-
-    def __add_annotations (self, formatter, symbol):
-        if self.language == 'c':
+        lazy = GIExtension.lazy_includes
+
+        # The server owns the indexes, we only tell it which girs we use
+        if client is not None:
+            try:
+                self.__use_index_server(client, [
+                    (gir_file, is_include and lazy)
+                    for gir_file, _, is_include in girs])
+                return
+            except (socket.error, EOFError) as exc:
+                self.info('Lost the gir index server, indexing here: %s' %
+                          exc)
+
+        to_index = [gir_file for gir_file, header, is_include in girs
+                    if not isinstance(header, GirIndex) and
+                    not (is_include and lazy)]
+        gir_indexes = self.__index_girs(to_index)
+
+        # Then merge them in the order they were found in, as later
+        # girs may override the nodes of earlier ones
+        for gir_file, header, is_include in girs:
+            if isinstance(header, GirIndex):
+                self.__gir_indexes[gir_file] = header
+                self.__gir_repo.add(header)
+            elif gir_file in gir_indexes:
+                self.__gir_indexes[gir_file] = gir_indexes[gir_file]
+                self.__gir_repo.add(gir_indexes[gir_file])
+            else:
+                self.__gir_repo.register(gir_file, header)
+
+    def __get_gir_header(self, header, gir_declarations, known_names):
+        for declarations in gir_declarations:
+            filename = match_header(header, declarations.gir_file,
+                                    declarations.headers)
+            if filename is not None:
+                break
+        else:
+            self.debug('No gir file describes %s' % header)
+            return None
+
+        if get_mtime(header) > get_mtime(declarations.gir_file):
+            self.debug('%s is newer than %s' % (header,
+                                                declarations.gir_file))
+            return None
+
+        try:
+            scan = scan_header(header)
+        except IOError as exc:
+            self.debug("Couldn't scan %s: %s" % (header, exc))
+            return None
+
+        if scan.unclassified:
+            lineno, description = scan.unclassified[0]
+            self.debug("Couldn't tell what %s:%d declares: %s" % (
+                header, lineno, description))
+            return None
+
+        unknown = sorted(name for name in scan.names
+                         if name not in known_names)
+        if unknown:
+            self.debug('The gir files do not describe %s from %s' % (
+                ', '.join(unknown), header))
+            return None
+
+        self.info('Creating the symbols of %s from %s' % (
+            header, declarations.gir_file))
+        return declarations.headers[filename], scan
+
+    def __take_gir_headers(self):
+        from hotdoc_c_extension.c_extension import CExtension
+
+        gir_declarations = [index_declarations(gir_file)
+                            for gir_file in GIExtension.sources]
+        known_names = set()
+        for declarations in gir_declarations:
+            known_names |= declarations.names
+        # The C extension would create these for nothing
+        if GIExtension.smart_index:
+            known_names |= self.__gir_repo.smart_filters
+            known_names |= self.__gir_repo.get_type_functions
+
+        headers = [s for s in CExtension.sources if s.endswith('.h')]
+        for header in headers:
+            gir_header = self.__get_gir_header(header, gir_declarations,
+                                               known_names)
+            if gir_header is not None:
+                self.__gir_headers[header] = gir_header
+
+        # The headers stay listed, so that the C extension doesn't take
+        # them for removed and drop their symbols and pages, but it only
+        # scans the headers which changed since the previous run: mark
+        # these up to date, and the headers which were taken from the
+        # gir files in the previous run but aren't anymore as changed.
+        tracker = self.doc_repo.change_tracker
+        c_mtimes = tracker.mtimes['c-extension']
+        previous = tracker.mtimes[self.extension_name]
+        for header in headers:
+            if header in self.__gir_headers:
+                c_mtimes[header] = get_mtime(header)
+            elif header in previous:
+                c_mtimes.pop(header, None)
+
+        self.info('Creating the symbols of %d of %d headers from gir files' %
+                  (len(self.__gir_headers), len(headers)))
+
+    def __add_annotations (self, context, formatter, symbol):
+        if context.language == 'c':
             annotations = self.__annotation_parser.make_annotations(symbol)
 
             # FIXME: OK this is format time but still seems strange
@@ -459,116 +865,143 @@ class GIExtension(BaseExtension):
         else:
             symbol.extension_contents.pop('Annotations', None)
 
-    def __is_introspectable(self, name):
-        if name in self._fundamentals:
-            return True
+    def __add_flags (self, formatter, symbol):
+        mask = symbol.get_extension_attribute('gi-extension', 'flags')
+        if mask is None:
+            return
 
-        node = self.__node_cache.get(name)
+        symbol.extension_contents['Flags'] = formatter._format_flags (
+                make_flags(mask))
 
-        if node is None:
-            return False
+    def __is_introspectable(self, context, name):
+        if name in context.fundamentals:
+            return True
 
-        if not name in self.__c_names:
-            self.__add_translations(name, node)
-
-        if node.attrib.get('introspectable') == '0':
-            return False
-        return True
+        return self.__gir_repo.is_introspectable(name)
 
     def __formatting_symbol(self, formatter, symbol):
-        symbol.language = self.language
+        context = self.get_language_context()
+        if context is None:
+            return None
+
+        symbol.language = context.language
 
         if type(symbol) in [ReturnItemSymbol, ParameterSymbol]:
-            self.__add_annotations (formatter, symbol)
+            self.__add_annotations (context, formatter, symbol)
+        elif type(symbol) in [SignalSymbol, PropertySymbol]:
+            self.__add_flags (formatter, symbol)
 
         if isinstance (symbol, QualifiedSymbol):
             return True
 
         # We discard symbols at formatting time because they might be exposed
         # in other languages
-        if self.language != 'c':
-            return self.__is_introspectable(symbol.unique_name)
+        if context.language != 'c':
+            return self.__is_introspectable(context, symbol.unique_name)
 
         return True
 
+    def __get_link_resolution(self, context, id_):
+        language = context.language
+        key = (language, id_)
+        resolution = self.__link_resolutions.get(key)
+        if resolution is not None:
+            self.__link_resolution_hits += 1
+            return resolution
+
+        self.__link_resolution_misses += 1
+        introspectable = language == 'c' or \
+                self.__is_introspectable(context, id_)
+        resolution = (context.fundamentals.get(id_), introspectable,
+                self.__gir_repo.translate(id_, language),
+                self.__gtkdoc_hrefs.get(id_))
+        self.__link_resolutions[key] = resolution
+        return resolution
+
+    def __report_link_resolutions(self, doc_repo):
+        lookups = self.__link_resolution_hits + self.__link_resolution_misses
+        if lookups:
+            self.info('Resolved %d links, %d from cache (%.1f%%)' % (lookups,
+                self.__link_resolution_hits,
+                100.0 * self.__link_resolution_hits / lookups))
+
+    def __report_fragment_cache(self, doc_repo):
+        formatter = self.get_formatter(doc_repo.output_format)
+        cache = getattr(formatter, 'fragment_cache', None)
+        if cache is None:
+            return
+
+        lookups = cache.hits + cache.misses
+        if lookups:
+            self.info('Formatted flags and annotations %d times, %d from '
+                      'cache (%.1f%%)' % (lookups, cache.hits,
+                          100.0 * cache.hits / lookups))
+
+    def __report_unknown_annotations(self, doc_repo):
+        unknown = self.__annotation_parser.unknown_annotations
+        for name in sorted(unknown):
+            arguments = ', '.join(sorted(repr(argument) for argument in
+                                         unknown[name]))
+            self.info('Unknown parameter annotation [%s], seen with %s' %
+                      (name, arguments))
+
     def __translate_link_ref(self, link):
-        fund = self._fundamentals.get(link.id_)
+        context = self.get_language_context()
+        if context is None:
+            return None
+
+        if context.language is None:
+            return make_link_slot('R', link.id_)
+
+        fund, introspectable, _, gtkdoc_href = \
+                self.__get_link_resolution(context, link.id_)
         if fund:
             return fund.ref
 
-        if link.ref and self.language != 'c' and not self.__is_introspectable(link.id_):
+        # Links to gtk-doc books are the same in every language
+        if gtkdoc_href is not None and link.ref == gtkdoc_href:
+            return None
+
+        if link.ref and not introspectable:
             return '../c/' + link.ref
 
         if link.ref == None:
-            return self.__gtkdoc_hrefs.get(link.id_)
+            return gtkdoc_href
 
         return None
 
     def __search_legacy_links(self, resolver, name):
+        # gtk-doc hrefs don't depend on the language, and comments are
+        # rendered without one
         href = self.__gtkdoc_hrefs.get(name)
         if href:
             return Link(href, name, name)
         return None
 
     def __translate_link_title(self, link):
-        fund = self._fundamentals.get(link.id_)
+        context = self.get_language_context()
+        if context is None:
+            return None
+
+        if context.language is None:
+            return make_link_slot('T', link.id_)
+
+        fund, introspectable, translated, gtkdoc_href = \
+                self.__get_link_resolution(context, link.id_)
         if fund:
             return fund._title
 
-        if self.language != 'c' and not self.__is_introspectable(link.id_):
+        if not introspectable:
             return link._title + ' (not introspectable)'
 
-        translated = self.__translated_names.get(link.id_)
         if translated:
             return translated
 
-        if self.language == 'c' and link.id_ in self.__gtkdoc_hrefs:
+        if context.language == 'c' and gtkdoc_href is not None:
             return link.id_
 
         return None
 
-    def setup_language (self, language):
-        self.language = language
-
-        try:
-            Link.resolving_link_signal.disconnect(self.__translate_link_ref)
-        except KeyError:
-            pass
-
-        try:
-            Link.resolving_title_signal.disconnect(self.__translate_link_title)
-        except KeyError:
-            pass
-
-        """
-        try:
-            self.doc_repo.doc_tree.page_parser.renaming_page_link_signal.disconnect(
-                    self.__rename_page_link)
-        except KeyError:
-            pass
-        """
-
-        if language is not None:
-            Link.resolving_link_signal.connect(self.__translate_link_ref)
-            Link.resolving_title_signal.connect(self.__translate_link_title)
-            """
-            self.doc_repo.doc_tree.page_parser.renaming_page_link_signal.connect(
-                    self.__rename_page_link)
-            """
-
-        if language == 'c':
-            self._fundamentals = {}
-            self.__translated_names = self.__c_names
-        elif language == 'python':
-            self._fundamentals = PY_FUNDAMENTALS
-            self.__translated_names = self.__python_names
-        elif language == 'javascript':
-            self._fundamentals = JS_FUNDAMENTALS
-            self.__translated_names = self.__javascript_names
-        else:
-            self._fundamentals = {}
-            self.__translated_names = {}
-
     def __smart_filter(self, *args, **kwargs):
         name = kwargs['display_name']
 
@@ -578,28 +1011,25 @@ class GIExtension(BaseExtension):
 
         type_ = args[0]
 
-        if name in self.__smart_filters:
+        if name in self.__gir_repo.smart_filters:
             self.debug('Dropping %s' % name)
             self.__dropped_symbols.add(name)
             return None
 
         # Drop get_type functions
-        if name in self.__get_type_functions:
+        if name in self.__gir_repo.get_type_functions:
             self.debug('Dropping get_type function %s' % name)
             self.__dropped_symbols.add(name)
             return None
 
         # Drop class structures if not documented as well
         if type_ == StructSymbol:
-            node = self.__node_cache.get(name)
-            if node is not None:
-                is_gtype_struct_for = node.attrib.get('{%s}is-gtype-struct-for' %
-                    self.__nsmap['glib'])
-                if is_gtype_struct_for:
+            node = self.__gir_repo.get_complete_node(name)
+            if isinstance(node, GirType):
+                if node.is_gtype_struct_for:
                     self.debug('Dropping class structure %s' % name)
                     return None
-                disguised = node.attrib.get('disguised')
-                if disguised == '1':
+                if node.disguised:
                     self.debug("Dropping private structure %s" % name)
                     self.__dropped_symbols.add(name)
                     return None
@@ -617,16 +1047,6 @@ class GIExtension(BaseExtension):
             return self.__smart_filter(*args, **kwargs)
         return super(GIExtension, self).get_or_create_symbol(*args, **kwargs)
 
-    def __unnest_type (self, parameter):
-        array_nesting = 0
-        array = parameter.find('{http://www.gtk.org/introspection/core/1.0}array')
-        while array is not None:
-            array_nesting += 1
-            parameter = array
-            array = parameter.find('{http://www.gtk.org/introspection/core/1.0}array')
-
-        return parameter, array_nesting
-
     def __type_tokens_from_cdecl (self, cdecl):
         indirection = cdecl.count ('*')
         qualified_type = cdecl.strip ('*')
@@ -643,20 +1063,120 @@ class GIExtension(BaseExtension):
 
         return tokens
 
+    def __create_declared_signature(self, decl):
+        parameters = []
+        for name, c_type in decl.parameters:
+            if c_type == '...':
+                parameters.append(ParameterSymbol(argname=name))
+            else:
+                parameters.append(ParameterSymbol(argname=name,
+                    type_tokens=self.__type_tokens_from_cdecl(c_type or '')))
+
+        if decl.return_type is None:
+            return_value = [None]
+        else:
+            return_value = [ReturnItemSymbol(
+                type_tokens=self.__type_tokens_from_cdecl(decl.return_type))]
+
+        return parameters, return_value
+
+    def __create_declared_members(self, decl, filename, scan):
+        if decl.kind == 'enum':
+            members = []
+            for name, value in decl.members:
+                member = self.get_or_create_symbol(Symbol, display_name=name,
+                        filename=filename, lineno=scan.names.get(name))
+                if member:
+                    member.enum_value = value
+                    members.append(member)
+            return members
+
+        if decl.opaque:
+            return []
+
+        members = []
+        for name, c_type, callback in decl.members:
+            if callback is not None:
+                members.append(FieldSymbol(member_name=name,
+                    is_function_pointer=True, type_tokens=[]))
+            else:
+                members.append(FieldSymbol(member_name=name,
+                    type_tokens=self.__type_tokens_from_cdecl(c_type or '')))
+        return members
+
+    def __create_declared_symbol(self, decl, filename, scan):
+        kwargs = {'display_name': decl.name, 'filename': filename,
+                  'lineno': decl.lineno or scan.names.get(decl.name)}
+        text = scan.texts.get(decl.name)
+
+        if decl.kind in ('function', 'callback'):
+            type_ = FunctionSymbol if decl.kind == 'function' else \
+                CallbackSymbol
+            parameters, return_value = self.__create_declared_signature(decl)
+            return self.get_or_create_symbol(type_, parameters=parameters,
+                    return_value=return_value, **kwargs)
+
+        if decl.kind in ('struct', 'union', 'enum'):
+            type_ = EnumSymbol if decl.kind == 'enum' else StructSymbol
+            if text is None:
+                text = 'typedef %s _%s %s;' % (decl.kind, decl.name,
+                                               decl.name)
+            return self.get_or_create_symbol(type_, raw_text=text,
+                    members=self.__create_declared_members(decl, filename,
+                                                           scan),
+                    anonymous=False, **kwargs)
+
+        if decl.kind == 'constant':
+            return self.get_or_create_symbol(ConstantSymbol,
+                    original_text=text or '#define %s %s' % (decl.name,
+                                                             decl.value),
+                    **kwargs)
+
+        if decl.kind == 'function-macro':
+            parameters = [ParameterSymbol(argname=name)
+                          for name, _ in decl.parameters]
+            if text is None:
+                text = '#define %s(%s)' % (decl.name, ', '.join(
+                    name for name, _ in decl.parameters))
+            return self.get_or_create_symbol(FunctionMacroSymbol,
+                    parameters=parameters, return_value=[None],
+                    original_text=text, **kwargs)
+
+        if decl.kind == 'alias':
+            aliased_type = QualifiedSymbol(
+                type_tokens=self.__type_tokens_from_cdecl(decl.c_type or ''))
+            return self.get_or_create_symbol(AliasSymbol,
+                    aliased_type=aliased_type, **kwargs)
+
+        return None
+
+    def __create_gir_symbols(self):
+        # Like the C extension, only look again at the headers which
+        # changed since the previous run
+        stale, _ = self.get_stale_files(list(self.__gir_headers))
+        parser = GtkDocParser(self.doc_repo)
+        doc_db = self.doc_repo.doc_database
+
+        for header in stale:
+            declarations, scan = self.__gir_headers[header]
+            for decl in declarations:
+                self.__create_declared_symbol(decl, header, scan)
+
+            for text, lineno, endlineno in scan.comments:
+                comment = parser.parse_comment(text, header, lineno,
+                        endlineno, self.doc_repo.include_paths)
+                if comment is not None:
+                    doc_db.add_comment(comment)
+
+        self.debug('Created the symbols of %d headers from gir files' %
+                   len(stale))
+
     def __get_gir_type (self, cur_ns, name):
         namespaced = '%s.%s' % (cur_ns, name)
-        klass = self.__class_nodes.get (namespaced)
+        klass = self.__gir_repo.get_class (namespaced)
         if klass is not None:
             return klass
-        return self.__class_nodes.get (name)
-
-    def __get_namespace(self, node):
-        parent = node.getparent()
-        nstag = '{%s}namespace' % self.__nsmap['core']
-        while parent is not None and parent.tag != nstag:
-            parent = parent.getparent()
-
-        return parent.attrib['name']
+        return self.__gir_repo.get_class (name)
 
     def __type_tokens_from_gitype (self, cur_ns, ptype_name):
         qs = None
@@ -666,8 +1186,7 @@ class GIExtension(BaseExtension):
 
         gitype = self.__get_gir_type (cur_ns, ptype_name)
         if gitype is not None:
-            c_type = gitype.attrib['{http://www.gtk.org/introspection/c/1.0}type']
-            ptype_name = c_type
+            ptype_name = gitype.c_type
 
         type_link = Link (None, ptype_name, ptype_name)
 
@@ -676,19 +1195,9 @@ class GIExtension(BaseExtension):
 
         return tokens
 
-    def __type_tokens_and_gi_name_from_gi_node (self, gi_node):
-        type_, array_nesting = self.__unnest_type (gi_node)
-
-        varargs = type_.find('{http://www.gtk.org/introspection/core/1.0}varargs')
-        if varargs is not None:
-            ctype_name = '...'
-            ptype_name = 'valist'
-        else:
-            ptype_ = type_.find('{http://www.gtk.org/introspection/core/1.0}type')
-            ctype_name = ptype_.attrib.get('{http://www.gtk.org/introspection/c/1.0}type')
-            ptype_name = ptype_.attrib.get('name')
-
-        cur_ns = self.__get_namespace(gi_node)
+    def __type_tokens_and_gi_name_from_gi_type (self, cur_ns, gi_type):
+        ctype_name = gi_type.c_type
+        ptype_name = gi_type.type_name
 
         if ctype_name is not None:
             type_tokens = self.__type_tokens_from_cdecl (ctype_name)
@@ -698,27 +1207,27 @@ class GIExtension(BaseExtension):
             type_tokens = []
 
         namespaced = '%s.%s' % (cur_ns, ptype_name)
-        if namespaced in self.__class_nodes:
+        if self.__gir_repo.get_class(namespaced) is not None:
             ptype_name = namespaced
         return type_tokens, ptype_name
 
-    def __create_parameter_symbol (self, gi_parameter):
-        param_name = gi_parameter.attrib['name']
+    def __create_parameter_symbol (self, cur_ns, gi_parameter):
+        param_name = gi_parameter.name
 
-        type_tokens, gi_name = self.__type_tokens_and_gi_name_from_gi_node (gi_parameter)
+        type_tokens, gi_name = self.__type_tokens_and_gi_name_from_gi_type (
+                cur_ns, gi_parameter)
 
         res = ParameterSymbol (argname=param_name, type_tokens=type_tokens)
         res.add_extension_attribute ('gi-extension', 'gi_name', gi_name)
 
-        direction = gi_parameter.attrib.get('direction')
-        if direction is None:
-            direction = 'in'
+        direction = gi_parameter.direction
         res.add_extension_attribute ('gi-extension', 'direction', direction)
 
         return res, direction
 
-    def __create_return_value_symbol (self, gi_retval, out_parameters):
-        type_tokens, gi_name = self.__type_tokens_and_gi_name_from_gi_node(gi_retval)
+    def __create_return_value_symbol (self, cur_ns, gi_retval, out_parameters):
+        type_tokens, gi_name = self.__type_tokens_and_gi_name_from_gi_type(
+                cur_ns, gi_retval)
 
         if gi_name == 'none':
             ret_item = None
@@ -736,31 +1245,24 @@ class GIExtension(BaseExtension):
         return res
 
     def __create_parameters_and_retval (self, node):
-        gi_parameters = node.find('{http://www.gtk.org/introspection/core/1.0}parameters')
-
-        if gi_parameters is None:
-            instance_param = None
-            gi_parameters = []
-        else:
-            instance_param = \
-            gi_parameters.find('{http://www.gtk.org/introspection/core/1.0}instance-parameter')
-            gi_parameters = gi_parameters.findall('{http://www.gtk.org/introspection/core/1.0}parameter')
-
+        cur_ns = node.namespace
         parameters = []
 
-        if instance_param is not None:
-            param, direction = self.__create_parameter_symbol (instance_param)
+        if node.instance_parameter is not None:
+            param, direction = self.__create_parameter_symbol (cur_ns,
+                    node.instance_parameter)
             parameters.append (param)
 
         out_parameters = []
-        for gi_parameter in gi_parameters:
-            param, direction = self.__create_parameter_symbol (gi_parameter)
+        for gi_parameter in node.parameters:
+            param, direction = self.__create_parameter_symbol (cur_ns,
+                    gi_parameter)
             parameters.append (param)
             if direction != 'in':
                 out_parameters.append (param)
 
-        retval = node.find('{http://www.gtk.org/introspection/core/1.0}return-value')
-        retval = self.__create_return_value_symbol (retval, out_parameters)
+        retval = self.__create_return_value_symbol (cur_ns, node.return_value,
+                out_parameters)
 
         return (parameters, retval)
 
@@ -783,7 +1285,7 @@ class GIExtension(BaseExtension):
                 'parameters', in_parameters)
 
     def __create_signal_symbol (self, node, object_name):
-        name = node.attrib['name']
+        name = node.name
         unique_name = '%s::%s' % (object_name, name)
 
         parameters, retval = self.__create_parameters_and_retval (node)
@@ -791,60 +1293,33 @@ class GIExtension(BaseExtension):
                 parameters=parameters, return_value=retval,
                 display_name=name, unique_name=unique_name)
 
-        flags = []
-
-        when = node.attrib.get('when')
-        if when == "first":
-            flags.append (RunFirstFlag())
-        elif when == "last":
-            flags.append (RunLastFlag())
-        elif when == "cleanup":
-            flags.append (RunCleanupFlag())
-
-        no_hooks = node.attrib.get('no-hooks')
-        if no_hooks == '1':
-            flags.append (NoHooksFlag())
-
-        # This is incorrect, it's not yet format time
-        extra_content = self.get_formatter(self.doc_repo.output_format)._format_flags (flags)
-        res.extension_contents['Flags'] = extra_content
+        res.add_extension_attribute ('gi-extension', 'flags',
+                get_signal_flags(node))
 
         self.__sort_parameters (res, retval, parameters)
 
         return res
 
     def __create_property_symbol (self, node, object_name):
-        name = node.attrib['name']
+        name = node.name
         unique_name = '%s:%s' % (object_name, name)
 
-        type_tokens, gi_name = self.__type_tokens_and_gi_name_from_gi_node(node)
+        type_tokens, gi_name = self.__type_tokens_and_gi_name_from_gi_type(
+                node.namespace, node.type_)
         type_ = QualifiedSymbol (type_tokens=type_tokens)
         type_.add_extension_attribute ('gi-extension', 'gi_name', gi_name)
 
-        flags = []
-        writable = node.attrib.get('writable')
-        construct = node.attrib.get('construct')
-        construct_only = node.attrib.get('construct-only')
-
-        flags.append (ReadableFlag())
-        if writable == '1':
-            flags.append (WritableFlag())
-        if construct_only == '1':
-            flags.append (ConstructOnlyFlag())
-        elif construct == '1':
-            flags.append (ConstructFlag())
-
         res = self.get_or_create_symbol(PropertySymbol,
                 prop_type=type_,
                 display_name=name, unique_name=unique_name)
 
-        extra_content = self.get_formatter(self.doc_repo.output_format)._format_flags (flags)
-        res.extension_contents['Flags'] = extra_content
+        res.add_extension_attribute ('gi-extension', 'flags',
+                get_property_flags(node))
 
         return res
 
     def __create_vfunc_symbol (self, node, object_name):
-        name = node.attrib['name']
+        name = node.name
         unique_name = '%s:::%s' % (object_name, name)
 
         parameters, retval = self.__create_parameters_and_retval (node)
@@ -859,8 +1334,8 @@ class GIExtension(BaseExtension):
 
     def __create_class_symbol (self, symbol, gi_name):
         klass_name = '%s::%s' % (symbol.unique_name, symbol.unique_name)
-        hierarchy = self.__gir_hierarchies[gi_name]
-        children = self.__gir_children_map[gi_name]
+        hierarchy = self.__gir_hierarchy.get_hierarchy(gi_name)
+        children = self.__gir_hierarchy.get_children(gi_name)
 
         class_symbol = self.get_or_create_symbol(ClassSymbol,
                 hierarchy=hierarchy, children=children,
@@ -876,49 +1351,17 @@ class GIExtension(BaseExtension):
                 display_name=symbol.display_name,
                 unique_name=iface_name)
 
-    def __get_gi_name_components(self, node):
-        parent = node.getparent()
-        components = [node.attrib['name']]
-        while parent is not None:
-            try:
-                components.insert(0, parent.attrib['name'])
-            except KeyError:
-                break
-            parent = parent.getparent()
-        return components
-
-    def __add_translations(self, unique_name, node):
-        id_key = '{%s}identifier' % self.__nsmap['c']
-        id_type = '{%s}type' % self.__nsmap['c']
-
-        components = self.__get_gi_name_components(node) 
-        gi_name = '.'.join(components)
-
-        if id_key in node.attrib:
-            self.__python_names[unique_name] = gi_name
-            components[-1] = 'prototype.%s' % components[-1]
-            self.__javascript_names[unique_name] = '.'.join(components)
-            self.__c_names[unique_name] = unique_name
-        elif id_type in node.attrib:
-            self.__python_names[unique_name] = gi_name
-            self.__javascript_names[unique_name] = gi_name
-            self.__c_names[unique_name] = unique_name
-
-        return components, gi_name
-
     def __update_function (self, func, node):
         self.debug('Updating function %s' % func.display_name)
         func.is_method = node.tag.endswith ('method')
 
-        self.__add_translations(func.unique_name, node)
-
         gi_params, retval = self.__create_parameters_and_retval (node)
 
         func.return_value = retval
 
         func_parameters = func.parameters
 
-        if 'throws' in node.attrib:
+        if node.throws:
             func_parameters = func_parameters[:-1]
             func.throws = True
 
@@ -938,48 +1381,40 @@ class GIExtension(BaseExtension):
         self.debug('Updating record %s' % symbol.display_name)
         symbols = []
 
-        components, gi_name = self.__add_translations(symbol.unique_name, node)
-        gi_name = '.'.join(components)
+        gi_name = node.gi_name
 
-        if node.tag == '{%s}class' % self.__nsmap['core']:
+        if node.tag == 'class':
             symbols.append(self.__create_class_symbol (symbol, gi_name))
-        elif node.tag == '{%s}interface' % self.__nsmap['core']:
+        elif node.tag == 'interface':
             symbols.append(self.__create_interface_symbol (node, symbol, gi_name))
 
-        klass_name = node.attrib.get('{%s}type-name' %
-                'http://www.gtk.org/introspection/glib/1.0')
+        klass_name = node.type_name
 
-        for sig_node in node.findall('./glib:signal',
-                                     namespaces = self.__nsmap):
+        for sig_node in node.signals:
             symbols.append(self.__create_signal_symbol(
                 sig_node, klass_name))
-            self.debug("Added signal symbol %s" % sig_node.attrib['name'])
+            self.debug("Added signal symbol %s" % sig_node.name)
 
-        for prop_node in node.findall('./core:property',
-                                     namespaces = self.__nsmap):
+        for prop_node in node.properties:
             symbols.append(self.__create_property_symbol(
                 prop_node, klass_name))
-            self.debug("Added property symbol %s" % prop_node.attrib['name'])
+            self.debug("Added property symbol %s" % prop_node.name)
 
-        class_struct_name = node.attrib.get('{%s}type-struct' %
-                self.__nsmap['glib'])
+        class_struct_name = node.type_struct
 
         parent_comment = None
         if class_struct_name:
-            class_struct_name = '%s%s' % (components[0], class_struct_name)
+            class_struct_name = '%s%s' % (node.namespace, class_struct_name)
             parent_comment = self.doc_repo.doc_database.get_comment(class_struct_name)
 
-        vmethods = node.findall('./core:virtual-method',
-                                namespaces = self.__nsmap)
-
-        for vfunc_node in vmethods:
+        for vfunc_node in node.virtual_methods:
             sym = self.__create_vfunc_symbol (vfunc_node, klass_name)
             symbols.append(sym)
 
-            self.debug("Added vmethod symbol %s" % vfunc_node.attrib['name'])
+            self.debug("Added vmethod symbol %s" % vfunc_node.name)
 
             if parent_comment:
-                comment = parent_comment.params.get (vfunc_node.attrib['name'])
+                comment = parent_comment.params.get (vfunc_node.name)
                 if comment:
                     block = Comment (name=sym.unique_name,
                                      description=comment.description,
@@ -989,7 +1424,8 @@ class GIExtension(BaseExtension):
         return symbols
 
     def __update_symbol(self, symbol):
-        node = self.__node_cache.get(symbol.unique_name)
+        # Symbols are built from the C types of parameters
+        node = self.__gir_repo.get_complete_node(symbol.unique_name)
         res = []
 
         if node is None:
@@ -1007,10 +1443,181 @@ class GIExtension(BaseExtension):
         if page.extension_name != self.extension_name:
             return []
 
+        self.__gir_deps[symbol.unique_name] = self.__get_gir_digest(
+            symbol.unique_name)
         return self.__update_symbol(symbol)
 
+    def __get_gir_digest(self, name):
+        node = self.__gir_repo.get_complete_node(name)
+        if node is None:
+            return None
+
+        # Everything __update_symbol builds symbols from: the node, which
+        # holds the signals, properties and vfuncs of classes, and the
+        # hierarchy of classes and interfaces. Like there, the node is
+        # the complete one, but ancestors may come from typelibs, only
+        # their names are shared with the nodes of gir files.
+        state = [get_record_state(node)]
+        if node.tag in ('class', 'interface'):
+            hierarchy = self.__gir_hierarchy
+            parent = hierarchy.get_parent(node.gi_name)
+            while parent is not None:
+                klass = self.__gir_repo.get_class(parent)
+                state.append((parent, klass and klass.klass_name))
+                parent = hierarchy.get_parent(parent)
+            state.append(sorted(hierarchy.get_children(node.gi_name)))
+
+        return hashlib.sha1(repr(state)).hexdigest()
+
+    def __load_gir_deps(self):
+        # pylint: disable=broad-except
+        try:
+            with open(self.__gir_deps_path, 'rb') as _:
+                version, gir_deps, gir_stamps = pickle.load(_)
+        except Exception:
+            return {}, {}
+
+        if version != GIR_DEPS_VERSION:
+            return {}, {}
+        return gir_deps, gir_stamps
+
+    def __stamp_girs(self):
+        gir_stamps = {}
+        for gir_file in self.__parsed_girs:
+            stamp = self.__gir_stamps.get(gir_file)
+            try:
+                refresh = None
+                if stamp is not None:
+                    refresh = check_stamp(gir_file, stamp)
+                # Only hash the girs which changed
+                if refresh is None:
+                    stamp = make_stamp(gir_file)
+                elif refresh:
+                    stamp = make_stamp(gir_file, stamp[3])
+            except OSError:
+                continue
+            gir_stamps[gir_file] = stamp
+        return gir_stamps
+
+    def __is_gir_changed(self, gir_file):
+        stamp = self.__gir_stamps.get(gir_file)
+        if stamp is None:
+            return True
+        try:
+            return check_stamp(gir_file, stamp) is None
+        except OSError:
+            return True
+
+    def __store_gir_deps(self, doc_repo):
+        # Forget about the symbols which aren't listed anymore
+        listed = set()
+        for page in doc_repo.doc_tree.get_pages().values():
+            listed.update(page.symbol_names)
+        gir_deps = dict((name, digest) for name, digest in
+                        self.__gir_deps.iteritems() if name in listed)
+
+        self.__gir_stamps = self.__stamp_girs()
+
+        tmp_path = '%s.%d.tmp' % (self.__gir_deps_path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as _:
+                pickle.dump((GIR_DEPS_VERSION, gir_deps, self.__gir_stamps),
+                            _, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, self.__gir_deps_path)
+        except (OSError, IOError) as exc:
+            self.debug("Couldn't store gir dependencies: %s" % exc)
+
+    def __get_changed_symbols(self):
+        # Nodes can only have changed if their gir was indexed again,
+        # which girs read from typelibs or by the index server always
+        # are: only the girs whose contents changed since the symbols
+        # were digested count
+        changed_girs = [gir_file for gir_file in self.__reindexed_girs
+                        if self.__is_gir_changed(gir_file)]
+        if not changed_girs or not self.__gir_deps:
+            return []
+
+        changed = [name for name, digest in self.__gir_deps.iteritems()
+                   if self.__get_gir_digest(name) != digest]
+        if changed:
+            self.info('%d symbols changed in %d changed gir files' %
+                      (len(changed), len(changed_girs)))
+        return changed
+
+    def __update_doc_tree(self, doc_tree, unlisted_symbols):
+        changed = self.__get_changed_symbols()
+        if changed:
+            doc_tree.stale_symbol_pages(changed)
+
+    def __watch_girs(self, doc_repo):
+        # Formatting again after a reload emits the formatted signal
+        if self.__watching:
+            return
+        self.__watching = True
+
+        gir_files = dict((os.path.abspath(gir_file), gir_file)
+                         for gir_file in self.__parsed_girs)
+        watcher = GirWatcher(gir_files)
+
+        # Everything was just formatted
+        for page in doc_repo.doc_tree.get_pages().values():
+            page.is_stale = False
+
+        self.info('Watching %d gir files for changes' % len(gir_files))
+        try:
+            while True:
+                changed = watcher.wait()
+                self.__reload_girs(doc_repo, [gir_files[gir_file] for
+                                              gir_file in changed])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+            self.__watching = False
+
+    def __reload_girs(self, doc_repo, gir_files):
+        self.__reindexed_girs = set()
+        for gir_file in gir_files:
+            old_index = self.__gir_indexes.get(gir_file)
+            # Girs which aren't loaded yet will be read anew when needed
+            if old_index is not None:
+                self.__gir_repo.replace(old_index,
+                                        self.__load_gir_index(gir_file))
+
+        # The contents of the girs may not have changed
+        if not self.__reindexed_girs:
+            return
+
+        self.__gir_hierarchy = GirHierarchy(self.__gir_repo)
+        self.__gir_hierarchy.build()
+        self.__link_resolutions.clear()
+
+        changed = set(self.__get_changed_symbols())
+        if not changed:
+            return
+
+        doc_tree = doc_repo.doc_tree
+        for page in doc_tree.get_pages().values():
+            if not changed.isdisjoint(page.symbol_names):
+                page.is_stale = True
+                # Page.resolve_symbols appends to the symbols it resolved
+                # the previous time
+                page.symbols = []
+
+        doc_tree.resolve_symbols(doc_repo.doc_database, doc_repo.link_resolver)
+        doc_repo.doc_database.flush()
+
+        # Only stale pages are formatted, the formatted signal then joins
+        # the format workers and stores the gir dependencies
+        doc_repo.format()
+        for page in doc_tree.get_pages().values():
+            page.is_stale = False
+
     def __rename_page_link (self, page_parser, original_name):
-        return self.__translated_names.get(original_name)
+        context = self.get_language_context()
+        if context is None:
+            return None
+        return self.__gir_repo.translate(original_name, context.language)
 
 
 def get_extension_classes():
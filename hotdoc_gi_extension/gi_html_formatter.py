@@ -17,30 +17,99 @@
 # along with this library.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import re
+import urllib
+import binascii
+from xml.sax.saxutils import escape
 from hotdoc.formatters.html_formatter import HtmlFormatter
 from hotdoc.core.symbols import *
 import lxml.etree
 
 
+# Comments are rendered to html once for all languages, with the refs
+# and titles of links left as slots, which are then filled for each
+# language. Slots only use characters cmark doesn't escape.
+_SLOT_REGEX = re.compile(r'GISLOT([RT])([0-9a-f]*)X')
+
+
+def make_link_slot(kind, id_):
+    """Returns a placeholder for the ref ('R') or title ('T') of `id_`."""
+    return u'GISLOT%s%sX' % (kind, binascii.hexlify(id_.encode('utf-8')))
+
+
+# Slots are filled with what cmark would have rendered, escaped the way
+# its html renderer escapes urls and text
+_HREF_SAFE = "-_.+!*(),%#@?=;:/$~&'"
+
+
+def _escape_href(href):
+    quoted = urllib.quote(href.encode('utf-8'), safe=_HREF_SAFE)
+    return escape(quoted, {"'": '&#x27;'}).decode('utf-8')
+
+
+def _escape_text(text):
+    return escape(text, {'"': '&quot;'})
+
+
+class FragmentCache(object):
+    """Html fragments, rendered once per distinct key.
+
+    Flags and annotations only come in a handful of combinations, but
+    are rendered for every signal, property, parameter and return value.
+    """
+    def __init__(self):
+        self.__fragments = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render):
+        """Returns the fragment for `key`, calling `render` on a miss."""
+        fragment = self.__fragments.get(key)
+        if fragment is not None:
+            self.hits += 1
+            return fragment
+
+        self.misses += 1
+        fragment = render()
+        return self.__fragments.setdefault(key, fragment)
+
+    def __len__(self):
+        return len(self.__fragments)
+
+
 class GIHtmlFormatter(HtmlFormatter):
     def __init__(self, gi_extension, link_resolver):
         module_path = os.path.dirname(__file__)
         searchpath = [os.path.join(module_path, "templates")]
         self.__gi_extension = gi_extension
         self.__link_resolver = link_resolver
+        self.fragment_cache = FragmentCache()
         HtmlFormatter.__init__(self, searchpath)
 
+    def __get_context(self):
+        return self.__gi_extension.get_language_context()
+
     def format_annotations (self, annotations):
+        key = ('annotations',) + tuple(annotations)
+        return self.fragment_cache.get(key,
+                lambda: self.__render_annotations(annotations))
+
+    def __render_annotations (self, annotations):
         template = self.engine.get_template('gi_annotations.html')
         return template.render ({'annotations': annotations})
 
     def _format_flags (self, flags):
+        key = ('flags',) + tuple((f.nick, f.link) for f in flags)
+        return self.fragment_cache.get(key,
+                lambda: self.__render_flags(flags))
+
+    def __render_flags (self, flags):
         template = self.engine.get_template('gi_flags.html')
         out = template.render ({'flags': flags})
         return out
 
     def _format_type_tokens (self, type_tokens):
-        if self.__gi_extension.language != 'c':
+        if self.__get_context().language != 'c':
             new_tokens = []
             for tok in type_tokens:
                 # FIXME : shouldn't we rather QualifiedSymbol.get_type_link() ?
@@ -54,7 +123,7 @@ class GIHtmlFormatter(HtmlFormatter):
                 retval[0].get_extension_attribute('gi-extension',
                         'gi_name') == 'none'
 
-        if self.__gi_extension.language == 'c':
+        if self.__get_context().language == 'c':
             if is_void:
                 retval = [None]
             else:
@@ -65,7 +134,7 @@ class GIHtmlFormatter(HtmlFormatter):
         return HtmlFormatter._format_return_value_symbol (self, retval)
 
     def _format_parameter_symbol (self, parameter):
-        if self.__gi_extension.language != 'c':
+        if self.__get_context().language != 'c':
             direction = parameter.get_extension_attribute ('gi-extension',
                     'direction')
             if direction == 'out':
@@ -81,7 +150,7 @@ class GIHtmlFormatter(HtmlFormatter):
         return res
 
     def _format_linked_symbol (self, symbol):
-        if self.__gi_extension.language == 'c':
+        if self.__get_context().language == 'c':
             res = HtmlFormatter._format_linked_symbol (self, symbol)
             if symbol == None:
                 res = 'void'
@@ -95,7 +164,7 @@ class GIHtmlFormatter(HtmlFormatter):
         if gi_name is None:
             return HtmlFormatter._format_linked_symbol (self, symbol)
 
-        fund = self.__gi_extension._fundamentals.get(gi_name)
+        fund = self.__get_context().fundamentals.get(gi_name)
         if fund:
             link = Link(fund.ref, fund._title, gi_name)
             return self._format_type_tokens ([link])
@@ -104,7 +173,8 @@ class GIHtmlFormatter(HtmlFormatter):
         return res
 
     def _format_prototype (self, function, is_pointer, title):
-        if self.__gi_extension.language == 'c':
+        language = self.__get_context().language
+        if language == 'c':
             return HtmlFormatter._format_prototype (self, function,
                     is_pointer, title)
 
@@ -116,19 +186,18 @@ class GIHtmlFormatter(HtmlFormatter):
 
         c_name = function._make_name()
 
-        if self.__gi_extension.language == 'python':
+        if language == 'python':
             template = self.engine.get_template('python_prototype.html')
         else:
             template = self.engine.get_template('javascript_prototype.html')
 
         if type (function) == SignalSymbol:
-            comment = "%s callback for the '%s' signal" % (self.__gi_extension.language, c_name)
+            comment = "%s callback for the '%s' signal" % (language, c_name)
         elif type (function) == VFunctionSymbol:
             comment = "%s implementation of the '%s' virtual method" % \
-                    (self.__gi_extension.language, c_name)
+                    (language, c_name)
         else:
-            comment = "%s wrapper for '%s'" % (self.__gi_extension.language,
-                    c_name)
+            comment = "%s wrapper for '%s'" % (language, c_name)
 
         res = template.render ({'return_value': function.return_value,
             'function_name': title, 'parameters':
@@ -139,17 +208,18 @@ class GIHtmlFormatter(HtmlFormatter):
 
     def _format_gi_vmethod (self, vmethod):
         title = vmethod.link.title
-        if self.__gi_extension.language == 'python':
+        language = self.__get_context().language
+        if language == 'python':
             vmethod.link.title = 'do_%s' % vmethod._make_name()
             title = 'do_%s' % title
-        elif self.__gi_extension.language == 'javascript':
+        elif language == 'javascript':
             vmethod.link.title = '%s::%s' % (vmethod.gi_parent_name, vmethod._make_name())
             title = 'vfunc_%s' % title
         return self._format_callable (vmethod, "virtual method",
                 title)
 
     def _format_struct (self, struct):
-        if self.__gi_extension.language == 'c':
+        if self.__get_context().language == 'c':
             return HtmlFormatter._format_struct (self, struct)
         members_list = self._format_members_list (struct.members, 'Attributes')
 
@@ -159,7 +229,7 @@ class GIHtmlFormatter(HtmlFormatter):
         return (out, False)
 
     def _format_constant(self, constant):
-        if self.__gi_extension.language == 'c':
+        if self.__get_context().language == 'c':
             return HtmlFormatter._format_constant (self, constant)
 
         template = self.engine.get_template('constant.html')
@@ -169,46 +239,129 @@ class GIHtmlFormatter(HtmlFormatter):
         return (out, False)
 
     def _format_comment(self, comment, link_resolver):
-        ast = comment.extension_attrs['gi-extension']['ast']
-
         if not comment.description:
-            out = u''
-        elif ast:
-            out = self._docstring_formatter.ast_to_html(
-                ast, link_resolver)
-        else:
-            ast = self._docstring_formatter.comment_to_ast(
-                comment, link_resolver)
-            out = self._docstring_formatter.ast_to_html(
-                ast, link_resolver)
-            comment.extension_attrs['gi-extension']['ast'] = ast
-
-        return out
+            return u''
+
+        attrs = comment.extension_attrs['gi-extension']
+        slotted = attrs.get('slotted')
+        if slotted is None:
+            ast = attrs['ast']
+            if not ast:
+                ast = self._docstring_formatter.comment_to_ast(
+                    comment, link_resolver)
+                attrs['ast'] = ast
+            with self.__gi_extension.language_context(None):
+                slotted = self._docstring_formatter.ast_to_html(
+                    ast, link_resolver)
+            attrs['slotted'] = slotted
+
+        return self.__fill_link_slots(slotted, link_resolver)
+
+    def __fill_link_slots(self, slotted, link_resolver):
+        # id -> (filled ref slot, filled title slot), links are looked up
+        # once for both
+        resolved = {}
+
+        def _fill(match):
+            kind, hex_id = match.groups()
+            try:
+                ref, title = resolved[hex_id]
+            except KeyError:
+                id_ = binascii.unhexlify(hex_id).decode('utf-8')
+                link = link_resolver.get_named_link(id_)
+                # Like cmark, keep the original url if there's no ref.
+                # Links without a title are labelled with their id, that
+                # is with what the comment links to
+                ref = link.get_link() if link else None
+                title = link.get_title() if link else None
+                ref, title = _escape_href(ref or id_), _escape_text(title or id_)
+                resolved[hex_id] = (ref, title)
+
+            return ref if kind == 'R' else title
+
+        return _SLOT_REGEX.sub(_fill, slotted)
 
     def get_output_folder(self):
         return os.path.join(super(GIHtmlFormatter, self).get_output_folder(),
-            self.__gi_extension.language)
+            self.__get_context().language)
+
+    def write_stub_page(self, page, output):
+        """Writes a page pointing to the C documentation of `page`.
+
+        Pages whose symbols are all unavailable in the bound language
+        aren't formatted in it, but the sitemap and other pages still
+        link to them.
+        """
+        html_folder = os.path.join(
+            output, super(GIHtmlFormatter, self).get_output_folder())
+        path = os.path.join(html_folder, self.__get_context().language,
+                            page.link.ref)
+        c_path = os.path.join(html_folder, 'c', page.link.ref)
+        href = os.path.relpath(c_path, os.path.dirname(path))
+
+        template = self.engine.get_template('gi_stub_page.html')
+        out = template.render({'title': _escape_text(page.get_title()),
+                               'href': _escape_href(href)})
+
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(out.encode('utf-8'))
 
     def _get_assets_path(self):
         return os.path.join('..', 'assets')
 
     def patch_page(self, page, symbol, output):
-        symbol.update_children_comments()
+        self.patch_page_symbols(page, [symbol], output)
+
+    def patch_page_symbols(self, page, symbols, output):
+        """Patches the descriptions of all of `symbols` in `page`.
+
+        The output file of each language is only parsed and written once,
+        whatever the number of symbols. hotdoc patches pages one symbol
+        at a time, through `patch_page`.
+        """
+        for symbol in symbols:
+            symbol.update_children_comments()
+
         for l in self.__gi_extension.languages:
-            self.__gi_extension.setup_language (l)
-            self.format_symbol(symbol, self.__link_resolver)
+            descriptions = {}
+            with self.__gi_extension.language_context(l):
+                for symbol in symbols:
+                    # Symbols which aren't exposed in this language aren't
+                    # formatted, and keep the description of the previous
+                    # language
+                    description = self.format_symbol(symbol,
+                                                     self.__link_resolver)
+                    if description:
+                        descriptions[symbol.unique_name] = description
+
+            if not descriptions:
+                continue
 
             parser = lxml.etree.XMLParser(encoding='utf-8', recover=True)
             page_path = os.path.join(output, l, page.link.ref)
             tree = lxml.etree.parse(page_path, parser)
             root = tree.getroot()
-            elems = root.findall('.//div[@id="%s"]' % symbol.unique_name)
-            for elem in elems:
-                parent = elem.getparent()
-                new_elem = lxml.etree.fromstring(symbol.detailed_description)
-                parent.replace (elem, new_elem)
 
-            with open(page_path, 'w') as f:
+            # id -> the divs with that id, indexed in a single walk
+            divs = {}
+            for elem in root.iter('div'):
+                id_ = elem.get('id')
+                if id_ is not None:
+                    divs.setdefault(id_, []).append(elem)
+
+            patched = False
+            for name, description in descriptions.iteritems():
+                for elem in divs.get(name, ()):
+                    new_elem = lxml.etree.fromstring(description)
+                    elem.getparent().replace(elem, new_elem)
+                    patched = True
+
+            if not patched:
+                continue
+
+            tmp_path = '%s.%d.tmp' % (page_path, os.getpid())
+            with open(tmp_path, 'w') as f:
                 tree.write_c14n(f)
-
-        self.__gi_extension.setup_language(None)
+            os.rename(tmp_path, page_path)
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""On-disk caches of indexed gir files.
+
+Each gir file gets its own cache entry, named after its absolute path.
+An entry starts with a small stamp (mtime, size and sha1 of the gir
+file), so that checking whether an entry is still valid doesn't
+require loading the index.
+
+When the mtime or size of a gir file changed, its contents are hashed
+again, so that regenerating an identical gir doesn't invalidate its
+entry. The extension stamps the gir files its symbols were digested
+from the same way, see `make_stamp` and `check_stamp`.
+
+`GirCache` pickles whole `gir_index.GirIndex` objects, and is meant for
+the girs of a project. `SharedGirCache` is meant for the girs installed
+on the system, which every project includes: its entries are packed
+tables of individually pickled nodes, mapped read-only in memory so
+that concurrent builds share them, and only decoded on lookup.
+"""
+
+import os
+import mmap
+import struct
+import hashlib
+from bisect import bisect_left
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from .gir_index import GirIndex
+
+
+# Bump this whenever the layout of the pickled records changes
+CACHE_VERSION = 6
+
+_PACKED_MAGIC = b'HDGI'
+_UINT32 = struct.Struct('<I')
+# key offset, key length, value offset, value length
+_TABLE_ENTRY = struct.Struct('<IIII')
+
+
+def _hash_file(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as _:
+        for chunk in iter(lambda: _.read(65536), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def make_stamp(gir_file, digest=None):
+    """Returns the stamp of `gir_file`, hashing it unless `digest`, the
+    sha1 of its contents, is known."""
+    stat = os.stat(gir_file)
+    return (CACHE_VERSION, stat.st_mtime, stat.st_size,
+            digest or _hash_file(gir_file))
+
+
+def _get_stat(gir_file):
+    try:
+        stat = os.stat(gir_file)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+def check_stamp(gir_file, stamp):
+    """Returns `None` if `stamp` is stale, else whether it needs a refresh.
+
+    Stamps which don't need a refresh have the mtime and size of
+    `gir_file`, the others only its contents.
+    """
+    version, mtime, size, digest = stamp
+    if version != CACHE_VERSION:
+        return None
+
+    stat = os.stat(gir_file)
+    if (stat.st_mtime, stat.st_size) == (mtime, size):
+        return False
+
+    if _hash_file(gir_file) != digest:
+        return None
+
+    return True
+
+
+def _get_entry_path(folder, gir_file, ext):
+    key = hashlib.sha1(os.path.abspath(gir_file)).hexdigest()
+    return os.path.join(folder, '%s.%s' % (key, ext))
+
+
+class GirCache(object):
+    """Stores and loads `gir_index.GirIndex` objects in `folder`."""
+    def __init__(self, folder):
+        self.folder = folder
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+    def load(self, gir_file):
+        """Returns the cached index for `gir_file`, or `None`."""
+        entry_path = _get_entry_path(self.folder, gir_file, 'p')
+
+        # pylint: disable=broad-except
+        try:
+            with open(entry_path, 'rb') as _:
+                stamp = pickle.load(_)
+                refresh = check_stamp(gir_file, stamp)
+                if refresh is None:
+                    return None
+                gir_index = pickle.load(_)
+        except Exception:
+            return None
+
+        # Same contents, refresh the stamp to skip hashing next time
+        if refresh:
+            self.store(gir_file, gir_index, stamp[3])
+        return gir_index
+
+    def store(self, gir_file, gir_index, digest=None):
+        """Caches `gir_index` as the index for `gir_file`."""
+        entry_path = _get_entry_path(self.folder, gir_file, 'p')
+        tmp_path = '%s.%d.tmp' % (entry_path, os.getpid())
+
+        with open(tmp_path, 'wb') as _:
+            pickle.dump(make_stamp(gir_file, digest), _,
+                        pickle.HIGHEST_PROTOCOL)
+            pickle.dump(gir_index, _, pickle.HIGHEST_PROTOCOL)
+
+        os.rename(tmp_path, entry_path)
+
+
+class _MappedTable(object):
+    """A read-only mapping over a sorted table of a packed entry."""
+    def __init__(self, buf, offset, decoded):
+        self.__buf = buf
+        self.__count = _UINT32.unpack_from(buf, offset)[0]
+        self.__entries = offset + _UINT32.size
+        # Records are shared between keys, and between tables
+        self.__decoded = decoded
+
+    def __entry(self, i):
+        return _TABLE_ENTRY.unpack_from(
+            self.__buf, self.__entries + i * _TABLE_ENTRY.size)
+
+    def __key(self, i):
+        key_offset, key_len, _, _ = self.__entry(i)
+        return self.__buf[key_offset:key_offset + key_len]
+
+    def __value(self, i):
+        _, _, value_offset, value_len = self.__entry(i)
+        try:
+            return self.__decoded[value_offset]
+        except KeyError:
+            pass
+        value = pickle.loads(self.__buf[value_offset:value_offset + value_len])
+        self.__decoded[value_offset] = value
+        return value
+
+    def __len__(self):
+        return self.__count
+
+    def __getitem__(self, i):
+        return self.__key(i)
+
+    def get(self, name, default=None):
+        key = name.encode('utf-8')
+        i = bisect_left(self, key)
+        if i < self.__count and self.__key(i) == key:
+            return self.__value(i)
+        return default
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def iteritems(self):
+        for i in range(self.__count):
+            yield self.__key(i).decode('utf-8'), self.__value(i)
+
+
+class MappedGirIndex(GirIndex):
+    """A `gir_index.GirIndex` whose nodes stay in a mapped packed entry."""
+    def __init__(self, buf, header, offset):
+        namespace, version, id_prefixes, sym_prefixes, includes, \
+            get_type_functions, smart_filters, python_names, \
+            javascript_names, non_introspectable, non_introspectable_types, \
+            foreign_type_refs = header
+        GirIndex.__init__(self, namespace, version, id_prefixes, sym_prefixes)
+        self.includes = includes
+        self.get_type_functions = get_type_functions
+        self.smart_filters = smart_filters
+        self.python_names = python_names
+        self.javascript_names = javascript_names
+        self.non_introspectable = non_introspectable
+        self.non_introspectable_types = non_introspectable_types
+        self.foreign_type_refs = foreign_type_refs
+        decoded = {}
+        self.nodes = _MappedTable(buf, offset, decoded)
+        self.class_nodes = _MappedTable(buf, _UINT32.unpack_from(
+            buf, offset - _UINT32.size)[0], decoded)
+
+
+def _pack_table(out, table, blobs):
+    """Appends `table` to `out`, returns the offset it was written at."""
+    keys = sorted((key.encode('utf-8'), node) for key, node in
+                  table.iteritems())
+    offset = len(out)
+    entries_len = _UINT32.size + len(keys) * _TABLE_ENTRY.size
+    key_offset = offset + entries_len
+    packed_keys = []
+    entries = [_UINT32.pack(len(keys))]
+    for key, node in keys:
+        value_offset, value_len = blobs[id(node)]
+        entries.append(_TABLE_ENTRY.pack(key_offset, len(key), value_offset,
+                                         value_len))
+        packed_keys.append(key)
+        key_offset += len(key)
+    out.extend(b''.join(entries))
+    out.extend(b''.join(packed_keys))
+    return offset
+
+
+class SharedGirCache(object):
+    """Stores gir indexes in `folder` as packed, memory-mapped tables.
+
+    An entry is laid out as:
+
+    - magic, then the length of the pickled stamp and header, then these
+    - the values: one pickled record per distinct node
+    - the offset of the class table, then the node table, then the
+      class table. A table is a count, followed by (key offset, key
+      length, value offset, value length) entries sorted by key, then
+      the utf-8 encoded keys.
+
+    Entries are replaced atomically, processes which already mapped the
+    previous version of an entry keep using it.
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        # gir file -> (mtime and size of the gir when its entry was
+        # mapped, mapped index)
+        self.__mapped = {}
+
+    def load(self, gir_file):
+        """Returns the cached `MappedGirIndex` for `gir_file`, or `None`."""
+        stat = _get_stat(gir_file)
+        memo = self.__mapped.pop(gir_file, None)
+        if memo is not None and memo[0] == stat:
+            self.__mapped[gir_file] = memo
+            return memo[1]
+
+        entry_path = _get_entry_path(self.folder, gir_file, 'idx')
+
+        # pylint: disable=broad-except
+        try:
+            with open(entry_path, 'rb') as _:
+                buf = mmap.mmap(_.fileno(), 0, access=mmap.ACCESS_READ)
+            if buf[:len(_PACKED_MAGIC)] != _PACKED_MAGIC:
+                return None
+            offset = len(_PACKED_MAGIC)
+            header_len = _UINT32.unpack_from(buf, offset)[0]
+            offset += _UINT32.size
+            stamp, header, table_offset = pickle.loads(
+                buf[offset:offset + header_len])
+            refresh = check_stamp(gir_file, stamp)
+            if refresh is None:
+                return None
+            mapped = MappedGirIndex(buf, header, table_offset)
+        except Exception:
+            return None
+
+        if refresh:
+            self.store(gir_file, mapped, stamp[3])
+
+        self.__mapped[gir_file] = (stat, mapped)
+        return mapped
+
+    def store(self, gir_file, gir_index, digest=None):
+        """Packs `gir_index` as the index for `gir_file`."""
+        values = bytearray()
+        blobs = {}
+        for table in (gir_index.nodes, gir_index.class_nodes):
+            for _, node in table.iteritems():
+                if id(node) not in blobs:
+                    blob = pickle.dumps(node, pickle.HIGHEST_PROTOCOL)
+                    blobs[id(node)] = (len(values), len(blob))
+                    values.extend(blob)
+
+        header = (gir_index.namespace, gir_index.version,
+                  gir_index.identifier_prefixes, gir_index.symbol_prefixes,
+                  gir_index.includes, gir_index.get_type_functions,
+                  gir_index.smart_filters, gir_index.python_names,
+                  gir_index.javascript_names, gir_index.non_introspectable,
+                  gir_index.non_introspectable_types,
+                  gir_index.foreign_type_refs)
+        stamp = make_stamp(gir_file, digest)
+
+        # The offsets of the values depend on the length of the header,
+        # which depends on the offset of the tables, iterate until stable
+        values_offset = 0
+        while True:
+            table_offset = values_offset + len(values) + _UINT32.size
+            pickled_header = pickle.dumps((stamp, header, table_offset),
+                                          pickle.HIGHEST_PROTOCOL)
+            new_values_offset = len(_PACKED_MAGIC) + _UINT32.size + \
+                len(pickled_header)
+            if new_values_offset == values_offset:
+                break
+            values_offset = new_values_offset
+
+        out = bytearray(_PACKED_MAGIC)
+        out.extend(_UINT32.pack(len(pickled_header)))
+        out.extend(pickled_header)
+        out.extend(values)
+        rebased = dict((key, (value_offset + values_offset, value_len))
+                       for key, (value_offset, value_len) in blobs.items())
+
+        class_table_offset_pos = len(out)
+        out.extend(_UINT32.pack(0))
+        nodes_offset = _pack_table(out, gir_index.nodes, rebased)
+        assert nodes_offset == table_offset
+        class_offset = _pack_table(out, gir_index.class_nodes, rebased)
+        _UINT32.pack_into(out, class_table_offset_pos, class_offset)
+
+        entry_path = _get_entry_path(self.folder, gir_file, 'idx')
+        tmp_path = '%s.%d.tmp' % (entry_path, os.getpid())
+        with open(tmp_path, 'wb') as _:
+            _.write(out)
+        os.rename(tmp_path, entry_path)
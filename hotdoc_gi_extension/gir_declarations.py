@@ -0,0 +1,752 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""The C declarations of a project, as described by its gir files.
+
+g-ir-scanner records the header and line each function, record,
+enumeration, callback, constant and alias was declared at, along with
+its C types, including for the nodes which aren't introspectable. That
+is enough to create the C symbols of a header without parsing it with
+clang, as long as the gir file was generated from the header as it is
+now, and knows about everything the header declares.
+
+`index_declarations` gathers the declarations of a gir file, grouped by
+the header they were found in.
+
+`scan_header` is a lexical pass over a header, which isn't preprocessed:
+it finds the names the header declares, the text of their definitions
+and the gtk-doc comments of the header. A header is covered by the gir
+files of a project when they know about every name it declares. Headers
+which declare anything else, usually macros or symbols the scanner
+skipped, are to be parsed with clang, and so are the headers the scan
+can't classify: conditional declarations, macro invocations which may
+declare names, declarations it doesn't understand.
+"""
+
+import os
+import re
+from bisect import bisect_right
+
+from lxml import etree
+
+from .gir_index import NS_CORE, NS_C, NS_GLIB
+
+
+_NAMESPACE_TAG = '{%s}namespace' % NS_CORE
+_SOURCE_POSITION_TAG = '{%s}source-position' % NS_CORE
+_RETURN_VALUE_TAG = '{%s}return-value' % NS_CORE
+_PARAMETERS_TAG = '{%s}parameters' % NS_CORE
+_INSTANCE_PARAMETER_TAG = '{%s}instance-parameter' % NS_CORE
+_TYPE_TAG = '{%s}type' % NS_CORE
+_ARRAY_TAG = '{%s}array' % NS_CORE
+_VARARGS_TAG = '{%s}varargs' % NS_CORE
+_FIELD_TAG = '{%s}field' % NS_CORE
+_MEMBER_TAG = '{%s}member' % NS_CORE
+_CALLBACK_TAG = '{%s}callback' % NS_CORE
+_RECORD_TAGS = tuple('{%s}%s' % (NS_CORE, tag) for tag in (
+    'record', 'class', 'interface'))
+_UNION_TAG = '{%s}union' % NS_CORE
+_ENUM_TAGS = ('{%s}enumeration' % NS_CORE, '{%s}bitfield' % NS_CORE)
+_FUNCTION_TAGS = tuple('{%s}%s' % (NS_CORE, tag) for tag in (
+    'function', 'method', 'constructor', 'function-inline'))
+_FUNCTION_MACRO_TAG = '{%s}function-macro' % NS_CORE
+_CONSTANT_TAG = '{%s}constant' % NS_CORE
+_ALIAS_TAG = '{%s}alias' % NS_CORE
+_BOXED_TAG = '{%s}boxed' % NS_GLIB
+
+_C_IDENTIFIER = '{%s}identifier' % NS_C
+_C_TYPE = '{%s}type' % NS_C
+
+
+class GirDeclaration(object):
+    """A C declaration of a header, as described by a gir file.
+
+    `kind` is one of 'function', 'callback', 'struct', 'union', 'enum',
+    'constant', 'alias' or 'function-macro'.
+
+    Callables have `parameters`, (name, C type) pairs, a `return_type`,
+    `None` if they return nothing, and `throws` if their last parameter
+    is a `GError **`. The parameters of function macros have no type.
+
+    Structures and unions have `members`, (name, C type, callback)
+    triplets, where callback is the declaration of the function pointer
+    the member holds, if any, and are `opaque` when their fields are
+    private. Enumerations have `members`, (C name, value) pairs.
+
+    Constants have the C type and the `value` of their macro, aliases
+    the C type they alias.
+    """
+    __slots__ = ('kind', 'name', 'lineno', 'c_type', 'value', 'parameters',
+                 'return_type', 'throws', 'members', 'opaque')
+
+    def __init__(self, kind, name, lineno=None):
+        self.kind = kind
+        self.name = name
+        self.lineno = lineno
+        self.c_type = None
+        self.value = None
+        self.parameters = ()
+        self.return_type = None
+        self.throws = False
+        self.members = ()
+        self.opaque = False
+
+
+class GirDeclarations(object):
+    """The declarations of a gir file.
+
+    `headers` maps the header file names the gir refers to, usually
+    relative to the directory g-ir-scanner ran in, to the declarations
+    found in them, and `names` holds all the C names the gir knows
+    about, whether they have a known location or not.
+    """
+    def __init__(self, gir_file):
+        self.gir_file = gir_file
+        self.headers = {}
+        self.names = set()
+
+
+def _get_type_elem(elem):
+    for child in elem:
+        if child.tag in (_TYPE_TAG, _ARRAY_TAG, _VARARGS_TAG):
+            return child
+    return None
+
+
+def _get_c_type(elem):
+    type_elem = _get_type_elem(elem)
+    if type_elem is None:
+        return None
+    if type_elem.tag == _VARARGS_TAG:
+        return '...'
+
+    c_type = type_elem.get(_C_TYPE)
+    if c_type is not None:
+        return c_type
+
+    # Arrays of fixed size and some gpointer fields have no C type
+    if type_elem.tag == _ARRAY_TAG:
+        element = _get_c_type(type_elem)
+        if element is not None:
+            return element + '*'
+        return None
+    return type_elem.get('name')
+
+
+def _get_return_type(elem):
+    for child in elem:
+        if child.tag == _RETURN_VALUE_TAG:
+            c_type = _get_c_type(child)
+            if c_type == 'void':
+                return None
+            return c_type
+    return None
+
+
+def _get_parameters(elem):
+    parameters = []
+    for child in elem:
+        if child.tag != _PARAMETERS_TAG:
+            continue
+        for param in child:
+            if param.tag == _INSTANCE_PARAMETER_TAG:
+                parameters.insert(0, (param.get('name'), _get_c_type(param)))
+            else:
+                parameters.append((param.get('name'), _get_c_type(param)))
+    return parameters
+
+
+def _get_position(elem):
+    for child in elem:
+        if child.tag == _SOURCE_POSITION_TAG:
+            return child.get('filename'), int(child.get('line', 0)) or None
+    return None, None
+
+
+def _make_callable(kind, name, elem):
+    decl = GirDeclaration(kind, name)
+    parameters = _get_parameters(elem)
+    decl.throws = elem.get('throws') == '1'
+    if decl.throws:
+        parameters.append(('error', 'GError**'))
+    decl.parameters = tuple(parameters)
+    decl.return_type = _get_return_type(elem)
+    return decl
+
+
+class _DeclarationCollector(object):
+    def __init__(self, gir_file):
+        self.declarations = GirDeclarations(gir_file)
+
+    def __add(self, elem, decl):
+        self.declarations.names.add(decl.name)
+        filename, decl.lineno = _get_position(elem)
+        if filename is not None:
+            self.declarations.headers.setdefault(filename, []).append(decl)
+
+    def __collect_functions(self, elem):
+        for child in elem:
+            if child.tag in _FUNCTION_TAGS:
+                name = child.get(_C_IDENTIFIER)
+                if name is not None:
+                    self.__add(child, _make_callable('function', name, child))
+
+    def __collect_fields(self, elem):
+        members = []
+        for child in elem:
+            if child.tag != _FIELD_TAG:
+                continue
+            name = child.get('name')
+            callback = None
+            for sub in child:
+                if sub.tag == _CALLBACK_TAG:
+                    callback = _make_callable('callback', name, sub)
+            c_type = None if callback is not None else _get_c_type(child)
+            members.append((name, c_type, callback))
+        return tuple(members)
+
+    def __collect_record(self, elem):
+        c_type = elem.get(_C_TYPE)
+        if c_type is not None:
+            kind = 'union' if elem.tag == _UNION_TAG else 'struct'
+            decl = GirDeclaration(kind, c_type)
+            decl.members = self.__collect_fields(elem)
+            decl.opaque = elem.get('disguised') == '1' or (
+                elem.get('opaque') == '1') or not decl.members
+            self.__add(elem, decl)
+        self.__collect_functions(elem)
+
+    def __collect_enum(self, elem):
+        c_type = elem.get(_C_TYPE)
+        if c_type is not None:
+            decl = GirDeclaration('enum', c_type)
+            members = []
+            for child in elem:
+                if child.tag == _MEMBER_TAG:
+                    name = child.get(_C_IDENTIFIER)
+                    members.append((name, int(child.get('value', 0))))
+                    self.declarations.names.add(name)
+            decl.members = tuple(members)
+            self.__add(elem, decl)
+        self.__collect_functions(elem)
+
+    def __collect_function_macro(self, elem):
+        name = elem.get(_C_IDENTIFIER)
+        if name is None:
+            return
+        decl = GirDeclaration('function-macro', name)
+        decl.parameters = tuple((name, None) for name, _ in
+                                _get_parameters(elem))
+        self.__add(elem, decl)
+
+    def __collect_constant(self, elem):
+        name = elem.get(_C_TYPE)
+        if name is None:
+            return
+        decl = GirDeclaration('constant', name)
+        decl.c_type = _get_c_type(elem)
+        decl.value = elem.get('value')
+        self.__add(elem, decl)
+
+    def __collect_alias(self, elem):
+        name = elem.get(_C_TYPE)
+        if name is None:
+            return
+        decl = GirDeclaration('alias', name)
+        decl.c_type = _get_c_type(elem)
+        self.__add(elem, decl)
+
+    def collect(self, elem):
+        """Collects the declarations of `elem`, a child of a namespace."""
+        tag = elem.tag
+        if tag in _FUNCTION_TAGS:
+            self.__collect_functions([elem])
+        elif tag in _RECORD_TAGS or tag == _UNION_TAG:
+            self.__collect_record(elem)
+        elif tag in _ENUM_TAGS:
+            self.__collect_enum(elem)
+        elif tag == _CALLBACK_TAG:
+            name = elem.get(_C_TYPE)
+            if name is not None:
+                self.__add(elem, _make_callable('callback', name, elem))
+        elif tag == _FUNCTION_MACRO_TAG:
+            self.__collect_function_macro(elem)
+        elif tag == _CONSTANT_TAG:
+            self.__collect_constant(elem)
+        elif tag == _ALIAS_TAG:
+            self.__collect_alias(elem)
+        elif tag == _BOXED_TAG:
+            self.__collect_functions(elem)
+
+
+def index_declarations(gir_file):
+    """Returns the `GirDeclarations` of `gir_file`.
+
+    The gir file is streamed, the children of its namespace are dropped
+    as soon as their declarations were collected.
+    """
+    collector = _DeclarationCollector(gir_file)
+    for _, elem in etree.iterparse(gir_file, events=('end',)):
+        parent = elem.getparent()
+        if parent is None or parent.tag != _NAMESPACE_TAG:
+            continue
+        collector.collect(elem)
+        elem.clear()
+        while elem.getprevious() is not None:
+            del parent[0]
+    return collector.declarations
+
+
+def match_header(header, gir_file, filenames):
+    """Returns which of the `filenames` of `gir_file` is `header`.
+
+    The file names a gir refers to are relative to the directory
+    g-ir-scanner ran in, which isn't recorded, so the file name sharing
+    the longest trailing path with `header` is picked. `None` is
+    returned when there is no single such name.
+    """
+    gir_dir = os.path.dirname(os.path.abspath(gir_file))
+    header = os.path.abspath(header)
+    components = header.split(os.sep)
+    best = None
+    best_length = 0
+    for filename in filenames:
+        path = os.path.normpath(os.path.join(gir_dir, filename))
+        if path == header and os.path.exists(path):
+            return filename
+        other = path.split(os.sep)
+        length = 0
+        while length < min(len(components), len(other)) and \
+                components[-length - 1] == other[-length - 1]:
+            length += 1
+        if length > best_length:
+            best, best_length = filename, length
+        elif length == best_length:
+            best = None
+    return best
+
+
+_TOKEN_RE = re.compile(r'''
+    (?P<comment>/\*.*?\*/)
+  | (?P<line_comment>//[^\n]*)
+  | (?P<directive>^[ \t]*\#(?:\\\n|[^\n])*)
+  | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+  | (?P<identifier>[A-Za-z_]\w*)
+  | (?P<number>\.?\d(?:[eEpP][+-]|[\w.])*)
+  | (?P<punctuation>\S)
+''', re.VERBOSE | re.DOTALL | re.MULTILINE)
+
+_DIRECTIVE_RE = re.compile(r'[ \t]*#[ \t]*(\w*)[ \t]*((?:\\\n|[^\n])*)')
+
+_DEFINE_RE = re.compile(r'([A-Za-z_]\w*)(\()?((?:\\\n|[^\n])*)')
+
+_MACRO_NAME_RE = re.compile(r'^[A-Z_][A-Z0-9_]*$')
+
+# The macros which decorate declarations, with or without arguments:
+# availability and deprecation, compiler attributes, exported variables
+# and extern "C" blocks
+_DECORATOR_RE = re.compile(r'(?:^|_)(?:AVAILABLE|UNAVAILABLE|DEPRECATED|'
+                           r'GNUC|VAR|EXTERN|DECLS)(?:_|$)')
+
+# Macros which only declare the cleanup functions of g_auto and
+# g_autoptr, which aren't part of the API
+_CLEANUP_MACROS = frozenset((
+    'G_DEFINE_AUTOPTR_CLEANUP_FUNC', 'G_DEFINE_AUTO_CLEANUP_CLEAR_FUNC',
+    'G_DEFINE_AUTO_CLEANUP_FREE_FUNC'))
+
+_DECLARE_TYPE_MACROS = frozenset((
+    'G_DECLARE_FINAL_TYPE', 'G_DECLARE_DERIVABLE_TYPE',
+    'G_DECLARE_INTERFACE'))
+
+_KEYWORDS = frozenset((
+    'auto', 'break', 'case', 'char', 'const', 'continue', 'default', 'do',
+    'double', 'else', 'enum', 'extern', 'float', 'for', 'goto', 'if',
+    'inline', 'int', 'long', 'register', 'restrict', 'return', 'short',
+    'signed', 'sizeof', 'static', 'struct', 'switch', 'typedef', 'union',
+    'unsigned', 'void', 'volatile', 'while', '__inline', '__inline__',
+    '__restrict', '__extension__', '__attribute__'))
+
+_TAG_KEYWORDS = ('struct', 'union', 'enum')
+
+
+def _is_name(token):
+    return token[0] == 'identifier' and token[1] not in _KEYWORDS
+
+
+def _is_macro_name(token):
+    return _is_name(token) and _MACRO_NAME_RE.match(token[1])
+
+
+def _is_decorator(token):
+    return _is_macro_name(token) and _DECORATOR_RE.search(token[1])
+
+
+def _split_arguments(tokens):
+    """Splits `tokens`, starting with a parenthesis, at its match.
+
+    Returns the top-level arguments between the parentheses, as lists of
+    tokens, and the tokens following the closing one.
+    """
+    args = [[]]
+    depth = 0
+    for i, token in enumerate(tokens):
+        text = token[1]
+        if text in ')]}':
+            depth -= 1
+            if depth == 0:
+                return args, tokens[i + 1:]
+        if depth == 1 and text == ',':
+            args.append([])
+        elif depth >= 1:
+            args[-1].append(token)
+        if text in '([{':
+            depth += 1
+    return None, []
+
+
+def _get_declared_type_names(macro, args):
+    """The names G_DECLARE_* `macro` declares given its arguments."""
+    type_name, func_prefix, module, obj_name = args[:4]
+    names = [type_name, '%s_get_type' % func_prefix,
+             '%s_%s' % (module, obj_name), '%s_IS_%s' % (module, obj_name)]
+    if macro == 'G_DECLARE_INTERFACE':
+        names += [type_name + 'Interface',
+                  '%s_%s_GET_IFACE' % (module, obj_name)]
+    else:
+        names.append(type_name + 'Class')
+    if macro == 'G_DECLARE_DERIVABLE_TYPE':
+        names += ['%s_%s_CLASS' % (module, obj_name),
+                  '%s_IS_%s_CLASS' % (module, obj_name),
+                  '%s_%s_GET_CLASS' % (module, obj_name)]
+    return names
+
+
+class HeaderScan(object):
+    """What `scan_header` found in a header.
+
+    Attributes:
+        names: dict, the names the header declares, whether they are
+            functions, variables, typedefs, enumeration members or
+            macros, to the line they are declared at.
+        texts: dict, the names of the macros, typedefs, structures,
+            unions and enumerations the header defines to the text of
+            their definition. Structures, unions and enumerations are
+            found by their tag as well as by their typedef name.
+        comments: list, (text, first line, last line) of the gtk-doc
+            comments of the header.
+        unclassified: list, (line, description) of what the scan
+            couldn't tell the declared names of: conditional code, macro
+            invocations, declarations it doesn't understand. The names
+            of a header with such contents aren't all known.
+    """
+    def __init__(self):
+        self.names = {}
+        self.texts = {}
+        self.comments = []
+        self.unclassified = []
+
+
+class _HeaderScanner(object):
+    def __init__(self, source):
+        self.source = source
+        self.scan = HeaderScan()
+        self.__newlines = [m.start() for m in re.finditer('\n', source)]
+        # typedef names -> the tags they name, and the tags defined
+        self.__typedef_tags = {}
+        self.__defined_tags = set()
+        self.__end = 0
+        # (condition, always compiled) of the open conditionals, the
+        # include guard and __cplusplus checks are always compiled
+        self.__conditionals = []
+        self.__guard = None
+        self.__seen_code = False
+
+    def get_lineno(self, offset):
+        return bisect_right(self.__newlines, offset - 1) + 1
+
+    def __add_unclassified(self, offset, description):
+        self.scan.unclassified.append((self.get_lineno(offset), description))
+
+    def __check_unconditional(self, offset):
+        if not all(always for _, always in self.__conditionals):
+            self.__add_unclassified(offset, 'conditional declaration')
+            # Only report the first declaration of the conditional
+            self.__conditionals = [(condition, True) for condition, _ in
+                                   self.__conditionals]
+
+    def __add_directive(self, text, offset):
+        match = _DIRECTIVE_RE.match(text)
+        directive, rest = match.groups()
+        rest = rest.strip()
+        if directive in ('if', 'ifdef', 'ifndef'):
+            is_guard = directive == 'ifndef' and not self.__seen_code and \
+                not self.__conditionals and self.__guard is None
+            if is_guard:
+                self.__guard = rest
+            self.__conditionals.append(
+                (rest, is_guard or '__cplusplus' in rest))
+        elif directive in ('elif', 'else'):
+            if self.__conditionals:
+                condition = rest or self.__conditionals[-1][0]
+                self.__conditionals[-1] = (condition,
+                                           '__cplusplus' in condition)
+        elif directive == 'endif':
+            if self.__conditionals:
+                self.__conditionals.pop()
+        elif directive == 'define':
+            self.__add_define(rest, text, offset)
+
+    def __add_define(self, rest, text, offset):
+        match = _DEFINE_RE.match(rest)
+        if match is None:
+            self.__add_unclassified(offset, text.strip())
+            return
+        name, params, body = match.groups()
+        if name == self.__guard and not params and not body.strip():
+            return
+        self.__check_unconditional(offset)
+        self.scan.names[name] = self.get_lineno(offset)
+        self.scan.texts[name] = text.strip()
+
+    def __add_name(self, token):
+        self.scan.names.setdefault(token[1], self.get_lineno(token[2]))
+
+    def __add_enum_members(self, tokens):
+        depth = 0
+        expect_member = False
+        for token in tokens:
+            text = token[1]
+            if text in '([{':
+                depth += 1
+                expect_member = depth == 1 and text == '{'
+            elif text in ')]}':
+                depth -= 1
+            elif depth == 1 and text == ',':
+                expect_member = True
+            elif expect_member and token[0] == 'identifier':
+                self.__add_name(token)
+                expect_member = False
+
+    def __get_text(self, tokens):
+        return self.source[tokens[0][2]:self.__end]
+
+    def __add_typedef(self, tokens, outer):
+        text = self.__get_text(tokens)
+        name = None
+        depth = 0
+        for i, token in enumerate(tokens):
+            # typedef ret (*name) (...), or typedef ret (name) (...)
+            if token[1] == '(' and depth == 0:
+                following = [t for t in tokens[i + 1:i + 3] if t[1] != '*']
+                if following and _is_name(following[0]):
+                    name = following[0]
+                break
+            if token[1] in '([{':
+                depth += 1
+            elif token[1] in ')]}':
+                depth -= 1
+        if name is None:
+            names = [t for t in outer[1:] if _is_name(t) and
+                     not _is_decorator(t)]
+            if not names:
+                self.__add_unclassified(tokens[0][2], text)
+                return
+            name = names[-1]
+
+        self.__add_name(name)
+        self.scan.texts[name[1]] = text
+        if len(outer) < 2 or outer[1][1] not in _TAG_KEYWORDS:
+            return
+        if len(outer) > 2 and _is_name(outer[2]) and outer[2] is not name:
+            self.__typedef_tags[name[1]] = outer[2][1]
+        if outer[1][1] == 'enum':
+            self.__add_enum_members(tokens)
+
+    def __strip_macros(self, tokens):
+        # Drop the macros declarations start with, along with their
+        # arguments, they may be left from lines which don't end with a
+        # semicolon as well. Returns None if one of them may declare
+        # names.
+        while tokens and _is_macro_name(tokens[0]):
+            macro = tokens[0]
+            args, rest = None, tokens[1:]
+            if rest and rest[0][1] == '(':
+                args, rest = _split_arguments(rest)
+
+            if macro[1] in _DECLARE_TYPE_MACROS and args is not None and \
+                    len(args) == 5 and all(len(arg) == 1 for arg in args):
+                for name in _get_declared_type_names(
+                        macro[1], [arg[0][1] for arg in args]):
+                    self.scan.names.setdefault(
+                        name, self.get_lineno(macro[2]))
+            elif macro[1] not in _CLEANUP_MACROS and \
+                    not _is_decorator(macro):
+                self.__add_unclassified(macro[2], 'macro %s' % macro[1])
+                return None
+            tokens = rest
+        return tokens
+
+    def __add_declaration(self, tokens):
+        self.__end = tokens[-1][2] + len(tokens[-1][1])
+        self.__seen_code = True
+        self.__check_unconditional(tokens[0][2])
+        if tokens[-1][1] == ';':
+            tokens = tokens[:-1]
+
+        tokens = self.__strip_macros(tokens)
+        if not tokens:
+            return
+
+        depth = 0
+        outer = []
+        for token in tokens:
+            text = token[1]
+            if text in ')]}':
+                depth -= 1
+            if depth == 0:
+                outer.append(token)
+            if text in '([{':
+                depth += 1
+
+        first = tokens[0][1]
+        if first == 'typedef':
+            self.__add_typedef(tokens, outer)
+            return
+
+        if first in _TAG_KEYWORDS:
+            # Forward declaration of a tag
+            if len(outer) == 2 and _is_name(outer[1]):
+                return
+            if any(t[1] == '{' for t in outer):
+                if _is_name(outer[1]):
+                    self.scan.texts[outer[1][1]] = self.__get_text(tokens)
+                    self.__defined_tags.add(outer[1][1])
+                if first == 'enum':
+                    self.__add_enum_members(tokens)
+                # Nothing but attributes may follow the definition
+                closing = max(i for i, t in enumerate(outer) if t[1] == '}')
+                if all(_is_decorator(t) for t in outer[closing + 1:]):
+                    return
+                self.__add_unclassified(tokens[0][2],
+                                        self.__get_text(tokens))
+                return
+
+        for i, token in enumerate(outer):
+            if token[1] != '(' or i < 2:
+                continue
+            name, previous = outer[i - 1], outer[i - 2]
+            if _is_name(name) and (previous[0] == 'identifier' or
+                                   previous[1] == '*'):
+                self.__add_name(name)
+                return
+
+        # Anything else declaring a name is a variable
+        names = [t for t in outer if _is_name(t) and not _is_decorator(t)]
+        if names and all(token[1] != '(' for token in outer):
+            self.__add_name(names[-1])
+            return
+
+        self.__add_unclassified(tokens[0][2], self.__get_text(tokens))
+
+    def run(self):
+        statement = []
+        depth = 0
+        # extern "C" blocks don't count as nesting
+        extern_blocks = 0
+        for match in _TOKEN_RE.finditer(self.source):
+            kind = match.lastgroup
+            text = match.group()
+            offset = match.start()
+            if kind == 'comment':
+                if text.startswith('/**') and not text.startswith('/***'):
+                    self.scan.comments.append((
+                        text, self.get_lineno(offset),
+                        self.get_lineno(match.end())))
+                continue
+            if kind == 'directive':
+                self.__add_directive(text, offset)
+                continue
+            if kind == 'line_comment':
+                continue
+
+            token = (kind, text, offset)
+            if text == '{' and depth == 0 and len(statement) == 2 and \
+                    statement[0][1] == 'extern' and \
+                    statement[1][0] == 'string':
+                extern_blocks += 1
+                statement = []
+                continue
+            if text == '}' and depth == 0:
+                if extern_blocks:
+                    extern_blocks -= 1
+                else:
+                    self.__add_unclassified(offset, 'unbalanced braces')
+                statement = []
+                continue
+
+            statement.append(token)
+            if text in '([{':
+                depth += 1
+            elif text in ')]}':
+                depth -= 1
+                # The end of the body of an inline function
+                if depth == 0 and text == '}' and \
+                        self.__is_function_body(statement):
+                    self.__add_declaration(statement)
+                    statement = []
+            elif text == ';' and depth == 0:
+                self.__add_declaration(statement)
+                statement = []
+
+        # Typically G_END_DECLS, which doesn't end with a semicolon
+        if statement:
+            self.__add_declaration(statement)
+        if depth or extern_blocks or self.__conditionals:
+            self.__add_unclassified(len(self.source),
+                                    'unbalanced braces or conditionals')
+
+        # The text of typedefs of structures is that of the structure
+        for name, tag in self.__typedef_tags.iteritems():
+            if tag in self.__defined_tags:
+                self.scan.texts[name] = self.scan.texts[tag]
+        return self.scan
+
+    @staticmethod
+    def __is_function_body(statement):
+        depth = 0
+        for i, token in enumerate(statement):
+            if token[1] == '{' and depth == 0:
+                return i > 0 and statement[i - 1][1] == ')'
+            if token[1] in '([{':
+                depth += 1
+            elif token[1] in ')]}':
+                depth -= 1
+        return False
+
+
+def scan_header(path):
+    """Returns the `HeaderScan` of header `path`.
+
+    Preprocessor conditionals aren't evaluated. Apart from the include
+    guard and `__cplusplus` checks, declarations in conditionals are
+    reported as unclassified, as are the macro invocations which may
+    declare names and the statements the scan doesn't understand.
+    """
+    with open(path, 'r') as _:
+        source = _.read()
+    return _HeaderScanner(source).run()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""The class hierarchies of the classes in a `gir_index.GirRepository`.
+
+Gir class nodes only know about their parent. `GirHierarchy` resolves
+every parent once, in a single pass over the class nodes, and derives
+the children of classes from that. Ancestor lists are computed on demand
+and memoized, so that classes share the lists of their ancestors rather
+than walking up to the root themselves.
+
+Each class is represented by a single `QualifiedSymbol`, shared by all
+the hierarchies and children maps it appears in.
+"""
+
+from collections import defaultdict
+
+from hotdoc.core.symbols import QualifiedSymbol
+from hotdoc.core.links import Link
+
+
+def _qualify(name, namespace):
+    if '.' in name:
+        return name
+    return '%s.%s' % (namespace, name)
+
+
+class GirHierarchy(object):
+    """Parents and children of gir classes, by gi name."""
+    def __init__(self, gir_repo):
+        self.__gir_repo = gir_repo
+        self.__klasses = {}
+        self.__parents = {}
+        self.__symbols = {}
+        self.__hierarchies = {}
+        self.__children = defaultdict(dict)
+
+    def build(self):
+        """Links every class node of the repository to its parent."""
+        # Looking up parents may load more namespaces, iterate on a copy
+        for gi_name, klass in self.__gir_repo.get_class_nodes().items():
+            self.__add_class(gi_name, klass)
+
+    def __get_class(self, gi_name):
+        klass = self.__klasses.get(gi_name)
+        if klass is None:
+            klass = self.__gir_repo.get_class(gi_name)
+            if klass is not None:
+                self.__add_class(gi_name, klass)
+        return klass
+
+    def __add_class(self, gi_name, klass):
+        if gi_name in self.__parents:
+            return
+
+        self.__klasses[gi_name] = klass
+        self.__parents[gi_name] = None
+
+        if not klass.parent:
+            return
+
+        parent_name = _qualify(klass.parent, klass.namespace)
+        if self.__get_class(parent_name) is None:
+            return
+
+        self.__parents[gi_name] = parent_name
+        self.__children[parent_name][klass.klass_name] = \
+            self.get_symbol(gi_name)
+
+    def get_parent(self, gi_name):
+        """The gi name of the parent class of `gi_name`, or `None`."""
+        if self.__get_class(gi_name) is None:
+            return None
+        return self.__parents.get(gi_name)
+
+    def get_symbol(self, gi_name):
+        """Returns the `QualifiedSymbol` standing for class `gi_name`."""
+        sym = self.__symbols.get(gi_name)
+        if sym is None:
+            klass_name = self.__get_class(gi_name).klass_name
+            link = Link(None, klass_name, klass_name)
+            sym = QualifiedSymbol(type_tokens=[link])
+            self.__symbols[gi_name] = sym
+        return sym
+
+    def get_hierarchy(self, gi_name):
+        """The symbols of the ancestors of `gi_name`, root first."""
+        hierarchy = self.__hierarchies.get(gi_name)
+        if hierarchy is not None:
+            return hierarchy
+
+        if self.__get_class(gi_name) is None:
+            return []
+
+        # Walk up to the first ancestor whose hierarchy is known
+        chain = []
+        cur = gi_name
+        while cur is not None and cur not in self.__hierarchies:
+            chain.append(cur)
+            cur = self.__parents.get(cur)
+
+        hierarchy = self.__hierarchies[cur] if cur is not None else None
+        for name in reversed(chain):
+            parent_name = self.__parents.get(name)
+            if parent_name is None:
+                hierarchy = []
+            else:
+                hierarchy = hierarchy + [self.get_symbol(parent_name)]
+            self.__hierarchies[name] = hierarchy
+
+        return hierarchy
+
+    def get_children(self, gi_name):
+        """The symbols of the direct subclasses of `gi_name`, by C name."""
+        return self.__children.get(gi_name, {})
@@ -0,0 +1,843 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Indexing of gir files.
+
+The extension only ever looks at a small subset of a gir file:
+identifiers, types, class hierarchies and the parameters of
+callables. This module extracts that subset into compact records,
+which unlike lxml elements can be pickled and cached across runs.
+
+Gir files are read with `lxml.etree.iterparse`, and elements are
+discarded as soon as they have been indexed, so that memory usage
+stays bounded by the size of the largest class rather than the size
+of the whole file.
+"""
+
+from lxml import etree
+
+
+NS_CORE = 'http://www.gtk.org/introspection/core/1.0'
+NS_C = 'http://www.gtk.org/introspection/c/1.0'
+NS_GLIB = 'http://www.gtk.org/introspection/glib/1.0'
+
+NSMAP = {'core': NS_CORE, 'c': NS_C, 'glib': NS_GLIB}
+
+_NAMESPACE_TAG = '{%s}namespace' % NS_CORE
+_INCLUDE_TAG = '{%s}include' % NS_CORE
+_PROPERTY_TAG = '{%s}property' % NS_CORE
+_SIGNAL_TAG = '{%s}signal' % NS_GLIB
+_VMETHOD_TAG = '{%s}virtual-method' % NS_CORE
+_CALLBACK_TAG = '{%s}callback' % NS_CORE
+_CLASS_TAGS = ('{%s}class' % NS_CORE, '{%s}interface' % NS_CORE)
+_TYPE_TAG = '{%s}type' % NS_CORE
+_ARRAY_TAG = '{%s}array' % NS_CORE
+_VARARGS_TAG = '{%s}varargs' % NS_CORE
+# These carry a c:type, but describe a reference to a type, not a type
+_TYPE_REF_TAGS = (_TYPE_TAG, _ARRAY_TAG)
+
+# The elements we index, and those that can contain them. Letting lxml
+# filter out the rest (docs, types, parameters...) spares us the vast
+# majority of the parse events.
+_WALKED_TAGS = tuple(
+    ['{%s}%s' % (NS_CORE, tag) for tag in (
+        'repository', 'include', 'namespace', 'alias', 'constant',
+        'enumeration', 'bitfield', 'member', 'record', 'union', 'field',
+        'class', 'interface', 'callback', 'function', 'function-macro',
+        'function-inline', 'method', 'constructor', 'virtual-method',
+        'property')] +
+    ['{%s}%s' % (NS_GLIB, tag) for tag in ('boxed', 'signal')])
+
+_C_IDENTIFIER = '{%s}identifier' % NS_C
+_C_TYPE = '{%s}type' % NS_C
+_C_SYMBOL_PREFIX = '{%s}symbol-prefix' % NS_C
+_GLIB_TYPE_NAME = '{%s}type-name' % NS_GLIB
+_GLIB_GET_TYPE = '{%s}get-type' % NS_GLIB
+_GLIB_TYPE_STRUCT = '{%s}type-struct' % NS_GLIB
+_GLIB_IS_GTYPE_STRUCT_FOR = '{%s}is-gtype-struct-for' % NS_GLIB
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+class UnknownField(object):
+    """The value of the fields which the nodes of a `PartialGirIndex`
+    can't tell, see `GirRepository.get_complete_node`.
+
+    The class itself is the value, so that it survives pickling.
+    """
+    pass
+
+
+class GirParameter(object):
+    """The type of a parameter, return value or property."""
+    __slots__ = ('name', 'direction', 'c_type', 'type_name')
+
+    def __init__(self, name, direction, c_type, type_name):
+        self.name = name
+        self.direction = direction
+        self.c_type = c_type
+        self.type_name = type_name
+
+
+class GirNode(object):
+    """Base record for the gir nodes the extension looks up."""
+    __slots__ = ('tag', 'name', 'namespace', 'gi_name', 'c_identifier',
+                 'c_type', 'introspectable')
+
+    def __init__(self, tag, name, namespace, gi_name, c_identifier=None,
+                 c_type=None, introspectable=True):
+        self.tag = tag
+        self.name = name
+        self.namespace = namespace
+        self.gi_name = gi_name
+        self.c_identifier = c_identifier
+        self.c_type = c_type
+        self.introspectable = introspectable
+
+
+class GirCallable(GirNode):
+    """A function, method, constructor, callback, signal or vfunc."""
+    __slots__ = ('throws', 'instance_parameter', 'parameters',
+                 'return_value', 'when', 'no_hooks')
+
+    def __init__(self, *args, **kwargs):
+        GirNode.__init__(self, *args, **kwargs)
+        self.throws = False
+        self.instance_parameter = None
+        self.parameters = ()
+        self.return_value = None
+        self.when = None
+        self.no_hooks = False
+
+
+class GirProperty(GirNode):
+    """A GObject property."""
+    __slots__ = ('type_', 'writable', 'construct', 'construct_only')
+
+    def __init__(self, *args, **kwargs):
+        GirNode.__init__(self, *args, **kwargs)
+        self.type_ = None
+        self.writable = False
+        self.construct = False
+        self.construct_only = False
+
+
+class GirType(GirNode):
+    """A node declaring a C type: class, interface, record, enum..."""
+    __slots__ = ('type_name', 'parent', 'type_struct', 'is_gtype_struct_for',
+                 'disguised', 'implements', 'signals', 'properties',
+                 'virtual_methods')
+
+    def __init__(self, *args, **kwargs):
+        GirNode.__init__(self, *args, **kwargs)
+        self.type_name = None
+        self.parent = None
+        self.type_struct = None
+        self.is_gtype_struct_for = None
+        self.disguised = False
+        self.implements = ()
+        self.signals = ()
+        self.properties = ()
+        self.virtual_methods = ()
+
+    @property
+    def klass_name(self):
+        return self.c_type or self.type_name
+
+
+class GirHeader(object):
+    """What a gir file declares before its namespace contents."""
+    def __init__(self, namespace, version, identifier_prefixes=(),
+                 symbol_prefixes=()):
+        self.namespace = namespace
+        self.version = version
+        self.identifier_prefixes = identifier_prefixes
+        self.symbol_prefixes = symbol_prefixes
+        self.includes = []
+
+
+class GirIndex(GirHeader):
+    """All the nodes of a single gir file the extension looks up."""
+    def __init__(self, *args, **kwargs):
+        GirHeader.__init__(self, *args, **kwargs)
+        self.nodes = {}
+        self.class_nodes = {}
+        self.get_type_functions = set()
+        self.smart_filters = set()
+        # C names to the names of the nodes in other languages. Only
+        # the javascript names which aren't the python name are stored,
+        # the C name of a node is its key.
+        self.python_names = {}
+        self.javascript_names = {}
+        # The keys of the nodes which are not introspectable, either
+        # because they're marked as such or because they refer to types
+        # of this namespace which are.
+        self.non_introspectable = set()
+        # The gi names of the types which are marked not introspectable
+        self.non_introspectable_types = set()
+        # Node keys -> gi names of the types of other namespaces they
+        # refer to, whose introspectability is only known to those
+        self.foreign_type_refs = {}
+
+
+class PartialGirIndex(GirIndex):
+    """An index holding only some of the nodes of `gir_file`.
+
+    The nodes it holds are accurate, lookups it can't answer are
+    answered by the complete index of `gir_file`, see `GirRepository`.
+    The fields of its nodes which it can't tell are `UnknownField`.
+    `type_names` are the gi names of the types it knows to be
+    introspectable.
+    """
+    def __init__(self, gir_file, *args, **kwargs):
+        GirIndex.__init__(self, *args, **kwargs)
+        self.gir_file = gir_file
+        self.type_names = set()
+
+
+def _get_slots(cls):
+    slots = []
+    for klass in reversed(cls.__mro__):
+        slots.extend(getattr(klass, '__slots__', ()))
+    return slots
+
+
+def get_record_state(record):
+    """Returns the contents of `record` as nested tuples.
+
+    Two records have the same state if and only if they describe the
+    same gir node, which makes states suitable for comparing indexes of
+    different versions of a gir file.
+    """
+    if isinstance(record, (GirParameter, GirNode)):
+        return (type(record).__name__,) + tuple(
+            get_record_state(getattr(record, slot))
+            for slot in _get_slots(type(record)))
+    if isinstance(record, (tuple, list)):
+        return tuple(get_record_state(item) for item in record)
+    return record
+
+
+def _iter_type_refs(node):
+    if isinstance(node, GirCallable):
+        params = list(node.parameters)
+        params.append(node.instance_parameter)
+        params.append(node.return_value)
+    elif isinstance(node, GirProperty):
+        params = [node.type_]
+    else:
+        return
+
+    for param in params:
+        if param is not None and param.type_name is not None:
+            yield param.type_name
+
+
+class _Context(object):
+    """What the indexer knows about an open element and its ancestors."""
+    __slots__ = ('gi_name', 'klass_name', 'children')
+
+    def __init__(self, gi_name, klass_name):
+        self.gi_name = gi_name
+        self.klass_name = klass_name
+        # Records of the signals, properties and vfuncs seen so far
+        self.children = None
+
+
+class _GirIndexer(object):
+    """Indexes a gir file in a single streaming pass.
+
+    Rather than looking up the ancestors of an element, which is what
+    the namespace, gi name and class name of a node depend on, these
+    are pushed to a context stack as elements start, and handlers are
+    dispatched on the tag of elements as they end.
+    """
+    def __init__(self):
+        self.index = None
+        self.__ns_name = None
+        self.__sym_prefixes = None
+        self.__strings = {}
+        self.__stack = []
+        self.__handlers = {
+            _PROPERTY_TAG: self.__index_property,
+            _SIGNAL_TAG: self.__index_signal,
+            _VMETHOD_TAG: self.__index_vmethod,
+            _CALLBACK_TAG: self.__index_callback,
+        }
+        for tag in _CLASS_TAGS:
+            self.__handlers[tag] = self.__index_class
+
+    def __intern(self, string):
+        if string is None:
+            return None
+        return self.__strings.setdefault(string, string)
+
+    def __make_parameter(self, elem):
+        # Parameters hold a single type, array or varargs element, arrays
+        # are described by the type of their elements. Looking at each
+        # child once is much cheaper than a find() per tag.
+        c_type = type_name = None
+        type_ = elem
+        while type_ is not None:
+            parent, type_ = type_, None
+            for child in parent:
+                tag = child.tag
+                if tag == _TYPE_TAG:
+                    c_type = child.get(_C_TYPE)
+                    type_name = child.get('name')
+                elif tag == _ARRAY_TAG:
+                    type_ = child
+                elif tag == _VARARGS_TAG:
+                    c_type = '...'
+                    type_name = 'valist'
+                else:
+                    continue
+                break
+
+        intern = self.__intern
+        return GirParameter(intern(elem.attrib.get('name')),
+                            intern(elem.attrib.get('direction') or 'in'),
+                            intern(c_type), intern(type_name))
+
+    def __make_node(self, cls, elem, context):
+        attrib = elem.attrib
+        intern = self.__intern
+        return cls(intern(_local_name(elem.tag)),
+                   intern(attrib.get('name')),
+                   self.__ns_name,
+                   context.gi_name,
+                   c_identifier=attrib.get(_C_IDENTIFIER),
+                   c_type=attrib.get(_C_TYPE),
+                   introspectable=attrib.get('introspectable') != '0')
+
+    def __make_callable(self, elem, context):
+        node = self.__make_node(GirCallable, elem, context)
+        attrib = elem.attrib
+
+        params = elem.find('{%s}parameters' % NS_CORE)
+        if params is not None:
+            instance_param = params.find('{%s}instance-parameter' % NS_CORE)
+            if instance_param is not None:
+                node.instance_parameter = self.__make_parameter(
+                    instance_param)
+            node.parameters = tuple(
+                self.__make_parameter(param) for param in
+                params.iterchildren('{%s}parameter' % NS_CORE))
+
+        retval = elem.find('{%s}return-value' % NS_CORE)
+        if retval is not None:
+            node.return_value = self.__make_parameter(retval)
+
+        node.throws = 'throws' in attrib
+        node.when = self.__intern(attrib.get('when'))
+        node.no_hooks = attrib.get('no-hooks') == '1'
+        return node
+
+    def __make_type(self, elem, context):
+        node = self.__make_node(GirType, elem, context)
+        attrib = elem.attrib
+        intern = self.__intern
+        node.type_name = attrib.get(_GLIB_TYPE_NAME)
+        node.parent = intern(attrib.get('parent'))
+        node.type_struct = attrib.get(_GLIB_TYPE_STRUCT)
+        node.is_gtype_struct_for = intern(attrib.get(_GLIB_IS_GTYPE_STRUCT_FOR))
+        node.disguised = attrib.get('disguised') == '1'
+        node.implements = tuple(
+            intern(impl.attrib['name']) for impl in
+            elem.iterchildren('{%s}implements' % NS_CORE))
+
+        children = context.children
+        if children:
+            node.signals = tuple(children[_SIGNAL_TAG])
+            node.properties = tuple(children[_PROPERTY_TAG])
+            node.virtual_methods = tuple(children[_VMETHOD_TAG])
+        return node
+
+    def __add_member(self, elem, fmt, node):
+        parent = self.__stack[-2]
+        name = fmt % (parent.klass_name, elem.attrib['name'])
+        self.index.nodes[name] = node
+
+        if parent.children is None:
+            parent.children = {_SIGNAL_TAG: [], _PROPERTY_TAG: [],
+                               _VMETHOD_TAG: []}
+        parent.children[elem.tag].append(node)
+
+    def __index_property(self, elem, context):
+        node = self.__make_node(GirProperty, elem, context)
+        attrib = elem.attrib
+        node.type_ = self.__make_parameter(elem)
+        node.writable = attrib.get('writable') == '1'
+        node.construct = attrib.get('construct') == '1'
+        node.construct_only = attrib.get('construct-only') == '1'
+        self.__add_member(elem, '%s:%s', node)
+        return True
+
+    def __index_signal(self, elem, context):
+        self.__add_member(elem, '%s::%s', self.__make_callable(elem, context))
+        return True
+
+    def __index_vmethod(self, elem, context):
+        self.__add_member(elem, '%s:::%s', self.__make_callable(elem, context))
+        return True
+
+    def __index_callback(self, elem, context):
+        c_type = elem.attrib.get(_C_TYPE)
+        if c_type is None:
+            return False
+        self.index.nodes[c_type] = self.__make_callable(elem, context)
+        return True
+
+    def __index_class(self, elem, context):
+        index = self.index
+        attrib = elem.attrib
+        c_type = attrib.get(_C_TYPE)
+        if c_type is None:
+            return False
+
+        node = self.__make_type(elem, context)
+        index.nodes[c_type] = node
+        index.nodes['%s::%s' % (c_type, c_type)] = node
+        index.class_nodes[node.gi_name] = node
+        index.get_type_functions.add(attrib.get(_GLIB_GET_TYPE))
+
+        sym_prefix = attrib[_C_SYMBOL_PREFIX]
+        for pattern in ('%s_IS_%s', '%s_TYPE_%s', '%s_%s', '%s_%s_CLASS',
+                        '%s_IS_%s_CLASS', '%s_%s_GET_CLASS',
+                        '%s_%s_GET_IFACE'):
+            index.smart_filters.add(
+                (pattern % (self.__sym_prefixes, sym_prefix)).upper())
+        return True
+
+    def __index_other(self, elem, context):
+        attrib = elem.attrib
+
+        c_identifier = attrib.get(_C_IDENTIFIER)
+        if c_identifier is not None:
+            self.index.nodes[c_identifier] = self.__make_callable(elem,
+                                                                  context)
+            return True
+
+        c_type = attrib.get(_C_TYPE)
+        if c_type is None or elem.tag in _TYPE_REF_TAGS:
+            return False
+
+        self.index.nodes[c_type] = self.__make_type(elem, context)
+        return True
+
+    def __start(self, elem):
+        name = elem.get('name')
+        if name is None:
+            gi_name = None
+        else:
+            parent_gi_name = self.__stack[-1].gi_name if self.__stack else None
+            if parent_gi_name is None:
+                gi_name = name
+            else:
+                gi_name = '%s.%s' % (parent_gi_name, name)
+
+        klass_name = elem.get(_C_TYPE) or elem.get(_GLIB_TYPE_NAME)
+        self.__stack.append(_Context(gi_name, klass_name))
+
+    def run(self, gir_file):
+        includes = []
+        # repository > namespace > top-level nodes
+        toplevel_depth = 3
+        handlers = self.__handlers
+        stack = self.__stack
+
+        for event, elem in etree.iterparse(gir_file, events=('start', 'end'),
+                                           tag=_WALKED_TAGS):
+            if event == 'start':
+                self.__start(elem)
+                if len(stack) != 2:
+                    continue
+
+                if elem.tag == _NAMESPACE_TAG:
+                    self.__ns_name = elem.attrib['name']
+                    self.__sym_prefixes = elem.attrib[
+                        '{%s}symbol-prefixes' % NS_C]
+                    self.index = _make_header(GirIndex, elem)
+                    self.index.includes = includes
+                elif elem.tag == _INCLUDE_TAG:
+                    includes.append((elem.attrib['name'],
+                                     elem.attrib['version']))
+                continue
+
+            depth = len(stack)
+            context = stack[-1]
+
+            if depth >= toplevel_depth and self.index is not None:
+                handler = handlers.get(elem.tag, self.__index_other)
+                if handler(elem, context):
+                    elem.clear()
+
+                # Top-level nodes are fully indexed once they end, drop them
+                if depth == toplevel_depth:
+                    elem.clear()
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+
+            stack.pop()
+
+        if self.index is not None:
+            finish_index(self.index)
+
+        return self.index
+
+
+def _add_translations(gir_index):
+    python_names = gir_index.python_names
+    javascript_names = gir_index.javascript_names
+    for name, node in gir_index.nodes.iteritems():
+        gi_name = node.gi_name
+        if gi_name is None:
+            continue
+
+        if node.c_identifier:
+            python_names[name] = gi_name
+            javascript_names[name] = '%s.prototype.%s' % \
+                tuple(gi_name.rsplit('.', 1))
+        elif node.c_type:
+            python_names[name] = gi_name
+
+
+def _add_introspectability(gir_index):
+    ns_prefix = gir_index.namespace + '.'
+    qualified_names = {}
+
+    for node in gir_index.nodes.itervalues():
+        if not node.introspectable and (isinstance(node, GirType) or
+                                        node.tag == 'callback'):
+            gir_index.non_introspectable_types.add(node.gi_name)
+
+    for name, node in gir_index.nodes.iteritems():
+        if not node.introspectable:
+            gir_index.non_introspectable.add(name)
+            continue
+
+        foreign = []
+        for type_name in _iter_type_refs(node):
+            if '.' not in type_name:
+                type_name = qualified_names.setdefault(
+                    type_name, ns_prefix + type_name)
+
+            if not type_name.startswith(ns_prefix):
+                foreign.append(type_name)
+            elif type_name in gir_index.non_introspectable_types:
+                gir_index.non_introspectable.add(name)
+                break
+        else:
+            if foreign:
+                gir_index.foreign_type_refs[name] = tuple(foreign)
+
+
+def finish_index(gir_index):
+    """Fills the tables of `gir_index` which are derived from its nodes."""
+    _add_translations(gir_index)
+    _add_introspectability(gir_index)
+
+
+def _split_prefixes(elem, attr):
+    value = elem.attrib.get('{%s}%s' % (NS_C, attr))
+    if not value:
+        return ()
+    return tuple(value.split(','))
+
+
+def _make_header(cls, ns_elem):
+    return cls(ns_elem.attrib['name'], ns_elem.attrib.get('version'),
+               _split_prefixes(ns_elem, 'identifier-prefixes'),
+               _split_prefixes(ns_elem, 'symbol-prefixes'))
+
+
+def index_gir(gir_file):
+    """Parses `gir_file` and returns its `GirIndex`."""
+    return _GirIndexer().run(gir_file)
+
+
+def read_gir_header(gir_file):
+    """Returns the `GirHeader` of `gir_file`, without parsing the rest."""
+    includes = []
+    for _, elem in etree.iterparse(gir_file, events=('start',),
+                                   tag=(_INCLUDE_TAG, _NAMESPACE_TAG)):
+        if elem.tag == _INCLUDE_TAG:
+            includes.append((elem.attrib['name'], elem.attrib['version']))
+        else:
+            header = _make_header(GirHeader, elem)
+            header.includes = includes
+            return header
+    return None
+
+
+def _match_length(header, name):
+    length = 0
+    for prefix in header.identifier_prefixes:
+        if name.startswith(prefix):
+            length = max(length, len(prefix))
+    for prefix in header.symbol_prefixes:
+        if name.startswith(prefix + '_') or \
+                name.startswith(prefix.upper() + '_'):
+            length = max(length, len(prefix))
+    return length
+
+
+class GirRepository(object):
+    """The indexes of a set of gir files, looked up as a whole.
+
+    Namespaces can be registered from their `GirHeader` only, in which
+    case they are loaded with `loader` the first time a lookup reaches
+    into them: by gi name for classes, or for C names, when the
+    namespace has the longest identifier or symbol prefix matching it.
+
+    Likewise, a `PartialGirIndex` is replaced with the complete index of
+    its gir file, loaded with `loader`, when a lookup it can't answer
+    reaches into its namespace.
+
+    The nodes of indexes aren't merged, as some indexes only decode their
+    nodes on demand (see `gir_cache.MappedGirIndex`). Lookups go through
+    the indexes, the latest one first, and their results are memoized.
+    """
+    def __init__(self, loader):
+        self.__loader = loader
+        self.__indexes = []
+        self.__nodes = {}
+        self.__class_nodes = {}
+        self.__python_names = {}
+        self.__javascript_names = {}
+        self.__introspectable = {}
+        self.__introspectable_types = {}
+        self.__headers = []
+        self.__pending = {}
+        self.__misses = set()
+        self.get_type_functions = set()
+        self.smart_filters = set()
+
+    def __add_index(self, gir_index):
+        self.__indexes.insert(0, gir_index)
+        if isinstance(gir_index, PartialGirIndex):
+            self.__pending[gir_index] = gir_index.gir_file
+        self.get_type_functions |= gir_index.get_type_functions
+        self.smart_filters |= gir_index.smart_filters
+        self.__clear_memos()
+
+    def __clear_memos(self):
+        self.__nodes.clear()
+        self.__class_nodes.clear()
+        self.__python_names.clear()
+        self.__javascript_names.clear()
+        self.__introspectable.clear()
+        self.__introspectable_types.clear()
+        self.__misses.clear()
+
+    def __lookup(self, memo, table_name, name):
+        try:
+            return memo[name]
+        except KeyError:
+            pass
+
+        node = None
+        for gir_index in self.__indexes:
+            node = getattr(gir_index, table_name).get(name)
+            if node is not None:
+                break
+
+        memo[name] = node
+        return node
+
+    def __load_pending(self, header):
+        gir_file = self.__pending.pop(header)
+        gir_index = self.__loader(gir_file)
+        if isinstance(header, PartialGirIndex):
+            self.replace(header, gir_index)
+            return
+        self.__headers[self.__headers.index(header)] = gir_index
+        self.__add_index(gir_index)
+
+    def add(self, gir_index):
+        """Adds an already loaded `GirIndex`."""
+        self.__headers.append(gir_index)
+        self.__add_index(gir_index)
+
+    def load(self, gir_file):
+        """Loads and adds the index of `gir_file`, which is returned."""
+        gir_index = self.__loader(gir_file)
+        self.add(gir_index)
+        return gir_index
+
+    def replace(self, old_index, new_index):
+        """Replaces loaded `old_index`, keeping its precedence."""
+        self.__indexes[self.__indexes.index(old_index)] = new_index
+        self.__headers[self.__headers.index(old_index)] = new_index
+        self.__pending.pop(old_index, None)
+        if isinstance(new_index, PartialGirIndex):
+            self.__pending[new_index] = new_index.gir_file
+        self.get_type_functions = set()
+        self.smart_filters = set()
+        for gir_index in self.__indexes:
+            self.get_type_functions |= gir_index.get_type_functions
+            self.smart_filters |= gir_index.smart_filters
+        self.__clear_memos()
+
+    def register(self, gir_file, header):
+        """Adds `gir_file`, to be loaded once a lookup needs it."""
+        self.__headers.append(header)
+        self.__pending[header] = gir_file
+        self.__misses.clear()
+
+    def get_node(self, name):
+        node = self.__lookup(self.__nodes, 'nodes', name)
+        if node is not None or not self.__pending or name in self.__misses:
+            return node
+
+        best = 0
+        owners = []
+        for header in self.__headers:
+            length = _match_length(header, name)
+            if length > best:
+                best = length
+                owners = [header]
+            elif length and length == best:
+                owners.append(header)
+
+        owners = [owner for owner in owners if owner in self.__pending]
+        if not owners:
+            self.__misses.add(name)
+            return None
+
+        for owner in owners:
+            self.__load_pending(owner)
+
+        return self.get_node(name)
+
+    def get_complete_node(self, name):
+        """Like `get_node`, but never returns a node with `UnknownField`
+        fields: the complete index of the partial index holding `name`
+        is loaded if needed."""
+        node = self.get_node(name)
+        if node is None:
+            return None
+
+        for gir_index in self.__indexes:
+            if gir_index.nodes.get(name) is node:
+                if gir_index in self.__pending:
+                    self.__load_pending(gir_index)
+                    return self.get_node(name)
+                break
+        return node
+
+    def get_class(self, gi_name):
+        node = self.__lookup(self.__class_nodes, 'class_nodes', gi_name)
+        if node is not None or not self.__pending:
+            return node
+
+        namespace = gi_name.split('.', 1)[0]
+        owners = [header for header in self.__pending
+                  if header.namespace == namespace]
+        if not owners:
+            return None
+
+        for owner in owners:
+            self.__load_pending(owner)
+
+        return self.__lookup(self.__class_nodes, 'class_nodes', gi_name)
+
+    def translate(self, name, language):
+        """Returns the name of C symbol `name` in `language`, or `None`.
+
+        Args:
+            name: str, the C name of a node, as in `get_node`.
+            language: str, one of 'c', 'python' or 'javascript'.
+        """
+        python_name = self.__lookup(self.__python_names, 'python_names', name)
+        if python_name is None:
+            # Maybe name belongs to a namespace which isn't loaded yet
+            if self.get_node(name) is None:
+                return None
+            python_name = self.__lookup(self.__python_names, 'python_names',
+                                        name)
+            if python_name is None:
+                return None
+
+        if language == 'c':
+            return name
+        if language == 'python':
+            return python_name
+        if language == 'javascript':
+            return self.__lookup(self.__javascript_names, 'javascript_names',
+                                 name) or python_name
+        return None
+
+    def __is_type_introspectable(self, gi_name):
+        try:
+            return self.__introspectable_types[gi_name]
+        except KeyError:
+            pass
+
+        namespace = gi_name.split('.', 1)[0]
+        for owner in [header for header in self.__pending
+                      if header.namespace == namespace]:
+            # Partial indexes know all the introspectable types
+            if isinstance(owner, PartialGirIndex) and \
+                    gi_name in owner.type_names:
+                continue
+            self.__load_pending(owner)
+
+        res = True
+        for gir_index in self.__indexes:
+            if gi_name in gir_index.non_introspectable_types:
+                res = False
+                break
+
+        self.__introspectable_types[gi_name] = res
+        return res
+
+    def is_introspectable(self, name):
+        """Whether node `name` is usable from introspection bindings.
+
+        Nodes which refer to types which are not introspectable, as
+        parameters, return values or property types, are not either.
+        Unknown nodes are not introspectable.
+        """
+        try:
+            return self.__introspectable[name]
+        except KeyError:
+            pass
+
+        node = self.get_node(name)
+        res = False
+        if node is not None:
+            for gir_index in self.__indexes:
+                if gir_index.nodes.get(name) is node:
+                    res = name not in gir_index.non_introspectable and all(
+                        self.__is_type_introspectable(type_name) for
+                        type_name in gir_index.foreign_type_refs.get(name,
+                                                                     ()))
+                    break
+
+        self.__introspectable[name] = res
+        return res
+
+    def get_class_nodes(self):
+        """The class and interface nodes of all loaded namespaces."""
+        class_nodes = {}
+        for gir_index in reversed(self.__indexes):
+            class_nodes.update(gir_index.class_nodes.iteritems())
+        return class_nodes
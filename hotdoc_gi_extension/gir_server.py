@@ -0,0 +1,541 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A local server of gir indexes, shared by concurrent hotdoc processes.
+
+`GirIndexServer` listens on a Unix socket, and owns the indexes of all
+the gir files its clients asked for, as well as the gtk-doc links. Each
+client opens a repository, an ordered list of gir files, which the
+server builds from the indexes it already holds. Clients with the same
+list of girs share the same repository, which is replaced when one of
+its gir files changes.
+
+`RemoteGirRepository` and `RemoteLinkIndex` are the client side: they
+answer the lookups the extension makes on `gir_index.GirRepository`
+and `gtkdoc_links.GtkDocLinkIndex`, and memoize the answers.
+
+Requests are encoded as JSON, so that the server never unpickles what
+it is sent. Replies hold gir nodes and are pickled: the socket lives in
+a directory only the user running the server can access, clients only
+connect to sockets in such directories. Run the server with:
+
+    python -m hotdoc_gi_extension.gir_server
+"""
+
+import os
+import sys
+import json
+import stat
+import errno
+import socket
+import struct
+import argparse
+import tempfile
+import threading
+import SocketServer
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from .gir_index import index_gir, read_gir_header, GirRepository
+from .gir_cache import SharedGirCache
+from .gtkdoc_links import GtkDocLinkIndex
+
+
+_LENGTH = struct.Struct('<I')
+
+
+class GirServerError(Exception):
+    """An error the server replied with."""
+    pass
+
+
+class StaleRepositoryError(GirServerError):
+    """The repository was replaced, as some of its gir files changed."""
+    pass
+
+
+def get_default_socket_path():
+    """The socket the server listens on, and clients connect to."""
+    folder = os.getenv('XDG_RUNTIME_DIR')
+    if not folder:
+        # The temporary directory is shared with other users
+        folder = os.path.join(tempfile.gettempdir(),
+                              'hotdoc-gi-index-%d' % os.getuid())
+    return os.path.join(folder, 'hotdoc-gi-index-%d.sock' % os.getuid())
+
+
+def _check_private_dir(folder):
+    """Raises `OSError` unless only the current user can access `folder`.
+    """
+    info = os.lstat(folder)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or \
+            info.st_mode & 0o077:
+        raise OSError(errno.EPERM, '%s is not a private directory' % folder)
+
+
+def _make_private_dir(folder):
+    try:
+        os.makedirs(folder, 0o700)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+    _check_private_dir(folder)
+
+
+def get_default_cache_folder():
+    """The folder the server caches gir indexes in."""
+    cache_home = os.getenv('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'hotdoc', 'gi-extension')
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError('Connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _send_data(sock, data):
+    sock.sendall(_LENGTH.pack(len(data)) + data)
+
+
+def _recv_data(sock):
+    size = _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))[0]
+    return _recv_exactly(sock, size)
+
+
+def _send_request(sock, method, args):
+    _send_data(sock, json.dumps([method, list(args)]))
+
+
+def _decode_strings(value):
+    # JSON only knows unicode strings, paths and names are byte strings
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [_decode_strings(item) for item in value]
+    return value
+
+
+def _recv_request(sock):
+    method, args = json.loads(_recv_data(sock))
+    return _decode_strings(method), _decode_strings(args)
+
+
+def _send_reply(sock, reply):
+    _send_data(sock, pickle.dumps(reply, pickle.HIGHEST_PROTOCOL))
+
+
+def _recv_reply(sock):
+    return pickle.loads(_recv_data(sock))
+
+
+def _is_serving(socket_path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+def _get_stat(path):
+    info = os.stat(path)
+    return (info.st_mtime, info.st_size)
+
+
+def make_gir_repository(girs, load_gir_index):
+    """Returns a `GirRepository` of `girs`, (gir file, lazy) pairs.
+
+    Like the ones the server builds, lazy girs are only registered.
+    """
+    repo = GirRepository(load_gir_index)
+    for gir_file, lazy in girs:
+        if lazy:
+            repo.register(gir_file, read_gir_header(gir_file))
+        else:
+            repo.load(gir_file)
+    return repo
+
+
+class _RequestHandler(SocketServer.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                method, args = _recv_request(self.request)
+            except (EOFError, socket.error):
+                # Clients may exit at any time, mid-request included
+                return
+            except (ValueError, TypeError):
+                # Not JSON, not one of our clients
+                return
+
+            # pylint: disable=broad-except
+            try:
+                reply = (None, self.server.call(method, args))
+            except Exception as exc:
+                reply = ((type(exc).__name__, str(exc)), None)
+
+            try:
+                _send_reply(self.request, reply)
+            except socket.error:
+                return
+
+
+class GirIndexServer(SocketServer.ThreadingMixIn,
+                     SocketServer.UnixStreamServer):
+    """Serves the gir indexes of `cache_folder` on `socket_path`."""
+    daemon_threads = True
+
+    def __init__(self, socket_path, cache_folder):
+        _make_private_dir(os.path.dirname(os.path.abspath(socket_path)))
+        if os.path.exists(socket_path):
+            if _is_serving(socket_path):
+                raise socket.error(errno.EADDRINUSE,
+                                   'A server is listening on %s' %
+                                   socket_path)
+            # Left over by a server which didn't shut down cleanly
+            os.unlink(socket_path)
+
+        # Never let the socket be accessible to others, even briefly
+        umask = os.umask(0o077)
+        try:
+            SocketServer.UnixStreamServer.__init__(self, socket_path,
+                                                   _RequestHandler)
+        finally:
+            os.umask(umask)
+
+        self.__cache = SharedGirCache(cache_folder)
+        self.__cache_folder = cache_folder
+        # Lookups may load namespaces, one client is served at a time
+        self.__lock = threading.Lock()
+        # gir file -> (mtime and size, index)
+        self.__indexes = {}
+        # ordered (gir file, lazy) pairs -> id of their repository
+        self.__repo_ids = {}
+        # repository id -> (mtime and size of the gir files it loaded
+        # or registered, repository). Only the latest repository of each
+        # list of girs is kept.
+        self.__repos = {}
+        self.__next_repo_id = 0
+        # gtk-doc directory -> its link index, and the directories whose
+        # books were checked since a repository was last opened
+        self.__link_indexes = {}
+        self.__checked_link_indexes = set()
+
+    def __load(self, gir_file):
+        stat = _get_stat(gir_file)
+        stamped = self.__indexes.get(gir_file)
+        if stamped is not None and stamped[0] == stat:
+            return stamped
+
+        gir_index = self.__cache.load(gir_file)
+        if gir_index is None:
+            gir_index = index_gir(gir_file)
+            self.__cache.store(gir_file, gir_index)
+
+        stamped = (stat, gir_index)
+        self.__indexes[gir_file] = stamped
+        return stamped
+
+    def __is_stale(self, repo_id):
+        # Another repository may have reloaded a gir since this one was
+        # built, compare with what this one saw
+        gir_stats, _ = self.__repos[repo_id]
+        for gir_file, stat in gir_stats.items():
+            try:
+                if stat != _get_stat(gir_file):
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def __open(self, girs):
+        girs = tuple((gir_file, lazy) for gir_file, lazy in girs)
+        # Clients open their girs once per run, check the gtk-doc books
+        # again for their first link
+        self.__checked_link_indexes.clear()
+
+        old_repo_id = self.__repo_ids.get(girs)
+        if old_repo_id is not None and not self.__is_stale(old_repo_id):
+            return old_repo_id
+
+        gir_stats = {}
+
+        def _load(gir_file):
+            stat, gir_index = self.__load(gir_file)
+            gir_stats[gir_file] = stat
+            return gir_index
+
+        for gir_file, lazy in girs:
+            if lazy:
+                gir_stats[gir_file] = _get_stat(gir_file)
+        repo = make_gir_repository(girs, _load)
+
+        # Clients of the stale repository get a StaleRepositoryError, and
+        # open the girs again
+        if old_repo_id is not None:
+            del self.__repos[old_repo_id]
+        repo_id = self.__next_repo_id
+        self.__next_repo_id += 1
+        self.__repos[repo_id] = (gir_stats, repo)
+        self.__repo_ids[girs] = repo_id
+        return repo_id
+
+    def __get_repo(self, repo_id):
+        try:
+            return self.__repos[repo_id][1]
+        except KeyError:
+            if 0 <= repo_id < self.__next_repo_id:
+                raise StaleRepositoryError('Repository %d was replaced' %
+                                           repo_id)
+            raise
+
+    def __get_href(self, gtkdoc_dir, name):
+        link_index = self.__link_indexes.get(gtkdoc_dir)
+        if link_index is not None and \
+                gtkdoc_dir not in self.__checked_link_indexes and \
+                link_index.is_stale():
+            # Only the books which changed are parsed again
+            link_index = None
+        if link_index is None:
+            link_index = GtkDocLinkIndex(gtkdoc_dir, self.__cache_folder)
+            self.__link_indexes[gtkdoc_dir] = link_index
+        self.__checked_link_indexes.add(gtkdoc_dir)
+        return link_index.get(name)
+
+    def call(self, method, args):
+        """Runs request `method` with `args`, returns its result."""
+        with self.__lock:
+            if method == 'open':
+                return self.__open(*args)
+            if method == 'get_href':
+                return self.__get_href(*args)
+
+            repo = self.__get_repo(args[0])
+            if method == 'get_filters':
+                return repo.smart_filters, repo.get_type_functions
+            if method in ('get_node', 'get_complete_node', 'get_class',
+                          'get_class_nodes', 'translate',
+                          'is_introspectable'):
+                return getattr(repo, method)(*args[1:])
+
+        raise ValueError('Unknown method %s' % method)
+
+
+class GirIndexClient(object):
+    """A connection to a `GirIndexServer` listening on `socket_path`.
+
+    Raises `socket.error` if no server is listening, and `OSError` if
+    the directory of the socket is accessible to other users. Processes
+    forked from the one which connected get their own connection.
+    """
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.__sock = None
+        self.__pid = None
+        self.__connect()
+
+    def __connect(self):
+        _check_private_dir(os.path.dirname(os.path.abspath(
+            self.socket_path)))
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except socket.error:
+            sock.close()
+            raise
+        self.__sock = sock
+        self.__pid = os.getpid()
+
+    def call(self, method, *args):
+        """Calls `method` on the server, and returns its result."""
+        if self.__pid != os.getpid():
+            self.__connect()
+
+        _send_request(self.__sock, method, args)
+        err, result = _recv_reply(self.__sock)
+        if err is not None:
+            name, message = err
+            if name == StaleRepositoryError.__name__:
+                raise StaleRepositoryError(message)
+            raise GirServerError('%s: %s' % (name, message))
+        return result
+
+    def close(self):
+        """Closes the connection of this process."""
+        if self.__sock is not None and self.__pid == os.getpid():
+            self.__sock.close()
+        self.__sock = None
+        self.__pid = None
+
+
+class RemoteGirRepository(object):
+    """The lookups of `gir_index.GirRepository`, answered by a server.
+
+    Args:
+        client: GirIndexClient, the connection to the server.
+        girs: list, (gir file, lazy) pairs, in the order the gir files
+            would be added to a `GirRepository`. Lazy girs are only
+            loaded when a lookup reaches into them.
+        fallback: callable, called with the `socket.error` or `EOFError`
+            raised when the server goes away, returning the
+            `GirRepository` to look nodes up from instead. When `None`,
+            these errors are raised.
+
+    `smart_filters` and `get_type_functions` are those of the girs
+    loaded when the repository is opened, which include the girs of
+    the project.
+    """
+    def __init__(self, client, girs, fallback=None):
+        self.__client = client
+        self.__girs = list(girs)
+        self.__fallback = fallback
+        self.__local_repo = None
+        self.__repo_id = client.call('open', self.__girs)
+        self.smart_filters, self.get_type_functions = client.call(
+            'get_filters', self.__repo_id)
+        self.__memos = {}
+
+    def __call_server(self, method, *args):
+        try:
+            return self.__client.call(method, self.__repo_id, *args)
+        except StaleRepositoryError:
+            # Another client opened the girs since they changed
+            self.__repo_id = self.__client.call('open', self.__girs)
+            return self.__client.call(method, self.__repo_id, *args)
+
+    def __call(self, method, *args):
+        memo = self.__memos.setdefault(method, {})
+        try:
+            return memo[args]
+        except KeyError:
+            pass
+
+        if self.__local_repo is None:
+            try:
+                result = self.__call_server(method, *args)
+            except (socket.error, EOFError) as exc:
+                if self.__fallback is None:
+                    raise
+                self.__local_repo = self.__fallback(exc)
+        if self.__local_repo is not None:
+            result = getattr(self.__local_repo, method)(*args)
+
+        memo[args] = result
+        return result
+
+    def get_node(self, name):
+        return self.__call('get_node', name)
+
+    def get_complete_node(self, name):
+        return self.__call('get_complete_node', name)
+
+    def get_class(self, gi_name):
+        return self.__call('get_class', gi_name)
+
+    def get_class_nodes(self):
+        return dict(self.__call('get_class_nodes'))
+
+    def translate(self, name, language):
+        return self.__call('translate', name, language)
+
+    def is_introspectable(self, name):
+        return self.__call('is_introspectable', name)
+
+
+class RemoteLinkIndex(object):
+    """The links of `gtkdoc_links.GtkDocLinkIndex`, answered by a server.
+
+    Like with `RemoteGirRepository`, `fallback` is called with the error
+    raised when the server goes away, and returns the `GtkDocLinkIndex`
+    to look links up from instead.
+    """
+    def __init__(self, client, gtkdoc_dir, fallback=None):
+        self.gtkdoc_dir = gtkdoc_dir
+        self.__client = client
+        self.__fallback = fallback
+        self.__local_index = None
+        self.__hrefs = {}
+
+    def start(self, jobs=1):
+        """Does nothing, the server gathers the links."""
+        pass
+
+    def wait(self):
+        """Does nothing, the server gathers the links."""
+        pass
+
+    def get(self, name):
+        """Returns the online href of `name`, or `None`."""
+        try:
+            return self.__hrefs[name]
+        except KeyError:
+            pass
+
+        if self.__local_index is None:
+            try:
+                href = self.__client.call('get_href', self.gtkdoc_dir, name)
+            except (socket.error, EOFError) as exc:
+                if self.__fallback is None:
+                    raise
+                self.__local_index = self.__fallback(exc)
+        if self.__local_index is not None:
+            href = self.__local_index.get(name)
+
+        self.__hrefs[name] = href
+        return href
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+
+def main(args=None):
+    """Runs a `GirIndexServer` until interrupted."""
+    parser = argparse.ArgumentParser(
+        description='Serve gir indexes to the hotdoc gi extension')
+    parser.add_argument('--socket', default=get_default_socket_path(),
+                        help='Path of the socket to listen on')
+    parser.add_argument('--cache-folder', default=get_default_cache_folder(),
+                        help='Folder to cache gir indexes in')
+    args = parser.parse_args(args)
+
+    server = GirIndexServer(args.socket, args.cache_folder)
+    sys.stdout.write('Serving gir indexes on %s\n' % args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
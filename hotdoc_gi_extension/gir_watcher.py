@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Waiting for gir files to change.
+
+Gir files are usually regenerated by writing a new file and renaming it
+over the previous one, so `GirWatcher` watches the directories of the
+files rather than the files themselves.
+
+On Linux, directories are watched with inotify, through ctypes. Elsewhere,
+or if inotify isn't usable, the mtime and size of the files are polled.
+"""
+
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+from hotdoc.utils.loggable import debug
+
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_CLOEXEC = 0o2000000
+_IN_EVENT = struct.Struct('iIII')
+
+# How long to wait for more events once a file changed, generating a
+# gir file may take several writes and renames
+_SETTLE_DELAY = 0.2
+
+
+def _get_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+class _Inotify(object):
+    def __init__(self, dirs):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(_IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self.__dirs = {}
+        mask = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        for dir_ in dirs:
+            wd = libc.inotify_add_watch(self.fd, dir_.encode('utf-8'), mask)
+            if wd < 0:
+                err = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(err, 'Could not watch %s' % dir_)
+            self.__dirs[wd] = dir_
+
+    def read(self):
+        """Returns the paths of the files which changed, may block."""
+        try:
+            buf = os.read(self.fd, 65536)
+        except OSError as exc:
+            if exc.errno == errno.EINTR:
+                return set()
+            raise
+
+        paths = set()
+        offset = 0
+        while offset < len(buf):
+            wd, _, _, name_len = _IN_EVENT.unpack_from(buf, offset)
+            offset += _IN_EVENT.size
+            name = buf[offset:offset + name_len].rstrip(b'\0')
+            offset += name_len
+            dir_ = self.__dirs.get(wd)
+            if dir_ is not None and name:
+                paths.add(os.path.join(dir_, name.decode('utf-8')))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class GirWatcher(object):
+    """Waits for any of `gir_files` to be modified or replaced."""
+    def __init__(self, gir_files, poll_interval=1.0):
+        self.gir_files = set(os.path.abspath(f) for f in gir_files)
+        self.__poll_interval = poll_interval
+        self.__stats = dict((f, _get_stat(f)) for f in self.gir_files)
+
+        dirs = set(os.path.dirname(f) for f in self.gir_files)
+        try:
+            self.__inotify = _Inotify(dirs)
+        except (OSError, AttributeError, TypeError) as exc:
+            debug('Polling gir files, inotify is not usable: %s' % exc,
+                  'gi-extension')
+            self.__inotify = None
+
+    def __poll_changes(self, gir_files):
+        changed = set()
+        for gir_file in gir_files:
+            stat = _get_stat(gir_file)
+            if stat != self.__stats[gir_file]:
+                self.__stats[gir_file] = stat
+                if stat is not None:
+                    changed.add(gir_file)
+        return changed
+
+    def __wait_inotify(self):
+        changed = set()
+        timeout = None
+        while True:
+            ready, _, _ = select.select([self.__inotify.fd], [], [], timeout)
+            if not ready:
+                if changed:
+                    break
+                continue
+            changed |= self.__inotify.read() & self.gir_files
+            if changed:
+                timeout = _SETTLE_DELAY
+
+        # Only report files which actually changed, and still exist. The
+        # others are left alone, the events telling they changed since
+        # haven't been read yet
+        return self.__poll_changes(changed)
+
+    def wait(self):
+        """Blocks until some gir files changed, and returns them."""
+        while True:
+            if self.__inotify is not None:
+                changed = self.__wait_inotify()
+            else:
+                time.sleep(self.__poll_interval)
+                changed = self.__poll_changes(self.gir_files)
+            if changed:
+                return changed
+
+    def close(self):
+        """Stops watching."""
+        if self.__inotify is not None:
+            self.__inotify.close()
+            self.__inotify = None
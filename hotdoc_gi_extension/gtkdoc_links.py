@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Links to the online documentation of installed gtk-doc books.
+
+Each book directory in `datadir/gtk-doc/html` has either a devhelp2
+index or an index.sgml file, listing the symbols it documents and their
+online location. `GtkDocLinkIndex` gathers these in a single name ->
+href map, and caches the links of each book along with the mtime and
+size of its index file, so that only the books which changed since the
+last run are parsed again.
+
+Links are stored relative to the online prefix of their book. Prefixes
+are kept once, in a string table, and each entry of the map only holds
+the index of its prefix in that table and its relative link. Hrefs are
+built when they are first looked up.
+
+Gathering can run in a background thread, while the extension indexes
+gir files, and is only waited for when a link is first looked up.
+"""
+
+import os
+import hashlib
+import threading
+from multiprocessing.pool import ThreadPool
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from lxml import etree
+
+from hotdoc.utils.loggable import debug
+
+
+# Bump this whenever the layout of the cache changes
+CACHE_VERSION = 2
+
+_DEVHELP_KEYWORD_TAG = '{http://www.devhelp.net/book}keyword'
+
+
+def _get_book_stamp(dir_):
+    stamp = []
+    for path in (os.path.join(dir_, os.path.basename(dir_) + '.devhelp2'),
+                 os.path.join(dir_, 'index.sgml')):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        stamp.append((path, stat.st_mtime, stat.st_size))
+    return tuple(stamp)
+
+
+def _list_books(gtkdoc_dir):
+    # (directory name, stamp) of the books of gtkdoc_dir
+    books = []
+    if not os.path.isdir(gtkdoc_dir):
+        return books
+
+    for node in os.listdir(gtkdoc_dir):
+        dir_ = os.path.join(gtkdoc_dir, node)
+        if not os.path.isdir(dir_):
+            continue
+
+        stamp = _get_book_stamp(dir_)
+        if stamp:
+            books.append((node, stamp))
+    return books
+
+
+def parse_devhelp_index(path):
+    """Returns the online prefix and links of devhelp2 index `path`.
+
+    The links are relative to the prefix. `None` is returned when the
+    book isn't available online.
+
+    The index is streamed, keywords are dropped from the tree as soon
+    as their link was read.
+    """
+    online = None
+    links = {}
+    for event, elem in etree.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            if online is None:
+                online = elem.attrib.get('online')
+                if not online:
+                    return None
+            continue
+
+        if elem.tag == _DEVHELP_KEYWORD_TAG:
+            links[elem.attrib['name']] = elem.attrib['link']
+
+        parent = elem.getparent()
+        if parent is None:
+            break
+        elem.clear()
+        while elem.getprevious() is not None:
+            del parent[0]
+
+    debug('Gathered %d links from devhelp index %s' % (len(links), path),
+          'gi-extension')
+    return online, links
+
+
+def parse_sgml_index(path):
+    """Returns the online prefix and links of index.sgml file `path`."""
+    remote_prefix = ""
+    links = {}
+    with open(path, 'r') as f:
+        for l in f:
+            if l.startswith("<ONLINE"):
+                remote_prefix = l.split('"')[1]
+            elif not remote_prefix:
+                break
+            elif l.startswith("<ANCHOR"):
+                split_line = l.split('"')
+                filename = split_line[3].split('/', 1)[-1]
+                title = split_line[1].replace('-', '_')
+
+                if title.endswith (":CAPS"):
+                    title = title [:-5]
+
+                links[title] = filename
+
+    if links:
+        debug('Gathered %d links from sgml index %s' % (len(links), path),
+              'gi-extension')
+    return remote_prefix + '/', links
+
+
+def parse_book(dir_):
+    """Returns the online prefix and links of book directory `dir_`.
+
+    The links may be empty.
+    """
+    path = os.path.join(dir_, os.path.basename(dir_) + '.devhelp2')
+    if os.path.exists(path):
+        book = parse_devhelp_index(path)
+        if book is not None:
+            return book
+
+    try:
+        return parse_sgml_index(os.path.join(dir_, 'index.sgml'))
+    except IOError:
+        return '', {}
+
+
+class GtkDocLinkIndex(object):
+    """The links of all the books in `gtkdoc_dir`, cached in `cache_folder`.
+
+    Books are gathered when a link is first looked up, unless `start`
+    was called before.
+    """
+    def __init__(self, gtkdoc_dir, cache_folder=None):
+        self.gtkdoc_dir = gtkdoc_dir
+        self.__cache_path = None
+        if cache_folder is not None:
+            key = hashlib.sha1(os.path.abspath(gtkdoc_dir)).hexdigest()
+            self.__cache_path = os.path.join(cache_folder,
+                                             'gtk-doc-%s.p' % key)
+        self.__hrefs = None
+        self.__prefixes = []
+        # directory name -> stamp of the books the links were gathered from
+        self.__stamps = {}
+        self.__built = {}
+        self.__thread = None
+        self.__lock = threading.Lock()
+
+    def __load_books(self):
+        if self.__cache_path is None:
+            return {}
+
+        # pylint: disable=broad-except
+        try:
+            with open(self.__cache_path, 'rb') as _:
+                version, books = pickle.load(_)
+        except Exception:
+            return {}
+
+        if version != CACHE_VERSION:
+            return {}
+        return books
+
+    def __store_books(self, books):
+        tmp_path = '%s.%d.tmp' % (self.__cache_path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as _:
+                pickle.dump((CACHE_VERSION, books), _,
+                            pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, self.__cache_path)
+        except (OSError, IOError) as exc:
+            debug("Couldn't cache gtk-doc links: %s" % exc, 'gi-extension')
+
+    def gather(self, jobs=1):
+        """Gathers the links of the books which changed since last time.
+
+        Args:
+            jobs: int, the number of threads to parse books with.
+        """
+        if not os.path.isdir(self.gtkdoc_dir):
+            debug("no gtk doc to gather links from in %s" % self.gtkdoc_dir,
+                  'gi-extension')
+            self.__prefixes = []
+            self.__stamps = {}
+            self.__hrefs = {}
+            return
+
+        cached_books = self.__load_books()
+        books = []
+        stale = []
+
+        stamps = _list_books(self.gtkdoc_dir)
+        for node, stamp in stamps:
+            book = cached_books.get(node)
+            if book is None or book[0] != stamp:
+                book = (stamp, None)
+                stale.append(os.path.join(self.gtkdoc_dir, node))
+            books.append((node, book))
+
+        if jobs > 1 and len(stale) > 1:
+            pool = ThreadPool(min(jobs, len(stale)))
+            try:
+                parsed = pool.map(parse_book, stale)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            parsed = [parse_book(dir_) for dir_ in stale]
+        parsed = dict(zip(stale, parsed))
+
+        # Later books override the links of earlier ones
+        hrefs = {}
+        prefixes = []
+        prefix_ids = {}
+        for i, (node, (stamp, book)) in enumerate(books):
+            if book is None:
+                book = parsed[os.path.join(self.gtkdoc_dir, node)]
+                books[i] = (node, (stamp, book))
+            prefix, links = book
+            if not links:
+                continue
+            prefix_id = prefix_ids.get(prefix)
+            if prefix_id is None:
+                prefix_id = prefix_ids[prefix] = len(prefixes)
+                prefixes.append(prefix)
+            for name, link in links.iteritems():
+                hrefs[name] = (prefix_id, link)
+
+        debug('Gathered %d gtk-doc links, parsed %d of %d books' %
+              (len(hrefs), len(stale), len(books)), 'gi-extension')
+
+        if self.__cache_path and (stale or len(books) != len(cached_books)):
+            self.__store_books(dict(books))
+
+        self.__prefixes = prefixes
+        self.__stamps = dict(stamps)
+        self.__built = {}
+        self.__hrefs = hrefs
+
+    def is_stale(self):
+        """Whether books were added, removed or changed since the links
+        were gathered. Links which aren't gathered yet aren't stale."""
+        if self.__hrefs is None:
+            return False
+        return dict(_list_books(self.gtkdoc_dir)) != self.__stamps
+
+    def __gather_in_background(self, jobs):
+        # pylint: disable=broad-except
+        try:
+            self.gather(jobs)
+        except Exception as exc:
+            debug('Gathering gtk-doc links in the background failed: %s' %
+                  exc, 'gi-extension')
+
+    def start(self, jobs=1):
+        """Starts gathering links in a background thread."""
+        with self.__lock:
+            if self.__hrefs is not None or self.__thread is not None:
+                return
+            self.__thread = threading.Thread(
+                target=self.__gather_in_background, args=(jobs,),
+                name='gtk-doc-links')
+            self.__thread.daemon = True
+            self.__thread.start()
+
+    def wait(self):
+        """Waits for the links to be gathered, and returns them.
+
+        Links are returned in their compact form, (index of their prefix,
+        link relative to it).
+        """
+        hrefs = self.__hrefs
+        if hrefs is not None:
+            return hrefs
+
+        with self.__lock:
+            if self.__thread is not None:
+                self.__thread.join()
+                self.__thread = None
+            # The background thread may have failed, try again here
+            if self.__hrefs is None:
+                self.gather()
+            return self.__hrefs
+
+    def get(self, name):
+        """Returns the online href of `name`, or `None`."""
+        href = self.__built.get(name)
+        if href is not None:
+            return href
+
+        entry = self.wait().get(name)
+        if entry is None:
+            return None
+        prefix_id, link = entry
+        href = self.__built[name] = self.__prefixes[prefix_id] + link
+        return href
+
+    def __contains__(self, name):
+        return self.get(name) is not None
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# pylint: disable=missing-docstring
+
+"""Small synthetic gir files shared by the tests."""
+
+import os
+
+
+GIR_TEMPLATE = '''<?xml version="1.0"?>
+<repository version="1.2"
+            xmlns="http://www.gtk.org/introspection/core/1.0"
+            xmlns:c="http://www.gtk.org/introspection/c/1.0"
+            xmlns:glib="http://www.gtk.org/introspection/glib/1.0">
+  %(includes)s
+  <namespace name="%(namespace)s" version="1.0"
+             shared-library="lib%(symbol_prefix)s.so"
+             c:identifier-prefixes="%(identifier_prefix)s"
+             c:symbol-prefixes="%(symbol_prefix)s">
+    %(contents)s
+  </namespace>
+</repository>
+'''
+
+
+TEST_GIR_CONTENTS = '''
+    <class name="Widget" c:type="TestWidget" c:symbol-prefix="widget"
+           parent="GObject.Object" glib:type-name="TestWidget"
+           glib:get-type="test_widget_get_type"
+           glib:type-struct="WidgetClass">
+      <implements name="Sizable"/>
+      <constructor name="new" c:identifier="test_widget_new">
+        <return-value transfer-ownership="full">
+          <type name="Widget" c:type="TestWidget*"/>
+        </return-value>
+      </constructor>
+      <method name="show" c:identifier="test_widget_show" throws="1">
+        <return-value transfer-ownership="none">
+          <type name="gboolean" c:type="gboolean"/>
+        </return-value>
+        <parameters>
+          <instance-parameter name="widget" transfer-ownership="none">
+            <type name="Widget" c:type="TestWidget*"/>
+          </instance-parameter>
+          <parameter name="count" direction="out">
+            <type name="gint" c:type="gint*"/>
+          </parameter>
+          <parameter name="names" transfer-ownership="none">
+            <array c:type="gchar**">
+              <type name="utf8" c:type="gchar*"/>
+            </array>
+          </parameter>
+          <parameter name="..." transfer-ownership="none">
+            <varargs/>
+          </parameter>
+        </parameters>
+      </method>
+      <method name="set_opaque" c:identifier="test_widget_set_opaque">
+        <return-value transfer-ownership="none">
+          <type name="none" c:type="void"/>
+        </return-value>
+        <parameters>
+          <instance-parameter name="widget" transfer-ownership="none">
+            <type name="Widget" c:type="TestWidget*"/>
+          </instance-parameter>
+          <parameter name="opaque" transfer-ownership="none">
+            <type name="Opaque" c:type="TestOpaque*"/>
+          </parameter>
+        </parameters>
+      </method>
+      <method name="get_file" c:identifier="test_widget_get_file">
+        <return-value transfer-ownership="none">
+          <type name="Gio.File" c:type="GFile*"/>
+        </return-value>
+        <parameters>
+          <instance-parameter name="widget" transfer-ownership="none">
+            <type name="Widget" c:type="TestWidget*"/>
+          </instance-parameter>
+        </parameters>
+      </method>
+      <method name="hidden" c:identifier="test_widget_hidden"
+              introspectable="0">
+        <return-value transfer-ownership="none">
+          <type name="none" c:type="void"/>
+        </return-value>
+      </method>
+      <virtual-method name="draw">
+        <return-value transfer-ownership="none">
+          <type name="none" c:type="void"/>
+        </return-value>
+        <parameters>
+          <instance-parameter name="widget" transfer-ownership="none">
+            <type name="Widget" c:type="TestWidget*"/>
+          </instance-parameter>
+        </parameters>
+      </virtual-method>
+      <property name="label" writable="1" construct="1"
+                transfer-ownership="none">
+        <type name="utf8" c:type="gchar*"/>
+      </property>
+      <glib:signal name="clicked" when="last" no-hooks="1">
+        <return-value transfer-ownership="none">
+          <type name="none" c:type="void"/>
+        </return-value>
+        <parameters>
+          <parameter name="button" transfer-ownership="none">
+            <type name="guint" c:type="guint"/>
+          </parameter>
+        </parameters>
+      </glib:signal>
+    </class>
+    <class name="Button" c:type="TestButton" c:symbol-prefix="button"
+           parent="Widget" glib:type-name="TestButton"
+           glib:get-type="test_button_get_type">
+    </class>
+    <class name="ToggleButton" c:type="TestToggleButton"
+           c:symbol-prefix="toggle_button" parent="Button"
+           glib:type-name="TestToggleButton"
+           glib:get-type="test_toggle_button_get_type">
+    </class>
+    <interface name="Sizable" c:type="TestSizable" c:symbol-prefix="sizable"
+               glib:type-name="TestSizable"
+               glib:get-type="test_sizable_get_type">
+    </interface>
+    <record name="WidgetClass" c:type="TestWidgetClass"
+            glib:is-gtype-struct-for="Widget">
+      <field name="parent_class">
+        <type name="GObject.ObjectClass" c:type="GObjectClass"/>
+      </field>
+    </record>
+    <record name="WidgetPrivate" c:type="TestWidgetPrivate" disguised="1">
+    </record>
+    <record name="Opaque" c:type="TestOpaque" introspectable="0">
+    </record>
+    <enumeration name="Mode" c:type="TestMode">
+      <member name="fast" value="0" c:identifier="TEST_MODE_FAST">
+      </member>
+    </enumeration>
+    <callback name="Callback" c:type="TestCallback">
+      <return-value transfer-ownership="none">
+        <type name="none" c:type="void"/>
+      </return-value>
+      <parameters>
+        <parameter name="user_data" transfer-ownership="none">
+          <type name="gpointer" c:type="gpointer"/>
+        </parameter>
+      </parameters>
+    </callback>
+    <function name="init" c:identifier="test_init">
+      <return-value transfer-ownership="none">
+        <type name="none" c:type="void"/>
+      </return-value>
+    </function>
+'''
+
+
+def make_gir(contents, namespace='Test', identifier_prefix='Test',
+             symbol_prefix='test', includes=(('GObject', '2.0'),)):
+    """Returns the text of a gir file declaring `contents`."""
+    return GIR_TEMPLATE % {
+        'includes': '\n  '.join(
+            '<include name="%s" version="%s"/>' % include
+            for include in includes),
+        'namespace': namespace,
+        'identifier_prefix': identifier_prefix,
+        'symbol_prefix': symbol_prefix,
+        'contents': contents}
+
+
+def write_file(folder, name, contents):
+    """Writes `contents` to `name` in `folder`, returns its path."""
+    path = os.path.join(folder, name)
+    with open(path, 'w') as _:
+        _.write(contents)
+    return path
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+# pylint: disable=too-few-public-methods
+
+import pickle
+import unittest
+from collections import OrderedDict, defaultdict
+
+from hotdoc_gi_extension.gi_annotation_parser import (
+    GIAnnotationParser, GIAnnotation, TRANSFER_NONE_HELP, ARRAY_HELP)
+
+
+class FakeAnnotation(object):
+    def __init__(self, name, argument=None):
+        self.name = name
+        self.argument = argument
+
+
+class FakeComment(object):
+    def __init__(self, annotations):
+        self.annotations = OrderedDict(
+            (ann.name, ann) for ann in annotations)
+        self.extension_attrs = defaultdict(dict)
+
+
+class FakeParameter(object):
+    def __init__(self, *annotations):
+        self.comment = FakeComment(annotations)
+
+
+class TestGIAnnotationParser(unittest.TestCase):
+    def setUp(self):
+        self.parser = GIAnnotationParser()
+
+    def __nicks(self, parameter):
+        return [ann.nick for ann in self.parser.make_annotations(parameter)]
+
+    def test_no_annotations(self):
+        parameter = FakeParameter()
+        self.assertEqual(self.parser.make_annotations(parameter), ())
+        parameter.comment = None
+        self.assertEqual(self.parser.make_annotations(parameter), ())
+
+    def test_annotations(self):
+        parameter = FakeParameter(FakeAnnotation('transfer', ['none']),
+                                  FakeAnnotation('nullable'),
+                                  FakeAnnotation('skip'),
+                                  FakeAnnotation('not', ['nullable']))
+        annotations = self.parser.make_annotations(parameter)
+        self.assertEqual(annotations,
+                         (GIAnnotation('transfer: none', TRANSFER_NONE_HELP),
+                          GIAnnotation('nullable', annotations[1].help_text),
+                          GIAnnotation('not nullable',
+                                       annotations[2].help_text)))
+
+    def test_arguments(self):
+        self.assertEqual(
+            self.__nicks(FakeParameter(FakeAnnotation('scope', ['call']),
+                                       FakeAnnotation('closure', ['data']),
+                                       FakeAnnotation('default', ['4']))),
+            ['scope call', 'closure', 'default 4'])
+
+        annotations = self.parser.make_annotations(
+            FakeParameter(FakeAnnotation('element-type', ['utf8']),
+                          FakeAnnotation('type', ['GList'])))
+        self.assertEqual([ann.value for ann in annotations],
+                         ['utf8', 'GList'])
+
+    def test_array(self):
+        argument = {'length': 'n_items', 'zero-terminated': '1'}
+        annotations = self.parser.make_annotations(FakeParameter(
+            FakeAnnotation('array', argument)))
+        self.assertEqual(annotations, (
+            GIAnnotation('array', ARRAY_HELP, ''.join(
+                '%s=%s' % item for item in argument.iteritems())),))
+
+        annotations = self.parser.make_annotations(FakeParameter(
+            FakeAnnotation('array', {'fixed-size': '4'})))
+        self.assertEqual(annotations[0].value, 'fixed-size=4')
+
+        annotations = self.parser.make_annotations(FakeParameter(
+            FakeAnnotation('array')))
+        self.assertIsNone(annotations[0].value)
+
+    def test_shared(self):
+        first = FakeParameter(FakeAnnotation('transfer', ['full']),
+                              FakeAnnotation('out'))
+        second = FakeParameter(FakeAnnotation('transfer', ['full']),
+                               FakeAnnotation('out'))
+        annotations = self.parser.make_annotations(first)
+        self.assertIs(self.parser.make_annotations(second), annotations)
+
+        # Annotations are kept on the comment
+        self.assertIs(
+            first.comment.extension_attrs['gi-extension']['annotations'],
+            annotations)
+
+    def test_order(self):
+        self.assertEqual(
+            self.__nicks(FakeParameter(FakeAnnotation('out'),
+                                       FakeAnnotation('transfer', ['full']))),
+            ['out', 'transfer: full'])
+        self.assertEqual(
+            self.__nicks(FakeParameter(FakeAnnotation('transfer', ['full']),
+                                       FakeAnnotation('out'))),
+            ['transfer: full', 'out'])
+
+    def test_nested_arguments(self):
+        parameter = FakeParameter(
+            FakeAnnotation('attributes', [{'key': ['a', 'b']}, ['c']]))
+        self.assertEqual(self.parser.make_annotations(parameter), ())
+        self.assertEqual(len(self.parser.unknown_annotations['attributes']),
+                         1)
+
+    def test_unknown(self):
+        self.parser.make_annotations(FakeParameter(
+            FakeAnnotation('rename-to', ['other']),
+            FakeAnnotation('transfer', ['nope'])))
+        self.parser.make_annotations(FakeParameter(
+            FakeAnnotation('rename-to', ['another'])))
+        self.assertEqual(dict(self.parser.unknown_annotations),
+                         {'rename-to': set([('other',), ('another',)]),
+                          'transfer': set([('nope',)])})
+
+
+class TestGIAnnotation(unittest.TestCase):
+    def test_interned(self):
+        annotation = GIAnnotation('foo', 'Foo help', 'bar')
+        self.assertIs(GIAnnotation('foo', 'Foo help', 'bar'), annotation)
+        self.assertIsNot(GIAnnotation('foo', 'Foo help'), annotation)
+
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            self.assertIs(pickle.loads(pickle.dumps(annotation, protocol)),
+                          annotation)
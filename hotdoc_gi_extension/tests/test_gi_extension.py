@@ -0,0 +1,653 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+# pylint: disable=protected-access
+# pylint: disable=too-few-public-methods
+
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+from collections import OrderedDict, defaultdict
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from hotdoc.core.base_extension import BaseExtension
+from hotdoc.core.change_tracker import ChangeTracker
+from hotdoc.core.symbols import (
+    Symbol, FunctionSymbol, CallbackSymbol, StructSymbol, EnumSymbol,
+    ConstantSymbol)
+
+from hotdoc_gi_extension.gi_extension import (
+    GIExtension, GIR_DEPS_VERSION, LANGUAGE_CONTEXTS, make_flags,
+    get_signal_flags, get_property_flags, RunFirstFlag, RunLastFlag,
+    RunCleanupFlag, NoHooksFlag, ReadableFlag, WritableFlag, ConstructFlag,
+    ConstructOnlyFlag)
+from hotdoc_gi_extension.gir_index import (
+    index_gir, read_gir_header, GirRepository)
+from hotdoc_gi_extension.gir_hierarchy import GirHierarchy
+from hotdoc_gi_extension.gi_html_formatter import GIHtmlFormatter
+from hotdoc_gi_extension.gtkdoc_links import GtkDocLinkIndex
+from hotdoc_gi_extension.tests.girs import (
+    make_gir, write_file, TEST_GIR_CONTENTS)
+from hotdoc_gi_extension.tests.test_gir_declarations import (
+    TEST_HEADER, DECLARATIONS_GIR_CONTENTS)
+from hotdoc_gi_extension.tests.test_gir_server import DeadClient
+from hotdoc_gi_extension.tests.test_gtkdoc_links import (
+    write_devhelp_book, GLIB_ONLINE, GLIB_LINKS)
+
+
+try:
+    from hotdoc_c_extension.c_extension import CExtension
+except ImportError:
+    CExtension = None
+
+
+GOBJECT_GIR_CONTENTS = '''
+    <class name="Object" c:type="GObject" c:symbol-prefix="object"
+           glib:type-name="GObject" glib:get-type="g_object_get_type">
+    </class>
+'''
+
+# The names of the symbols the pages of the tests list
+SYMBOL_NAMES = ['test_init', 'test_widget_show', 'TestWidget', 'TestButton',
+                'TestToggleButton', 'TestSizable', 'TestMode']
+
+
+class FakePage(object):
+    def __init__(self, symbol_names):
+        self.symbol_names = symbol_names
+
+
+class FakeDocTree(object):
+    def __init__(self, symbol_names):
+        self.__pages = {'test.markdown': FakePage(symbol_names)}
+
+    def get_pages(self):
+        return self.__pages
+
+
+class FakeDocRepo(object):
+    def __init__(self, symbol_names):
+        self.doc_tree = FakeDocTree(symbol_names)
+
+
+# (when, no-hooks) -> the flags listed before flags were stored as masks
+SIGNAL_FLAGS = [
+    (None, '0', []),
+    (None, '1', [NoHooksFlag]),
+    ('first', '0', [RunFirstFlag]),
+    ('first', '1', [RunFirstFlag, NoHooksFlag]),
+    ('last', '0', [RunLastFlag]),
+    ('last', '1', [RunLastFlag, NoHooksFlag]),
+    ('cleanup', '0', [RunCleanupFlag]),
+    ('cleanup', '1', [RunCleanupFlag, NoHooksFlag]),
+]
+
+# (writable, construct, construct-only) -> the flags listed before
+PROPERTY_FLAGS = [
+    ('0', '0', '0', [ReadableFlag]),
+    ('1', '0', '0', [ReadableFlag, WritableFlag]),
+    ('0', '1', '0', [ReadableFlag, ConstructFlag]),
+    ('1', '1', '0', [ReadableFlag, WritableFlag, ConstructFlag]),
+    ('0', '0', '1', [ReadableFlag, ConstructOnlyFlag]),
+    ('1', '0', '1', [ReadableFlag, WritableFlag, ConstructOnlyFlag]),
+    # Construct-only takes precedence over construct
+    ('0', '1', '1', [ReadableFlag, ConstructOnlyFlag]),
+    ('1', '1', '1', [ReadableFlag, WritableFlag, ConstructOnlyFlag]),
+]
+
+FLAGS_GIR_TEMPLATE = '''
+    <class name="Widget" c:type="TestWidget" c:symbol-prefix="widget"
+           glib:type-name="TestWidget" glib:get-type="test_widget_get_type">
+      %s
+    </class>
+'''
+
+
+def make_flags_gir_contents():
+    members = []
+    for i, (when, no_hooks, _) in enumerate(SIGNAL_FLAGS):
+        members.append('<glib:signal name="signal%d"%s no-hooks="%s">'
+                       '</glib:signal>' %
+                       (i, ' when="%s"' % when if when else '', no_hooks))
+    for i, (writable, construct, construct_only, _) in \
+            enumerate(PROPERTY_FLAGS):
+        members.append('<property name="property%d" writable="%s" '
+                       'construct="%s" construct-only="%s">'
+                       '<type name="utf8" c:type="gchar*"/></property>' %
+                       (i, writable, construct, construct_only))
+    return FLAGS_GIR_TEMPLATE % '\n      '.join(members)
+
+
+class TestFlags(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        gir_file = write_file(self.__tmp_dir, 'Test-1.0.gir',
+                              make_gir(make_flags_gir_contents()))
+        self.nodes = index_gir(gir_file).nodes
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def __assert_flags(self, mask, flag_classes):
+        self.assertEqual([type(flag) for flag in make_flags(mask)],
+                         flag_classes)
+
+    def test_signals(self):
+        for i, (_, _, flag_classes) in enumerate(SIGNAL_FLAGS):
+            node = self.nodes['TestWidget::signal%d' % i]
+            self.__assert_flags(get_signal_flags(node), flag_classes)
+
+    def test_properties(self):
+        for i, (_, _, _, flag_classes) in enumerate(PROPERTY_FLAGS):
+            node = self.nodes['TestWidget:property%d' % i]
+            self.__assert_flags(get_property_flags(node), flag_classes)
+
+    def test_nicks(self):
+        self.assertEqual([flag.nick for flag in make_flags(0xff)],
+                         ['Run First', 'Run Last', 'Run Cleanup', 'No Hooks',
+                          'Read', 'Write', 'Construct Only', 'Construct'])
+        self.assertEqual(make_flags(0), [])
+
+
+class TestLanguageContext(unittest.TestCase):
+    def setUp(self):
+        # Language contexts only depend on the thread-local storage
+        self.extension = GIExtension.__new__(GIExtension)
+        self.extension._GIExtension__local = threading.local()
+
+    def test_bind(self):
+        extension = self.extension
+        self.assertIsNone(extension.get_language_context())
+        self.assertIsNone(extension.language)
+        self.assertEqual(extension._fundamentals, {})
+
+        with extension.language_context('python') as context:
+            self.assertIs(context, LANGUAGE_CONTEXTS['python'])
+            self.assertIs(extension.get_language_context(), context)
+            self.assertEqual(extension.language, 'python')
+            self.assertIs(extension._fundamentals, context.fundamentals)
+
+        self.assertIsNone(extension.get_language_context())
+
+    def test_nested(self):
+        extension = self.extension
+        with extension.language_context('c') as outer:
+            with extension.language_context('javascript') as inner:
+                self.assertIs(extension.get_language_context(), inner)
+                # The language-neutral context of rendered comments
+                with extension.language_context(None):
+                    self.assertIsNone(extension.language)
+                    self.assertIsNotNone(extension.get_language_context())
+                self.assertIs(extension.get_language_context(), inner)
+            self.assertIs(extension.get_language_context(), outer)
+        self.assertIsNone(extension.get_language_context())
+
+    def test_exception(self):
+        extension = self.extension
+        with self.assertRaises(ValueError):
+            with extension.language_context('c'):
+                with extension.language_context('python'):
+                    raise ValueError()
+        self.assertIsNone(extension.get_language_context())
+
+    def test_threads(self):
+        extension = self.extension
+        events = {'c': threading.Event(), 'python': threading.Event()}
+        seen = {}
+
+        def _format(language, other):
+            with extension.language_context(language):
+                events[language].set()
+                # Wait for the other thread to bind its language too
+                events[other].wait(5)
+                seen[language] = extension.get_language_context()
+            seen[language, 'after'] = extension.get_language_context()
+
+        threads = [threading.Thread(target=_format, args=('c', 'python')),
+                   threading.Thread(target=_format, args=('python', 'c'))]
+        with extension.language_context('javascript'):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(extension.language, 'javascript')
+
+        self.assertIs(seen['c'], LANGUAGE_CONTEXTS['c'])
+        self.assertIs(seen['python'], LANGUAGE_CONTEXTS['python'])
+        self.assertIsNone(seen['c', 'after'])
+        self.assertIsNone(seen['python', 'after'])
+
+
+class TestGirDeps(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.gir_file = write_file(self.__tmp_dir, 'Test-1.0.gir',
+                                   make_gir(TEST_GIR_CONTENTS))
+        self.gobject_gir_file = write_file(
+            self.__tmp_dir, 'GObject-2.0.gir',
+            make_gir(GOBJECT_GIR_CONTENTS, namespace='GObject',
+                     identifier_prefix='G', symbol_prefix='g', includes=()))
+        self.deps_path = os.path.join(self.__tmp_dir, 'gir-deps.p')
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def __make_extension(self, reindexed_girs):
+        # Only what tracking gir dependencies relies on
+        extension = GIExtension.__new__(GIExtension)
+        repository = GirRepository(index_gir)
+        repository.load(self.gir_file)
+        repository.register(self.gobject_gir_file,
+                            read_gir_header(self.gobject_gir_file))
+        hierarchy = GirHierarchy(repository)
+        hierarchy.build()
+
+        extension._GIExtension__gir_repo = repository
+        extension._GIExtension__gir_hierarchy = hierarchy
+        extension._GIExtension__parsed_girs = set([self.gir_file,
+                                                   self.gobject_gir_file])
+        extension._GIExtension__reindexed_girs = set(reindexed_girs)
+        extension._GIExtension__gir_deps_path = self.deps_path
+        extension._GIExtension__gir_deps, extension._GIExtension__gir_stamps \
+            = extension._GIExtension__load_gir_deps()
+        return extension
+
+    def __build(self, symbol_names=SYMBOL_NAMES):
+        # Like resolving and formatting every page in a first run
+        extension = self.__make_extension([self.gir_file,
+                                           self.gobject_gir_file])
+        gir_deps = extension._GIExtension__gir_deps
+        for name in SYMBOL_NAMES:
+            gir_deps[name] = extension._GIExtension__get_gir_digest(name)
+        extension._GIExtension__store_gir_deps(FakeDocRepo(symbol_names))
+        return extension
+
+    def __rewrite_gir(self, contents):
+        stat = os.stat(self.gir_file)
+        write_file(self.__tmp_dir, 'Test-1.0.gir', make_gir(contents))
+        # Stamps compare mtimes before contents
+        os.utime(self.gir_file, (stat.st_atime, stat.st_mtime + 10))
+
+    def __get_changed_symbols(self, extension):
+        return sorted(extension._GIExtension__get_changed_symbols())
+
+    def test_unchanged(self):
+        self.__build()
+        extension = self.__make_extension([self.gir_file])
+        self.assertEqual(self.__get_changed_symbols(extension), [])
+
+    def test_changed(self):
+        self.__build()
+        contents = TEST_GIR_CONTENTS.replace(
+            '<function name="init" c:identifier="test_init">',
+            '<function name="init" c:identifier="test_init" throws="1">')
+        # The parent of an ancestor of ToggleButton
+        contents = contents.replace(
+            'c:symbol-prefix="button"\n           parent="Widget"',
+            'c:symbol-prefix="button"\n           parent="GObject.Object"')
+        self.assertIn('c:identifier="test_init" throws="1"', contents)
+        self.assertNotIn('parent="Widget"', contents)
+        self.__rewrite_gir(contents)
+
+        extension = self.__make_extension([self.gir_file])
+        # Widget lost its child, and ToggleButton its grandparent
+        self.assertEqual(self.__get_changed_symbols(extension),
+                         ['TestButton', 'TestToggleButton', 'TestWidget',
+                          'test_init'])
+
+    def test_touched(self):
+        self.__build()
+        stat = os.stat(self.gir_file)
+        os.utime(self.gir_file, (stat.st_atime, stat.st_mtime + 10))
+
+        # Girs read from typelibs or by the index server count as
+        # indexed again in every run
+        extension = self.__make_extension([self.gir_file,
+                                           self.gobject_gir_file])
+        self.assertEqual(self.__get_changed_symbols(extension), [])
+
+    def test_not_reindexed(self):
+        self.__build()
+        self.__rewrite_gir(TEST_GIR_CONTENTS.replace(
+            'c:identifier="test_init"',
+            'c:identifier="test_init" throws="1"'))
+
+        # The previous index of the gir was loaded from the cache
+        extension = self.__make_extension([])
+        self.assertEqual(self.__get_changed_symbols(extension), [])
+
+    def test_unlisted(self):
+        self.__build(['test_init', 'TestWidget'])
+        extension = self.__make_extension([self.gir_file])
+        self.assertEqual(sorted(extension._GIExtension__gir_deps),
+                         ['TestWidget', 'test_init'])
+        self.assertEqual(sorted(extension._GIExtension__gir_stamps),
+                         sorted([self.gir_file, self.gobject_gir_file]))
+
+    def test_version_mismatch(self):
+        self.__build()
+        with open(self.deps_path, 'rb') as _:
+            version, gir_deps, gir_stamps = pickle.load(_)
+        self.assertEqual(version, GIR_DEPS_VERSION)
+        self.assertEqual(sorted(gir_deps), sorted(SYMBOL_NAMES))
+        with open(self.deps_path, 'wb') as _:
+            pickle.dump((version + 1, gir_deps, gir_stamps), _)
+
+        self.__rewrite_gir(TEST_GIR_CONTENTS.replace(
+            'c:identifier="test_init"',
+            'c:identifier="test_init" throws="1"'))
+        extension = self.__make_extension([self.gir_file])
+        self.assertEqual(extension._GIExtension__gir_deps, {})
+        self.assertEqual(extension._GIExtension__gir_stamps, {})
+        self.assertEqual(self.__get_changed_symbols(extension), [])
+
+
+class TestIndexServerFallback(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.gir_file = write_file(self.__tmp_dir, 'Test-1.0.gir',
+                                   make_gir(TEST_GIR_CONTENTS))
+        gtkdoc_dir = os.path.join(self.__tmp_dir, 'html')
+        write_devhelp_book(gtkdoc_dir, 'glib', GLIB_ONLINE, GLIB_LINKS)
+
+        self.loaded = []
+
+        def _load_gir_index(gir_file):
+            self.loaded.append(gir_file)
+            return index_gir(gir_file)
+
+        self.extension = GIExtension.__new__(GIExtension)
+        self.extension._GIExtension__load_gir_index = _load_gir_index
+        self.extension._GIExtension__gtkdoc_hrefs = GtkDocLinkIndex(
+            gtkdoc_dir)
+        self.extension._GIExtension__reindexed_girs = set()
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def test_server_lost(self):
+        extension = self.extension
+        extension._GIExtension__use_index_server(
+            DeadClient(EOFError()), [(self.gir_file, False)])
+        self.assertEqual(self.loaded, [])
+
+        # Lookups go on in this process
+        gir_repo = extension._GIExtension__gir_repo
+        self.assertEqual(gir_repo.get_node('test_init').gi_name, 'Test.init')
+        self.assertEqual(self.loaded, [self.gir_file])
+        self.assertEqual(extension._GIExtension__gtkdoc_hrefs.get('g_free'),
+                         GLIB_ONLINE + GLIB_LINKS['g_free'])
+
+
+class FakeSymbol(object):
+    def __init__(self, unique_name):
+        self.unique_name = unique_name
+
+
+class FakePageLink(object):
+    def __init__(self, ref):
+        self.ref = ref
+
+
+class FakeGeneratedPage(object):
+    def __init__(self, ref, title, symbol_names):
+        self.link = FakePageLink(ref)
+        self.source_file = ref
+        self.title = title
+        self.symbols = [FakeSymbol(name) for name in symbol_names]
+        self.generated = True
+        self.is_stale = True
+
+    def get_title(self):
+        return self.title
+
+
+HREF_REGEX = re.compile(r'(?:href|url)="?([^">]+)"')
+
+
+class TestStubPages(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.__tmp_dir, 'output')
+        gir_file = write_file(self.__tmp_dir, 'Test-1.0.gir',
+                              make_gir(TEST_GIR_CONTENTS))
+        repository = GirRepository(index_gir)
+        repository.load(gir_file)
+
+        self.pages = [
+            FakeGeneratedPage('widget.html', 'TestWidget',
+                              ['TestWidget', 'test_widget_show']),
+            # Nothing it documents is introspectable
+            FakeGeneratedPage('hidden.html', 'Hidden <things>',
+                              ['test_widget_hidden'])]
+
+        self.extension = GIExtension.__new__(GIExtension)
+        self.extension._GIExtension__local = threading.local()
+        self.extension._GIExtension__gir_repo = repository
+        self.extension.formatters = {
+            'html': GIHtmlFormatter(self.extension, None)}
+
+        # Formatting pages writes them with links to every other page,
+        # like the sitemap each page embeds does
+        self.__format_page = BaseExtension.format_page
+
+        def _format_page(extension, page, link_resolver, output):
+            # pylint: disable=unused-argument
+            path = os.path.join(
+                output, extension.get_formatter('html').get_output_folder(),
+                page.link.ref)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as _:
+                for other in self.pages:
+                    _.write('<a href="%s">%s</a>\n' % (other.link.ref,
+                                                        other.get_title()))
+        BaseExtension.format_page = _format_page
+
+    def tearDown(self):
+        BaseExtension.format_page = self.__format_page
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def __format(self):
+        for page in self.pages:
+            for language in ('c', 'python', 'javascript'):
+                self.extension._GIExtension__format_page_in_language(
+                    page, language, None, self.output)
+
+    def test_links(self):
+        self.__format()
+
+        html_dir = os.path.join(self.output, 'html')
+        for language in ('c', 'python', 'javascript'):
+            for page in self.pages:
+                path = os.path.join(html_dir, language, page.link.ref)
+                with open(path) as _:
+                    hrefs = HREF_REGEX.findall(_.read())
+                self.assertTrue(hrefs)
+                for href in hrefs:
+                    target = os.path.normpath(
+                        os.path.join(os.path.dirname(path), href))
+                    self.assertTrue(os.path.isfile(target),
+                                    '%s links to missing %s' % (path, href))
+
+    def test_stub(self):
+        self.__format()
+
+        path = os.path.join(self.output, 'html', 'python', 'hidden.html')
+        with open(path) as _:
+            stub = _.read()
+        self.assertEqual(set(HREF_REGEX.findall(stub)),
+                         set(['../c/hidden.html']))
+        self.assertIn('Hidden &lt;things&gt;', stub)
+        self.assertNotIn('<a href="widget.html">', stub)
+
+    def test_not_stale(self):
+        self.pages[1].is_stale = False
+        self.__format()
+        self.assertFalse(os.path.exists(
+            os.path.join(self.output, 'html', 'python', 'hidden.html')))
+
+
+class FakeCreatedSymbol(object):
+    def __init__(self, type_, kwargs):
+        self.type_ = type_
+        self.unique_name = kwargs['display_name']
+        self.filename = kwargs['filename']
+
+
+class FakeDocDatabase(object):
+    def __init__(self):
+        self.symbols = {}
+        self.comments = []
+
+    def get_or_create_symbol(self, type_, **kwargs):
+        symbol = FakeCreatedSymbol(type_, kwargs)
+        self.symbols[symbol.unique_name] = symbol
+        return symbol
+
+    def add_comment(self, comment):
+        self.comments.append(comment.name)
+
+
+class FakeSymbolsDocRepo(object):
+    def __init__(self, change_tracker):
+        self.change_tracker = change_tracker
+        self.doc_database = FakeDocDatabase()
+        self.include_paths = []
+        self.tag_validators = {}
+
+
+# What test.h declares, and its gir describes. The class structure is
+# dropped by the smart index, enum members are symbols too.
+DECLARED_SYMBOLS = {
+    'TEST_VERSION': ConstantSymbol,
+    'TestWidget': StructSymbol,
+    'TestMode': EnumSymbol,
+    'TEST_MODE_FAST': Symbol,
+    'TestCallback': CallbackSymbol,
+    'test_widget_new': FunctionSymbol,
+    'test_widget_show': FunctionSymbol,
+}
+
+
+@unittest.skipIf(CExtension is None,
+                 'The C extension is needed to take headers from it')
+class TestSymbolsFromGir(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        src_dir = os.path.join(self.__tmp_dir, 'src', 'test')
+        os.makedirs(src_dir)
+        self.header = write_file(src_dir, 'test.h', TEST_HEADER)
+        # No gir file describes this one
+        self.other_header = write_file(src_dir, 'other.h',
+                                       'void other_init (void);\n')
+        self.gir_file = write_file(self.__tmp_dir, 'Test-1.0.gir',
+                                   make_gir(DECLARATIONS_GIR_CONTENTS))
+        self.__touch(self.gir_file, 10)
+
+        self.__sources = (GIExtension.sources, GIExtension.smart_index,
+                          CExtension.sources)
+        GIExtension.sources = [self.gir_file]
+        # The type macros and functions are only covered by the filters
+        # of the smart index
+        GIExtension.smart_index = True
+        CExtension.sources = [self.header, self.other_header]
+
+        self.change_tracker = ChangeTracker()
+
+    def tearDown(self):
+        GIExtension.sources, GIExtension.smart_index, CExtension.sources = \
+            self.__sources
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    @staticmethod
+    def __touch(path, seconds):
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + seconds))
+
+    def __run(self):
+        # Like GIExtension.setup, with --gi-symbols-from-gir
+        extension = GIExtension.__new__(GIExtension)
+        extension.doc_repo = FakeSymbolsDocRepo(self.change_tracker)
+        extension._BaseExtension__created_symbols = defaultdict(set)
+        extension._GIExtension__gir_headers = OrderedDict()
+        extension._GIExtension__dropped_symbols = set()
+        extension._GIExtension__gir_repo = GirRepository(index_gir)
+        extension._GIExtension__gir_repo.load(self.gir_file)
+        extension._GIExtension__take_gir_headers()
+        extension._GIExtension__create_gir_symbols()
+        return extension
+
+    def __get_symbols(self, extension):
+        return {name: symbol.type_ for name, symbol in
+                extension.doc_repo.doc_database.symbols.iteritems()}
+
+    def test_symbols(self):
+        extension = self.__run()
+        self.assertEqual(list(extension._GIExtension__gir_headers),
+                         [self.header])
+        self.assertEqual(self.__get_symbols(extension), DECLARED_SYMBOLS)
+        for symbol in extension.doc_repo.doc_database.symbols.values():
+            self.assertEqual(symbol.filename, self.header)
+        self.assertEqual(extension.doc_repo.doc_database.comments,
+                         ['TestWidgetClass'])
+
+        # The C extension is left with the other header only
+        self.assertEqual(
+            dict(self.change_tracker.mtimes['c-extension']),
+            {self.header: os.path.getmtime(self.header)})
+
+    def test_unchanged(self):
+        self.__run()
+        extension = self.__run()
+        self.assertEqual(list(extension._GIExtension__gir_headers),
+                         [self.header])
+        self.assertEqual(self.__get_symbols(extension), {})
+
+    def test_edited_header(self):
+        self.__run()
+        write_file(os.path.dirname(self.header), 'test.h',
+                   TEST_HEADER.replace('#define TEST_VERSION 3',
+                                       '#define TEST_VERSION 4'))
+        self.__touch(self.header, 20)
+        self.__touch(self.gir_file, 20)
+
+        extension = self.__run()
+        self.assertEqual(self.__get_symbols(extension), DECLARED_SYMBOLS)
+        self.assertEqual(self.change_tracker.mtimes['c-extension'][
+            self.header], os.path.getmtime(self.header))
+
+    def test_header_newer_than_gir(self):
+        self.__run()
+        self.__touch(self.header, 20)
+
+        # The C extension scans it again
+        extension = self.__run()
+        self.assertEqual(list(extension._GIExtension__gir_headers), [])
+        self.assertEqual(self.__get_symbols(extension), {})
+        self.assertNotIn(self.header,
+                         self.change_tracker.mtimes['c-extension'])
@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+# pylint: disable=too-few-public-methods
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from contextlib import contextmanager
+
+from hotdoc.core.base_formatter import Formatter
+from hotdoc.core.comment_block import Comment
+from hotdoc.core.links import Link, LinkResolver
+from hotdoc.parsers import cmark
+
+from hotdoc_gi_extension.gi_html_formatter import (
+    GIHtmlFormatter, FragmentCache, make_link_slot)
+from hotdoc_gi_extension.gi_extension import (
+    GIExtension, make_flags, FLAG_RUN_LAST, FLAG_NO_HOOKS, FLAG_READABLE)
+from hotdoc_gi_extension.gi_annotation_parser import GIAnnotation
+from hotdoc_gi_extension.gir_index import index_gir, GirRepository
+from hotdoc_gi_extension.gtkdoc_links import GtkDocLinkIndex
+from hotdoc_gi_extension.tests.girs import (
+    make_gir, write_file, TEST_GIR_CONTENTS)
+from hotdoc_gi_extension.tests.test_gtkdoc_links import write_devhelp_book
+
+
+class FakeLink(object):
+    def __init__(self, ref, title):
+        self.__ref = ref
+        self.__title = title
+
+    def get_link(self):
+        return self.__ref
+
+    def get_title(self):
+        return self.__title
+
+
+class FakeLinkResolver(object):
+    def __init__(self, links):
+        self.links = links
+        self.requested = []
+
+    def get_named_link(self, name):
+        self.requested.append(name)
+        return self.links.get(name)
+
+
+class FakeTemplate(object):
+    def __init__(self, name, rendered):
+        self.__name = name
+        self.__rendered = rendered
+
+    def render(self, context):
+        self.__rendered.append((self.__name, context))
+        return u'<%s %d>' % (self.__name, len(self.__rendered))
+
+
+class FakeEngine(object):
+    def __init__(self):
+        self.rendered = []
+
+    def get_template(self, name):
+        return FakeTemplate(name, self.rendered)
+
+
+class TestFragmentCache(unittest.TestCase):
+    def setUp(self):
+        self.formatter = GIHtmlFormatter.__new__(GIHtmlFormatter)
+        self.formatter.fragment_cache = FragmentCache()
+        self.formatter.engine = FakeEngine()
+
+    def __assert_counts(self, renders, hits, misses):
+        cache = self.formatter.fragment_cache
+        self.assertEqual(len(self.formatter.engine.rendered), renders)
+        self.assertEqual((cache.hits, cache.misses), (hits, misses))
+
+    def test_flags(self):
+        # pylint: disable=protected-access
+        mask = FLAG_RUN_LAST | FLAG_NO_HOOKS
+        # Flags are created anew for each symbol
+        first = self.formatter._format_flags(make_flags(mask))
+        self.__assert_counts(1, 0, 1)
+        self.assertIs(self.formatter._format_flags(make_flags(mask)), first)
+        self.__assert_counts(1, 1, 1)
+
+        self.assertIsNot(self.formatter._format_flags(
+            make_flags(FLAG_READABLE)), first)
+        self.__assert_counts(2, 1, 2)
+
+    def test_annotations(self):
+        annotations = [GIAnnotation('out', 'Out parameter'),
+                       GIAnnotation('element-type', 'Elements', 'utf8')]
+        first = self.formatter.format_annotations(annotations)
+        self.__assert_counts(1, 0, 1)
+        self.assertIs(self.formatter.format_annotations(
+            [GIAnnotation('out', 'Out parameter'),
+             GIAnnotation('element-type', 'Elements', 'utf8')]), first)
+        self.__assert_counts(1, 1, 1)
+        self.assertEqual(self.formatter.engine.rendered,
+                         [('gi_annotations.html',
+                           {'annotations': annotations})])
+
+        # The value and order of annotations make part of the key
+        self.formatter.format_annotations(
+            [GIAnnotation('out', 'Out parameter'),
+             GIAnnotation('element-type', 'Elements', 'gint')])
+        self.formatter.format_annotations(annotations[::-1])
+        self.__assert_counts(3, 1, 3)
+
+    def test_kinds(self):
+        # pylint: disable=protected-access
+        self.formatter._format_flags([])
+        self.formatter.format_annotations([])
+        self.__assert_counts(2, 0, 2)
+        self.assertEqual(len(self.formatter.fragment_cache), 2)
+
+
+class TestLinkSlots(unittest.TestCase):
+    def setUp(self):
+        # Filling slots doesn't depend on the state of the formatter
+        self.formatter = GIHtmlFormatter.__new__(GIHtmlFormatter)
+        self.link_resolver = FakeLinkResolver({
+            'gtk_widget_show': FakeLink('gtk3/gtk_widget_show.html#foo',
+                                        'gtk_widget_show'),
+            'GtkWidget': FakeLink('a b/it\'s.html?x=1&y=2', '<Widget> & "co"'),
+            'untitled': FakeLink('untitled.html', None),
+        })
+
+    def __fill(self, slotted):
+        # pylint: disable=protected-access
+        return self.formatter._GIHtmlFormatter__fill_link_slots(
+            slotted, self.link_resolver)
+
+    def __link(self, id_):
+        return u'<a href="%s">%s</a>' % (make_link_slot('R', id_),
+                                         make_link_slot('T', id_))
+
+    def test_fill(self):
+        self.assertEqual(
+            self.__fill(u'<p>See %s.</p>' % self.__link('gtk_widget_show')),
+            u'<p>See <a href="gtk3/gtk_widget_show.html#foo">'
+            u'gtk_widget_show</a>.</p>')
+
+    def test_escaping(self):
+        self.assertEqual(
+            self.__fill(self.__link('GtkWidget')),
+            u'<a href="a%20b/it&#x27;s.html?x=1&amp;y=2">'
+            u'&lt;Widget&gt; &amp; &quot;co&quot;</a>')
+
+    def test_unresolved(self):
+        # Unknown links keep their id as url and title, like cmark
+        self.assertEqual(self.__fill(self.__link('https://x.org/a b')),
+                         u'<a href="https://x.org/a%20b">'
+                         u'https://x.org/a b</a>')
+        # Links without a title are labelled with their id
+        self.assertEqual(self.__fill(self.__link('untitled')),
+                         u'<a href="untitled.html">untitled</a>')
+
+    def test_unicode(self):
+        self.assertEqual(self.__fill(self.__link(u'caf\xe9')),
+                         u'<a href="caf%C3%A9">caf\xe9</a>')
+
+    def test_resolved_once(self):
+        slotted = self.__link('gtk_widget_show') * 3
+        filled = self.__fill(slotted)
+        self.assertEqual(filled.count(u'gtk3/gtk_widget_show.html#foo'), 3)
+        # For both the ref and the title
+        self.assertEqual(self.link_resolver.requested, ['gtk_widget_show'])
+
+    def test_no_slots(self):
+        self.assertEqual(self.__fill(u'<p>GISLOT plain GISLOTR text</p>'),
+                         u'<p>GISLOT plain GISLOTR text</p>')
+
+
+class FakePageLink(object):
+    def __init__(self, ref):
+        self.ref = ref
+
+
+class FakePage(object):
+    def __init__(self, ref):
+        self.link = FakePageLink(ref)
+
+
+class FakeSymbol(object):
+    def __init__(self, unique_name, languages):
+        self.unique_name = unique_name
+        self.languages = languages
+        self.comment = None
+        self.detailed_description = None
+
+    def get_children_symbols(self):
+        return []
+
+    def update_children_comments(self):
+        pass
+
+
+class FakeExtension(object):
+    languages = ['c', 'python']
+
+    def __init__(self):
+        self.language = None
+
+    @contextmanager
+    def language_context(self, language):
+        self.language = language
+        try:
+            yield
+        finally:
+            self.language = None
+
+
+PAGE_TEMPLATE = (u'<html><body>'
+                 u'<div id="test_init"><p>init %(language)s</p></div>'
+                 u'<div id="test_c_only"><p>c_only %(language)s</p></div>'
+                 u'<div id="test_other"><p>other</p></div>'
+                 u'</body></html>')
+
+
+class TestPatchPage(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.extension = FakeExtension()
+        self.formatted = []
+
+        self.formatter = GIHtmlFormatter.__new__(GIHtmlFormatter)
+        # pylint: disable=protected-access
+        self.formatter._GIHtmlFormatter__gi_extension = self.extension
+        self.formatter._GIHtmlFormatter__link_resolver = None
+        self.formatter.format_comment = lambda comment, link_resolver: None
+        self.formatter._format_symbol = self.__format_symbol
+        Formatter.formatting_symbol_signal.connect(self.__formatting_symbol)
+
+        for language in FakeExtension.languages:
+            os.mkdir(os.path.join(self.__tmp_dir, language))
+            with open(self.__page_path(language), 'w') as _:
+                _.write(PAGE_TEMPLATE % {'language': language})
+
+    def tearDown(self):
+        Formatter.formatting_symbol_signal.disconnect(self.__formatting_symbol)
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def __page_path(self, language):
+        return os.path.join(self.__tmp_dir, language, 'test.html')
+
+    def __read_page(self, language):
+        with open(self.__page_path(language)) as _:
+            return _.read()
+
+    def __formatting_symbol(self, formatter, symbol):
+        # Like GIExtension, for the symbols without bindings
+        return self.extension.language in symbol.languages
+
+    def __format_symbol(self, symbol):
+        self.formatted.append((self.extension.language, symbol.unique_name))
+        return (u'<div id="%s"><p>patched %s</p></div>' %
+                (symbol.unique_name, self.extension.language), False)
+
+    def test_patch(self):
+        symbols = [FakeSymbol('test_init', ('c', 'python')),
+                   FakeSymbol('test_c_only', ('c',))]
+        self.formatter.patch_page_symbols(FakePage('test.html'), symbols,
+                                          self.__tmp_dir)
+
+        self.assertEqual(self.formatted, [('c', 'test_init'),
+                                          ('c', 'test_c_only'),
+                                          ('python', 'test_init')])
+
+        c_page = self.__read_page('c')
+        self.assertIn('<p>patched c</p></div><div id="test_c_only">'
+                      '<p>patched c</p>', c_page)
+        self.assertIn('<p>other</p>', c_page)
+
+        # The description formatted in C isn't patched into python pages
+        python_page = self.__read_page('python')
+        self.assertIn('<div id="test_init"><p>patched python</p>',
+                      python_page)
+        self.assertIn('<div id="test_c_only"><p>c_only python</p>',
+                      python_page)
+        self.assertNotIn('patched c', python_page)
+
+    def test_patch_single_symbol(self):
+        self.formatter.patch_page(FakePage('test.html'),
+                                  FakeSymbol('test_c_only', ('c',)),
+                                  self.__tmp_dir)
+
+        self.assertIn('<div id="test_c_only"><p>patched c</p>',
+                      self.__read_page('c'))
+        # Pages without anything to patch are left untouched
+        self.assertEqual(self.__read_page('python'),
+                         PAGE_TEMPLATE % {'language': 'python'})
+
+
+class CmarkDocstringFormatter(object):
+    """Renders gtk-doc comments with hotdoc's cmark module."""
+    def comment_to_ast(self, comment, link_resolver):
+        return cmark.gtkdoc_to_ast(comment.description, link_resolver)
+
+    def ast_to_html(self, ast, link_resolver):
+        return cmark.ast_to_html(ast, link_resolver)
+
+
+class FakeDocDatabase(object):
+    # pylint: disable=unused-argument
+    def get_symbol(self, name):
+        return None
+
+
+GTK_ONLINE = 'https://developer.gnome.org/gtk3/stable/'
+
+
+class TestCommentLinks(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        gtkdoc_dir = os.path.join(self.__tmp_dir, 'html')
+        write_devhelp_book(gtkdoc_dir, 'gtk3', GTK_ONLINE,
+                           {'GtkWidget': 'GtkWidget.html#GtkWidget-struct'})
+        gir_file = write_file(self.__tmp_dir, 'Test-1.0.gir',
+                              make_gir(TEST_GIR_CONTENTS))
+        repository = GirRepository(index_gir)
+        repository.load(gir_file)
+
+        # Only what resolving links relies on
+        # pylint: disable=protected-access
+        self.extension = GIExtension.__new__(GIExtension)
+        self.extension._GIExtension__local = threading.local()
+        self.extension._GIExtension__gir_repo = repository
+        self.extension._GIExtension__gtkdoc_hrefs = GtkDocLinkIndex(gtkdoc_dir)
+        self.extension._GIExtension__link_resolutions = {}
+        self.extension._GIExtension__link_resolution_hits = 0
+        self.extension._GIExtension__link_resolution_misses = 0
+        self.__handlers = [
+            (Link.resolving_link_signal,
+             self.extension._GIExtension__translate_link_ref),
+            (Link.resolving_title_signal,
+             self.extension._GIExtension__translate_link_title),
+            (LinkResolver.get_link_signal,
+             self.extension._GIExtension__search_legacy_links)]
+        for signal, handler in self.__handlers:
+            signal.connect(handler)
+
+        self.formatter = GIHtmlFormatter.__new__(GIHtmlFormatter)
+        self.formatter._GIHtmlFormatter__gi_extension = self.extension
+        self.formatter._docstring_formatter = CmarkDocstringFormatter()
+
+    def tearDown(self):
+        for signal, handler in self.__handlers:
+            signal.disconnect(handler)
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def __format_languages(self, description):
+        # Like hotdoc, which resolves links with the same resolver for
+        # every page and language
+        comment = Comment(name='test_init', description=description)
+        link_resolver = LinkResolver(FakeDocDatabase())
+        res = {}
+        for language in ('c', 'python', 'javascript'):
+            with self.extension.language_context(language):
+                # pylint: disable=protected-access
+                res[language] = self.formatter._format_comment(
+                    comment, link_resolver)
+        return comment, res
+
+    def test_gtkdoc_link(self):
+        comment, formatted = self.__format_languages(u'See #GtkWidget.')
+
+        # Comments are rendered once, with slots for the links
+        slotted = comment.extension_attrs['gi-extension']['slotted']
+        self.assertIn(make_link_slot('R', u'GtkWidget'), slotted)
+
+        for language in ('c', 'python', 'javascript'):
+            self.assertIn(u'<a href="%sGtkWidget.html#GtkWidget-struct">' %
+                          GTK_ONLINE, formatted[language])
+
+    def test_gtkdoc_link_without_context(self):
+        # Like when other extensions format their pages
+        link_resolver = LinkResolver(FakeDocDatabase())
+        self.assertIsNone(self.extension.get_language_context())
+        link = link_resolver.get_named_link('GtkWidget')
+        self.assertEqual(link.get_link(),
+                         GTK_ONLINE + 'GtkWidget.html#GtkWidget-struct')
+        self.assertEqual(link.get_title(), 'GtkWidget')
+        self.assertIsNone(link_resolver.get_named_link('GtkNope'))
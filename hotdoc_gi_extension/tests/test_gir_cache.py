@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from hotdoc_gi_extension.gir_index import index_gir, get_record_state
+from hotdoc_gi_extension.gir_cache import (
+    GirCache, SharedGirCache, make_stamp, check_stamp, CACHE_VERSION)
+from hotdoc_gi_extension.tests.girs import (
+    make_gir, write_file, TEST_GIR_CONTENTS)
+
+
+class TestStamps(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.gir_file = write_file(self.__tmp_dir, 'Test-1.0.gir',
+                                   make_gir(TEST_GIR_CONTENTS))
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def test_unchanged(self):
+        stamp = make_stamp(self.gir_file)
+        self.assertIs(check_stamp(self.gir_file, stamp), False)
+
+    def test_touched(self):
+        stamp = make_stamp(self.gir_file)
+        os.utime(self.gir_file, (stamp[1] + 10, stamp[1] + 10))
+        # Same contents, the stamp is valid but needs a refresh
+        self.assertIs(check_stamp(self.gir_file, stamp), True)
+
+    def test_changed(self):
+        stamp = make_stamp(self.gir_file)
+        write_file(self.__tmp_dir, 'Test-1.0.gir',
+                   make_gir(TEST_GIR_CONTENTS, namespace='Other'))
+        self.assertIsNone(check_stamp(self.gir_file, stamp))
+
+    def test_same_size_changed(self):
+        stamp = make_stamp(self.gir_file)
+        write_file(self.__tmp_dir, 'Test-1.0.gir',
+                   make_gir(TEST_GIR_CONTENTS, namespace='Tess'))
+        os.utime(self.gir_file, (stamp[1] + 10, stamp[1] + 10))
+        self.assertEqual(os.path.getsize(self.gir_file), stamp[2])
+        self.assertIsNone(check_stamp(self.gir_file, stamp))
+
+    def test_other_version(self):
+        stamp = (CACHE_VERSION - 1,) + make_stamp(self.gir_file)[1:]
+        self.assertIsNone(check_stamp(self.gir_file, stamp))
+
+
+class CacheTestMixin(object):
+    cache_class = None
+
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.__tmp_dir, 'cache')
+        self.gir_file = write_file(self.__tmp_dir, 'Test-1.0.gir',
+                                   make_gir(TEST_GIR_CONTENTS))
+        self.index = index_gir(self.gir_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def __set_mtime(self, mtime):
+        os.utime(self.gir_file, (mtime, mtime))
+
+    def assertSameIndex(self, loaded, index):
+        self.assertEqual(loaded.namespace, index.namespace)
+        self.assertEqual(loaded.version, index.version)
+        self.assertEqual(loaded.includes, index.includes)
+        self.assertEqual(loaded.get_type_functions, index.get_type_functions)
+        self.assertEqual(loaded.smart_filters, index.smart_filters)
+        self.assertEqual(loaded.python_names, index.python_names)
+        self.assertEqual(loaded.non_introspectable,
+                         index.non_introspectable)
+        self.assertEqual(loaded.foreign_type_refs, index.foreign_type_refs)
+        self.assertEqual(sorted(name for name, _ in
+                                loaded.nodes.iteritems()),
+                         sorted(index.nodes))
+        for name, node in index.nodes.iteritems():
+            self.assertEqual(get_record_state(loaded.nodes.get(name)),
+                             get_record_state(node))
+        for name, node in index.class_nodes.iteritems():
+            self.assertEqual(get_record_state(loaded.class_nodes.get(name)),
+                             get_record_state(node))
+
+    def test_missing(self):
+        cache = self.cache_class(self.cache_dir)
+        self.assertIsNone(cache.load(self.gir_file))
+
+    def test_round_trip(self):
+        self.cache_class(self.cache_dir).store(self.gir_file, self.index)
+        loaded = self.cache_class(self.cache_dir).load(self.gir_file)
+        self.assertSameIndex(loaded, self.index)
+
+    def test_changed_gir(self):
+        self.cache_class(self.cache_dir).store(self.gir_file, self.index)
+        write_file(os.path.dirname(self.gir_file), 'Test-1.0.gir',
+                   make_gir(TEST_GIR_CONTENTS, namespace='Other'))
+        self.assertIsNone(
+            self.cache_class(self.cache_dir).load(self.gir_file))
+
+    def test_touched_gir(self):
+        self.__set_mtime(1000000000)
+        self.cache_class(self.cache_dir).store(self.gir_file, self.index)
+        self.__set_mtime(1000000010)
+        loaded = self.cache_class(self.cache_dir).load(self.gir_file)
+        self.assertSameIndex(loaded, self.index)
+
+        # The entry was refreshed with the new mtime
+        stamp = make_stamp(self.gir_file)
+        os.remove(self.gir_file)
+        write_file(os.path.dirname(self.gir_file), 'Test-1.0.gir',
+                   'Not even a gir, but has to be the same size'.ljust(
+                       stamp[2]))
+        self.__set_mtime(stamp[1])
+        loaded = self.cache_class(self.cache_dir).load(self.gir_file)
+        self.assertSameIndex(loaded, self.index)
+
+    def test_corrupt_entry(self):
+        cache = self.cache_class(self.cache_dir)
+        cache.store(self.gir_file, self.index)
+        for name in os.listdir(self.cache_dir):
+            write_file(self.cache_dir, name, 'garbage')
+        self.assertIsNone(
+            self.cache_class(self.cache_dir).load(self.gir_file))
+
+
+class TestGirCache(CacheTestMixin, unittest.TestCase):
+    cache_class = GirCache
+
+
+class TestSharedGirCache(CacheTestMixin, unittest.TestCase):
+    cache_class = SharedGirCache
+
+    def test_shared_records(self):
+        cache = SharedGirCache(self.cache_dir)
+        cache.store(self.gir_file, self.index)
+        loaded = cache.load(self.gir_file)
+        self.assertIs(loaded.nodes.get('TestWidget'),
+                      loaded.nodes.get('TestWidget::TestWidget'))
+        self.assertIs(loaded.nodes.get('TestWidget'),
+                      loaded.class_nodes.get('Test.Widget'))
+        self.assertIsNone(loaded.nodes.get('nope'))
+
+    def test_mapped_once(self):
+        cache = SharedGirCache(self.cache_dir)
+        cache.store(self.gir_file, self.index)
+        loaded = cache.load(self.gir_file)
+        self.assertIs(cache.load(self.gir_file), loaded)
+
+        write_file(os.path.dirname(self.gir_file), 'Test-1.0.gir',
+                   make_gir(TEST_GIR_CONTENTS, namespace='Other'))
+        self.assertIsNone(cache.load(self.gir_file))
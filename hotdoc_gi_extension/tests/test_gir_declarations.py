@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from hotdoc_gi_extension.gir_index import index_gir
+from hotdoc_gi_extension.gir_declarations import (
+    index_declarations, match_header, scan_header)
+from hotdoc_gi_extension.tests.girs import make_gir, write_file
+
+
+TEST_HEADER = '''#ifndef __TEST_H__
+#define __TEST_H__
+
+#include <glib-object.h>
+
+G_BEGIN_DECLS
+
+#define TEST_TYPE_WIDGET (test_widget_get_type ())
+TEST_AVAILABLE_IN_ALL
+G_DECLARE_DERIVABLE_TYPE (TestWidget, test_widget, TEST, WIDGET, GObject)
+
+/**
+ * TestWidgetClass:
+ * @draw: draws the widget
+ */
+struct _TestWidgetClass
+{
+  GObjectClass parent_class;
+
+  void (*draw) (TestWidget *widget);
+};
+
+typedef enum {
+  TEST_MODE_FAST = 1
+} TestMode;
+
+typedef void (*TestCallback) (gpointer user_data);
+
+TEST_AVAILABLE_IN_ALL
+TestWidget *test_widget_new (void) G_GNUC_WARN_UNUSED_RESULT;
+TEST_DEPRECATED_FOR(test_widget_new)
+gboolean test_widget_show (TestWidget *widget, gint *count, GError **error);
+
+#define TEST_VERSION 3
+
+G_DEFINE_AUTOPTR_CLEANUP_FUNC (TestWidget, g_object_unref)
+
+G_END_DECLS
+
+#endif /* __TEST_H__ */
+'''
+
+
+DECLARATIONS_GIR_CONTENTS = '''
+    <constant name="VERSION" value="3" c:type="TEST_VERSION">
+      <source-position filename="../src/test/test.h" line="34"/>
+      <type name="gint" c:type="gint"/>
+    </constant>
+    <class name="Widget" c:type="TestWidget" c:symbol-prefix="widget"
+           parent="GObject.Object" glib:type-name="TestWidget"
+           glib:get-type="test_widget_get_type"
+           glib:type-struct="WidgetClass">
+      <source-position filename="../src/test/test.h" line="10"/>
+      <constructor name="new" c:identifier="test_widget_new">
+        <source-position filename="../src/test/test.h" line="30"/>
+        <return-value transfer-ownership="full">
+          <type name="Widget" c:type="TestWidget*"/>
+        </return-value>
+      </constructor>
+      <method name="show" c:identifier="test_widget_show" throws="1">
+        <source-position filename="../src/test/test.h" line="32"/>
+        <return-value transfer-ownership="none">
+          <type name="gboolean" c:type="gboolean"/>
+        </return-value>
+        <parameters>
+          <instance-parameter name="widget" transfer-ownership="none">
+            <type name="Widget" c:type="TestWidget*"/>
+          </instance-parameter>
+          <parameter name="count" direction="out">
+            <type name="gint" c:type="gint*"/>
+          </parameter>
+        </parameters>
+      </method>
+    </class>
+    <record name="WidgetClass" c:type="TestWidgetClass"
+            glib:is-gtype-struct-for="Widget">
+      <source-position filename="../src/test/test.h" line="16"/>
+      <field name="parent_class">
+        <type name="GObject.ObjectClass" c:type="GObjectClass"/>
+      </field>
+      <field name="draw">
+        <callback name="draw">
+          <return-value transfer-ownership="none">
+            <type name="none" c:type="void"/>
+          </return-value>
+          <parameters>
+            <parameter name="widget" transfer-ownership="none">
+              <type name="Widget" c:type="TestWidget*"/>
+            </parameter>
+          </parameters>
+        </callback>
+      </field>
+    </record>
+    <enumeration name="Mode" c:type="TestMode">
+      <source-position filename="../src/test/test.h" line="25"/>
+      <member name="fast" value="1" c:identifier="TEST_MODE_FAST">
+      </member>
+    </enumeration>
+    <callback name="Callback" c:type="TestCallback">
+      <source-position filename="../src/test/test.h" line="27"/>
+      <return-value transfer-ownership="none">
+        <type name="none" c:type="void"/>
+      </return-value>
+      <parameters>
+        <parameter name="user_data" transfer-ownership="none">
+          <type name="gpointer" c:type="gpointer"/>
+        </parameter>
+      </parameters>
+    </callback>
+'''
+
+
+class TestIndexDeclarations(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.gir_file = write_file(self.__tmp_dir, 'Test-1.0.gir',
+                                   make_gir(DECLARATIONS_GIR_CONTENTS))
+        self.declarations = index_declarations(self.gir_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def __get(self, name):
+        for decl in self.declarations.headers['../src/test/test.h']:
+            if decl.name == name:
+                return decl
+        return None
+
+    def test_names(self):
+        self.assertEqual(self.declarations.gir_file, self.gir_file)
+        self.assertEqual(list(self.declarations.headers),
+                         ['../src/test/test.h'])
+        self.assertEqual(self.declarations.names, set([
+            'TEST_VERSION', 'TestWidget', 'test_widget_new',
+            'test_widget_show', 'TestWidgetClass', 'TestMode',
+            'TEST_MODE_FAST', 'TestCallback']))
+
+    def test_functions(self):
+        decl = self.__get('test_widget_show')
+        self.assertEqual(decl.kind, 'function')
+        self.assertEqual(decl.lineno, 32)
+        self.assertEqual(decl.parameters, (('widget', 'TestWidget*'),
+                                           ('count', 'gint*'),
+                                           ('error', 'GError**')))
+        self.assertTrue(decl.throws)
+        self.assertEqual(decl.return_type, 'gboolean')
+
+        decl = self.__get('test_widget_new')
+        self.assertEqual(decl.parameters, ())
+        self.assertEqual(decl.return_type, 'TestWidget*')
+
+    def test_types(self):
+        decl = self.__get('TestWidgetClass')
+        self.assertEqual(decl.kind, 'struct')
+        self.assertFalse(decl.opaque)
+        (parent_name, parent_type, parent_callback), \
+            (draw_name, draw_type, draw_callback) = decl.members
+        self.assertEqual((parent_name, parent_type, parent_callback),
+                         ('parent_class', 'GObjectClass', None))
+        self.assertEqual((draw_name, draw_type), ('draw', None))
+        self.assertEqual(draw_callback.kind, 'callback')
+        self.assertEqual(draw_callback.parameters,
+                         (('widget', 'TestWidget*'),))
+        self.assertIsNone(draw_callback.return_type)
+
+        # Classes have no fields in this gir
+        self.assertTrue(self.__get('TestWidget').opaque)
+
+        decl = self.__get('TestMode')
+        self.assertEqual(decl.kind, 'enum')
+        self.assertEqual(decl.members, (('TEST_MODE_FAST', 1),))
+
+        decl = self.__get('TestCallback')
+        self.assertEqual(decl.kind, 'callback')
+        self.assertEqual(decl.parameters, (('user_data', 'gpointer'),))
+
+        decl = self.__get('TEST_VERSION')
+        self.assertEqual(decl.kind, 'constant')
+        self.assertEqual((decl.c_type, decl.value), ('gint', '3'))
+
+
+class TestMatchHeader(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.build_dir = os.path.join(self.__tmp_dir, 'build')
+        self.src_dir = os.path.join(self.__tmp_dir, 'src', 'test')
+        os.mkdir(self.build_dir)
+        os.makedirs(self.src_dir)
+        self.header = write_file(self.src_dir, 'test.h', TEST_HEADER)
+        self.gir_file = os.path.join(self.build_dir, 'Test-1.0.gir')
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def test_exact(self):
+        self.assertEqual(
+            match_header(self.header, self.gir_file,
+                         ['../src/test/test.h', 'test/test.h']),
+            '../src/test/test.h')
+
+    def test_trailing_path(self):
+        # Relative to a directory g-ir-scanner ran in, which isn't known
+        self.assertEqual(
+            match_header(self.header, self.gir_file,
+                         ['test/test.h', 'other/test.h', 'test/other.h']),
+            'test/test.h')
+
+    def test_ambiguous(self):
+        self.assertIsNone(
+            match_header(self.header, self.gir_file,
+                         ['a/test/test.h', 'b/test/test.h']))
+        self.assertIsNone(
+            match_header(self.header, self.gir_file, ['test/other.h']))
+
+
+class TestScanHeader(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def __scan(self, source):
+        return scan_header(write_file(self.__tmp_dir, 'test.h', source))
+
+    def __assertUnclassified(self, source, lineno):
+        scan = self.__scan(source)
+        self.assertEqual([line for line, _ in scan.unclassified], [lineno])
+
+    def test_header(self):
+        scan = self.__scan(TEST_HEADER)
+        self.assertEqual(scan.unclassified, [])
+        self.assertEqual(scan.names, {
+            'TEST_TYPE_WIDGET': 8,
+            'TestWidget': 10, 'TestWidgetClass': 10,
+            'test_widget_get_type': 10, 'TEST_WIDGET': 10,
+            'TEST_IS_WIDGET': 10, 'TEST_WIDGET_CLASS': 10,
+            'TEST_IS_WIDGET_CLASS': 10, 'TEST_WIDGET_GET_CLASS': 10,
+            'TEST_MODE_FAST': 24, 'TestMode': 25, 'TestCallback': 27,
+            'test_widget_new': 30, 'test_widget_show': 32,
+            'TEST_VERSION': 34})
+
+        self.assertEqual(scan.texts['TEST_VERSION'], '#define TEST_VERSION 3')
+        self.assertEqual(scan.texts['TestMode'],
+                         'typedef enum {\n  TEST_MODE_FAST = 1\n} TestMode;')
+        self.assertIn('void (*draw) (TestWidget *widget);',
+                      scan.texts['_TestWidgetClass'])
+        self.assertEqual(scan.comments, [(
+            '/**\n * TestWidgetClass:\n * @draw: draws the widget\n */',
+            12, 15)])
+
+    def test_covered(self):
+        gir_file = write_file(self.__tmp_dir, 'Test-1.0.gir',
+                              make_gir(DECLARATIONS_GIR_CONTENTS))
+        gir_index = index_gir(gir_file)
+        known_names = index_declarations(gir_file).names | \
+            gir_index.smart_filters | gir_index.get_type_functions
+
+        scan = self.__scan(TEST_HEADER)
+        self.assertEqual(set(scan.names) - known_names, set())
+
+        # Names the gir doesn't know about aren't covered
+        scan = self.__scan(TEST_HEADER.replace(
+            '#define TEST_VERSION 3',
+            '#define TEST_VERSION 3\n#define TEST_CHECK(x) (x)\n'
+            'void test_private (void);'))
+        self.assertEqual(set(scan.names) - known_names,
+                         set(['TEST_CHECK', 'test_private']))
+
+    def test_cplusplus(self):
+        scan = self.__scan('#ifdef __cplusplus\nextern "C" {\n#endif\n'
+                           'int y;\n'
+                           '#ifdef __cplusplus\n}\n#endif\n')
+        self.assertEqual(scan.unclassified, [])
+        self.assertEqual(list(scan.names), ['y'])
+
+    def test_conditionals(self):
+        self.__assertUnclassified('#ifndef G\n#define G\nint a;\n'
+                                  '#ifdef X\nint b;\n#endif\n#endif\n', 5)
+        self.__assertUnclassified('int q;\n#ifdef FOO\n#define BAR 1\n'
+                                  '#endif\n', 3)
+        self.__assertUnclassified('#if 0\n#else\nint c;\n#endif\n', 3)
+
+        # Conditionals declaring nothing are fine
+        scan = self.__scan('#if !defined(A) && !defined(B)\n#error "no"\n'
+                           '#endif\nint z;\n')
+        self.assertEqual(scan.unclassified, [])
+        self.assertEqual(list(scan.names), ['z'])
+
+    def test_macro_invocations(self):
+        self.__assertUnclassified('int x;\nG_STATIC_ASSERT (1);\n', 2)
+        self.__assertUnclassified('TEST_DECLARE_THING (Thing)\nint x;\n', 1)
+
+    def test_not_understood(self):
+        self.__assertUnclassified('int (*weird (void)) (int);\n', 1)
+        self.__assertUnclassified('int a;\nstruct _A { int x; };\n}\n', 3)
+
+    def test_forward_declarations(self):
+        scan = self.__scan('struct _TestThing;\n'
+                           'typedef struct _TestThing TestThing;\n')
+        self.assertEqual(scan.unclassified, [])
+        self.assertEqual(list(scan.names), ['TestThing'])
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+
+import shutil
+import tempfile
+import unittest
+
+from hotdoc_gi_extension.gir_index import (
+    index_gir, read_gir_header, GirRepository)
+from hotdoc_gi_extension.gir_hierarchy import GirHierarchy
+from hotdoc_gi_extension.tests.girs import (
+    make_gir, write_file, TEST_GIR_CONTENTS)
+
+
+GOBJECT_GIR_CONTENTS = '''
+    <class name="Object" c:type="GObject" c:symbol-prefix="object"
+           glib:type-name="GObject" glib:get-type="g_object_get_type">
+    </class>
+'''
+
+
+class TestGirHierarchy(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        gir_file = write_file(self.__tmp_dir, 'Test-1.0.gir',
+                              make_gir(TEST_GIR_CONTENTS))
+        gobject_gir_file = write_file(
+            self.__tmp_dir, 'GObject-2.0.gir',
+            make_gir(GOBJECT_GIR_CONTENTS, namespace='GObject',
+                     identifier_prefix='G', symbol_prefix='g', includes=()))
+        self.repository = GirRepository(index_gir)
+        self.repository.load(gir_file)
+        self.repository.register(gobject_gir_file,
+                                 read_gir_header(gobject_gir_file))
+        self.hierarchy = GirHierarchy(self.repository)
+        self.hierarchy.build()
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def test_parents(self):
+        self.assertEqual(self.hierarchy.get_parent('Test.ToggleButton'),
+                         'Test.Button')
+        self.assertEqual(self.hierarchy.get_parent('Test.Button'),
+                         'Test.Widget')
+        # Parents of other namespaces are loaded as needed
+        self.assertEqual(self.hierarchy.get_parent('Test.Widget'),
+                         'GObject.Object')
+        self.assertIsNone(self.hierarchy.get_parent('GObject.Object'))
+        self.assertIsNone(self.hierarchy.get_parent('Test.Nope'))
+
+    def test_symbols(self):
+        symbol = self.hierarchy.get_symbol('Test.Widget')
+        self.assertIs(self.hierarchy.get_symbol('Test.Widget'), symbol)
+        self.assertIsNot(self.hierarchy.get_symbol('Test.Button'), symbol)
+
+    def test_hierarchy(self):
+        get_symbol = self.hierarchy.get_symbol
+        self.assertEqual(self.hierarchy.get_hierarchy('Test.ToggleButton'),
+                         [get_symbol('GObject.Object'),
+                          get_symbol('Test.Widget'),
+                          get_symbol('Test.Button')])
+        self.assertEqual(self.hierarchy.get_hierarchy('Test.Widget'),
+                         [get_symbol('GObject.Object')])
+        self.assertEqual(self.hierarchy.get_hierarchy('GObject.Object'), [])
+        self.assertEqual(self.hierarchy.get_hierarchy('Test.Nope'), [])
+
+    def test_children(self):
+        get_symbol = self.hierarchy.get_symbol
+        self.assertEqual(self.hierarchy.get_children('Test.Widget'),
+                         {'TestButton': get_symbol('Test.Button')})
+        self.assertEqual(self.hierarchy.get_children('GObject.Object'),
+                         {'TestWidget': get_symbol('Test.Widget')})
+        self.assertEqual(self.hierarchy.get_children('Test.ToggleButton'),
+                         {})
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from hotdoc_gi_extension.gir_index import (
+    index_gir, read_gir_header, get_record_state, GirRepository,
+    PartialGirIndex, GirCallable, UnknownField)
+from hotdoc_gi_extension.tests.girs import (
+    make_gir, write_file, TEST_GIR_CONTENTS)
+
+
+GIO_GIR_CONTENTS = '''
+    <interface name="File" c:type="GFile" c:symbol-prefix="file"
+               glib:type-name="GFile" glib:get-type="g_file_get_type"
+               introspectable="0">
+    </interface>
+'''
+
+
+class TestGirIndex(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.gir_file = write_file(self.__tmp_dir, 'Test-1.0.gir',
+                                   make_gir(TEST_GIR_CONTENTS))
+        self.index = index_gir(self.gir_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def test_header(self):
+        self.assertEqual(self.index.namespace, 'Test')
+        self.assertEqual(self.index.version, '1.0')
+        self.assertEqual(self.index.identifier_prefixes, ('Test',))
+        self.assertEqual(self.index.symbol_prefixes, ('test',))
+        self.assertEqual(self.index.includes, [('GObject', '2.0')])
+
+        header = read_gir_header(self.gir_file)
+        self.assertEqual(header.namespace, 'Test')
+        self.assertEqual(header.includes, [('GObject', '2.0')])
+
+    def test_function(self):
+        node = self.index.nodes['test_init']
+        self.assertEqual(node.tag, 'function')
+        self.assertEqual(node.gi_name, 'Test.init')
+        self.assertEqual(node.c_identifier, 'test_init')
+        self.assertIsNone(node.instance_parameter)
+        self.assertEqual(node.parameters, ())
+        self.assertEqual(node.return_value.type_name, 'none')
+
+    def test_method(self):
+        node = self.index.nodes['test_widget_show']
+        self.assertEqual(node.tag, 'method')
+        self.assertEqual(node.gi_name, 'Test.Widget.show')
+        self.assertTrue(node.throws)
+
+        instance = node.instance_parameter
+        self.assertEqual(instance.name, 'widget')
+        self.assertEqual(instance.c_type, 'TestWidget*')
+        self.assertEqual(instance.type_name, 'Widget')
+
+        count, names, varargs = node.parameters
+        self.assertEqual(count.direction, 'out')
+        self.assertEqual((count.c_type, count.type_name), ('gint*', 'gint'))
+        # Arrays are described by the type of their elements
+        self.assertEqual(names.direction, 'in')
+        self.assertEqual((names.c_type, names.type_name), ('gchar*', 'utf8'))
+        self.assertEqual((varargs.c_type, varargs.type_name),
+                         ('...', 'valist'))
+
+        self.assertEqual(node.return_value.c_type, 'gboolean')
+
+    def test_class(self):
+        node = self.index.nodes['TestWidget']
+        self.assertIs(self.index.nodes['TestWidget::TestWidget'], node)
+        self.assertIs(self.index.class_nodes['Test.Widget'], node)
+        self.assertEqual(node.klass_name, 'TestWidget')
+        self.assertEqual(node.parent, 'GObject.Object')
+        self.assertEqual(node.type_struct, 'WidgetClass')
+        self.assertEqual(node.implements, ('Sizable',))
+
+        self.assertIn('test_widget_get_type', self.index.get_type_functions)
+        for name in ('TEST_WIDGET', 'TEST_IS_WIDGET', 'TEST_TYPE_WIDGET',
+                     'TEST_WIDGET_CLASS', 'TEST_WIDGET_GET_CLASS'):
+            self.assertIn(name, self.index.smart_filters)
+
+    def test_class_members(self):
+        node = self.index.nodes['TestWidget']
+
+        signal = self.index.nodes['TestWidget::clicked']
+        self.assertEqual(node.signals, (signal,))
+        self.assertEqual(signal.gi_name, 'Test.Widget.clicked')
+        self.assertEqual(signal.when, 'last')
+        self.assertTrue(signal.no_hooks)
+        self.assertEqual(signal.parameters[0].type_name, 'guint')
+
+        prop = self.index.nodes['TestWidget:label']
+        self.assertEqual(node.properties, (prop,))
+        self.assertEqual(prop.type_.type_name, 'utf8')
+        self.assertTrue(prop.writable)
+        self.assertTrue(prop.construct)
+        self.assertFalse(prop.construct_only)
+
+        vfunc = self.index.nodes['TestWidget:::draw']
+        self.assertEqual(node.virtual_methods, (vfunc,))
+        self.assertEqual(vfunc.instance_parameter.type_name, 'Widget')
+
+    def test_records(self):
+        klass = self.index.nodes['TestWidgetClass']
+        self.assertEqual(klass.is_gtype_struct_for, 'Widget')
+        self.assertFalse(klass.disguised)
+        self.assertTrue(self.index.nodes['TestWidgetPrivate'].disguised)
+
+    def test_enum_and_callback(self):
+        self.assertEqual(self.index.nodes['TestMode'].tag, 'enumeration')
+        self.assertEqual(self.index.nodes['TEST_MODE_FAST'].gi_name,
+                         'Test.Mode.fast')
+
+        callback = self.index.nodes['TestCallback']
+        self.assertIsInstance(callback, GirCallable)
+        self.assertEqual(callback.parameters[0].name, 'user_data')
+
+    def test_class_without_c_type(self):
+        gir_file = write_file(self.__tmp_dir, 'Untyped-1.0.gir', make_gir('''
+    <class name="Param" glib:type-name="TestParam"
+           glib:get-type="test_param_get_type" glib:fundamental="1">
+      <method name="ref" c:identifier="test_param_ref">
+        <return-value transfer-ownership="none">
+          <type name="none" c:type="void"/>
+        </return-value>
+      </method>
+    </class>
+    <interface name="Untyped" c:symbol-prefix="untyped"/>
+    <function name="init" c:identifier="test_init">
+      <return-value transfer-ownership="none">
+        <type name="none" c:type="void"/>
+      </return-value>
+    </function>
+'''))
+        index = index_gir(gir_file)
+        self.assertNotIn('Test.Param', index.class_nodes)
+        self.assertNotIn('Test.Untyped', index.class_nodes)
+        self.assertEqual(index.nodes['test_param_ref'].gi_name,
+                         'Test.Param.ref')
+        self.assertEqual(index.nodes['test_init'].gi_name, 'Test.init')
+
+    def test_translations(self):
+        self.assertEqual(self.index.python_names['test_widget_show'],
+                         'Test.Widget.show')
+        self.assertEqual(self.index.javascript_names['test_widget_show'],
+                         'Test.Widget.prototype.show')
+        self.assertEqual(self.index.python_names['TestWidget'],
+                         'Test.Widget')
+        self.assertNotIn('TestWidget', self.index.javascript_names)
+
+    def test_introspectability(self):
+        self.assertIn('test_widget_hidden', self.index.non_introspectable)
+        self.assertIn('TestOpaque', self.index.non_introspectable)
+        self.assertEqual(self.index.non_introspectable_types,
+                         set(['Test.Opaque']))
+        # Refers to a type which isn't introspectable
+        self.assertIn('test_widget_set_opaque',
+                      self.index.non_introspectable)
+        self.assertNotIn('test_widget_show', self.index.non_introspectable)
+        self.assertEqual(self.index.foreign_type_refs,
+                         {'test_widget_get_file': ('Gio.File',)})
+
+    def test_reindex(self):
+        other = index_gir(self.gir_file)
+        for name, node in self.index.nodes.iteritems():
+            self.assertEqual(get_record_state(node),
+                             get_record_state(other.nodes[name]))
+
+
+class TestGirRepository(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.gir_file = write_file(self.__tmp_dir, 'Test-1.0.gir',
+                                   make_gir(TEST_GIR_CONTENTS))
+        self.gio_gir_file = write_file(
+            self.__tmp_dir, 'Gio-2.0.gir',
+            make_gir(GIO_GIR_CONTENTS, namespace='Gio',
+                     identifier_prefix='G', symbol_prefix='g'))
+        self.loaded = []
+        self.repository = GirRepository(self.__load)
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def __load(self, gir_file):
+        self.loaded.append(os.path.basename(gir_file))
+        return index_gir(gir_file)
+
+    def __register(self, gir_file):
+        self.repository.register(gir_file, read_gir_header(gir_file))
+
+    def test_lazy_loading(self):
+        self.__register(self.gir_file)
+        self.__register(self.gio_gir_file)
+        self.assertEqual(self.loaded, [])
+
+        # Only the namespace whose prefix matches is loaded
+        self.assertEqual(self.repository.get_node('test_init').gi_name,
+                         'Test.init')
+        self.assertEqual(self.loaded, ['Test-1.0.gir'])
+
+        self.assertIsNone(self.repository.get_node('test_nope'))
+        self.assertIsNone(self.repository.get_node('nope'))
+        self.assertEqual(self.loaded, ['Test-1.0.gir'])
+
+        self.assertIsNotNone(self.repository.get_class('Gio.File'))
+        self.assertEqual(self.loaded, ['Test-1.0.gir', 'Gio-2.0.gir'])
+
+    def test_translate(self):
+        self.__register(self.gir_file)
+        self.assertEqual(
+            self.repository.translate('test_widget_show', 'python'),
+            'Test.Widget.show')
+        self.assertEqual(
+            self.repository.translate('test_widget_show', 'javascript'),
+            'Test.Widget.prototype.show')
+        self.assertEqual(
+            self.repository.translate('test_widget_show', 'c'),
+            'test_widget_show')
+        self.assertIsNone(self.repository.translate('nope', 'python'))
+
+    def test_is_introspectable(self):
+        self.__register(self.gir_file)
+        self.assertTrue(self.repository.is_introspectable('test_widget_show'))
+        self.assertFalse(
+            self.repository.is_introspectable('test_widget_hidden'))
+        self.assertFalse(
+            self.repository.is_introspectable('test_widget_set_opaque'))
+        self.assertFalse(self.repository.is_introspectable('nope'))
+
+        # Gio.File is marked not introspectable in its own namespace
+        self.assertEqual(self.loaded, ['Test-1.0.gir'])
+        self.__register(self.gio_gir_file)
+        self.assertFalse(
+            self.repository.is_introspectable('test_widget_get_file'))
+        self.assertEqual(self.loaded, ['Test-1.0.gir', 'Gio-2.0.gir'])
+
+    def test_get_complete_node(self):
+        header = read_gir_header(self.gir_file)
+        partial = PartialGirIndex(self.gir_file, header.namespace,
+                                  header.version, header.identifier_prefixes,
+                                  header.symbol_prefixes)
+        node = GirCallable('function', 'init', 'Test', 'Test.init',
+                           c_identifier='test_init')
+        node.return_value = UnknownField
+        partial.nodes['test_init'] = node
+        self.repository.add(partial)
+
+        self.assertIs(self.repository.get_node('test_init'), node)
+        self.assertEqual(self.loaded, [])
+
+        complete = self.repository.get_complete_node('test_init')
+        self.assertEqual(self.loaded, ['Test-1.0.gir'])
+        self.assertEqual(complete.return_value.type_name, 'none')
+        self.assertIs(self.repository.get_node('test_init'), complete)
+
+        # Nodes of complete indexes are returned as is
+        self.assertIs(self.repository.get_complete_node('test_init'),
+                      complete)
+        self.assertEqual(self.loaded, ['Test-1.0.gir'])
+
+    def test_replace(self):
+        old_index = self.repository.load(self.gir_file)
+        old_node = self.repository.get_node('test_init')
+        new_index = index_gir(self.gir_file)
+        self.repository.replace(old_index, new_index)
+        node = self.repository.get_node('test_init')
+        self.assertIsNot(node, old_node)
+        self.assertIs(node, new_index.nodes['test_init'])
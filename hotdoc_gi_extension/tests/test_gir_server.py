@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+
+import os
+import errno
+import socket
+import shutil
+import tempfile
+import threading
+import unittest
+
+from hotdoc_gi_extension.gir_index import index_gir, get_record_state
+from hotdoc_gi_extension.gir_server import (
+    GirIndexServer, GirIndexClient, GirServerError, StaleRepositoryError,
+    RemoteGirRepository, RemoteLinkIndex, make_gir_repository,
+    _RequestHandler, _send_request)
+from hotdoc_gi_extension.gtkdoc_links import GtkDocLinkIndex
+from hotdoc_gi_extension.tests.girs import (
+    make_gir, write_file, TEST_GIR_CONTENTS)
+from hotdoc_gi_extension.tests.test_gtkdoc_links import (
+    write_devhelp_book, GLIB_ONLINE, GLIB_LINKS)
+
+
+GIO_GIR_CONTENTS = '''
+    <function name="init" c:identifier="g_init">
+      <return-value transfer-ownership="none">
+        <type name="none" c:type="void"/>
+      </return-value>
+    </function>
+'''
+
+
+class FakeServer(object):
+    def __init__(self):
+        self.calls = []
+
+    def call(self, method, args):
+        self.calls.append((method, args))
+        return 42
+
+
+class ResetSocket(object):
+    # pylint: disable=unused-argument
+    def recv(self, size):
+        raise socket.error(errno.ECONNRESET, os.strerror(errno.ECONNRESET))
+
+
+class TestRequestHandler(unittest.TestCase):
+    # Handlers handle their request when created, errors they let
+    # through would be logged by SocketServer with a traceback
+
+    def test_reset(self):
+        server = FakeServer()
+        _RequestHandler(ResetSocket(), None, server)
+        self.assertEqual(server.calls, [])
+
+    def test_closed_before_reply(self):
+        server = FakeServer()
+        server_sock, client_sock = socket.socketpair()
+        try:
+            _send_request(client_sock, 'get_node', [0, 'test_init'])
+            client_sock.close()
+            _RequestHandler(server_sock, None, server)
+        finally:
+            server_sock.close()
+        self.assertEqual(server.calls, [('get_node', [0, 'test_init'])])
+
+
+class DeadClient(object):
+    """A client whose server died after the repository was opened."""
+    def __init__(self, error):
+        self.error = error
+        self.calls = []
+
+    def call(self, method, *args):
+        self.calls.append(method)
+        if method == 'open':
+            return 0
+        if method == 'get_filters':
+            return [], []
+        raise self.error
+
+
+class TestRemoteFallback(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.gir_file = write_file(self.__tmp_dir, 'Test-1.0.gir',
+                                   make_gir(TEST_GIR_CONTENTS))
+        self.gtkdoc_dir = os.path.join(self.__tmp_dir, 'html')
+        write_devhelp_book(self.gtkdoc_dir, 'glib', GLIB_ONLINE, GLIB_LINKS)
+        self.errors = []
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def __make_repo(self, exc):
+        self.errors.append(exc)
+        return make_gir_repository([(self.gir_file, False)], index_gir)
+
+    def __make_link_index(self, exc):
+        self.errors.append(exc)
+        return GtkDocLinkIndex(self.gtkdoc_dir)
+
+    def test_repository(self):
+        for error in (socket.error(errno.EPIPE, os.strerror(errno.EPIPE)),
+                      EOFError()):
+            self.errors = []
+            client = DeadClient(error)
+            repo = RemoteGirRepository(client, [(self.gir_file, False)],
+                                       self.__make_repo)
+            self.assertEqual(repo.get_node('test_init').gi_name,
+                             'Test.init')
+            self.assertEqual(repo.get_class('Test.Widget').c_type,
+                             'TestWidget')
+            # The server is given up on after its first failure
+            self.assertEqual(client.calls, ['open', 'get_filters',
+                                            'get_node'])
+            self.assertEqual(self.errors, [error])
+
+    def test_link_index(self):
+        error = EOFError()
+        client = DeadClient(error)
+        link_index = RemoteLinkIndex(client, self.gtkdoc_dir,
+                                     self.__make_link_index)
+        self.assertEqual(link_index.get('g_malloc'),
+                         GLIB_ONLINE + GLIB_LINKS['g_malloc'])
+        self.assertNotIn('nope', link_index)
+        self.assertEqual(client.calls, ['get_href'])
+        self.assertEqual(self.errors, [error])
+
+    def test_no_fallback(self):
+        client = DeadClient(EOFError())
+        repo = RemoteGirRepository(client, [(self.gir_file, False)])
+        with self.assertRaises(EOFError):
+            repo.get_node('test_init')
+        with self.assertRaises(EOFError):
+            RemoteLinkIndex(client, self.gtkdoc_dir).get('g_malloc')
+
+
+class TestGirServer(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.__tmp_dir, 'run', 'test.sock')
+        self.gir_dir = os.path.join(self.__tmp_dir, 'girs')
+        os.mkdir(self.gir_dir)
+        self.gir_file = write_file(self.gir_dir, 'Test-1.0.gir',
+                                   make_gir(TEST_GIR_CONTENTS))
+        self.gio_gir_file = write_file(
+            self.gir_dir, 'Gio-2.0.gir',
+            make_gir(GIO_GIR_CONTENTS, namespace='Gio',
+                     identifier_prefix='G', symbol_prefix='g'))
+        self.server = GirIndexServer(
+            self.socket_path, os.path.join(self.__tmp_dir, 'cache'))
+        self.__thread = threading.Thread(target=self.server.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+        self.clients = []
+        self.client = self.__connect()
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.__thread.join()
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def __connect(self):
+        client = GirIndexClient(self.socket_path)
+        self.clients.append(client)
+        return client
+
+    def __open(self):
+        return RemoteGirRepository(self.client, [(self.gir_file, False),
+                                                 (self.gio_gir_file, True)])
+
+    def test_lookups(self):
+        repo = self.__open()
+        index = index_gir(self.gir_file)
+
+        for name in ('test_widget_show', 'TestWidget', 'TestWidget:label'):
+            self.assertEqual(get_record_state(repo.get_node(name)),
+                             get_record_state(index.nodes[name]))
+            self.assertEqual(
+                get_record_state(repo.get_complete_node(name)),
+                get_record_state(index.nodes[name]))
+        self.assertIsNone(repo.get_node('nope'))
+
+        # Lazy girs are loaded by the server when needed
+        self.assertEqual(repo.get_node('g_init').gi_name, 'Gio.init')
+
+        self.assertEqual(repo.get_class('Test.Widget').c_type, 'TestWidget')
+        self.assertEqual(sorted(repo.get_class_nodes()),
+                         sorted(index.class_nodes))
+        self.assertEqual(repo.translate('test_widget_show', 'javascript'),
+                         'Test.Widget.prototype.show')
+        self.assertTrue(repo.is_introspectable('test_widget_show'))
+        self.assertFalse(repo.is_introspectable('test_widget_hidden'))
+
+        self.assertEqual(repo.smart_filters, index.smart_filters)
+        self.assertEqual(repo.get_type_functions, index.get_type_functions)
+
+    def test_shared_repositories(self):
+        repo_id = self.client.call('open', [[self.gir_file, False]])
+        other_client = self.__connect()
+        self.assertEqual(
+            other_client.call('open', [[self.gir_file, False]]), repo_id)
+        self.assertNotEqual(
+            other_client.call('open', [[self.gio_gir_file, False]]),
+            repo_id)
+
+    def test_changed_gir(self):
+        repo = self.__open()
+        self.assertIsNotNone(repo.get_node('test_init'))
+
+        write_file(self.gir_dir, 'Test-1.0.gir',
+                   make_gir(TEST_GIR_CONTENTS.replace('test_init',
+                                                      'test_setup')))
+        repo = self.__open()
+        self.assertIsNone(repo.get_node('test_init'))
+        self.assertEqual(repo.get_node('test_setup').gi_name, 'Test.init')
+
+    def test_changed_gir_new_id(self):
+        girs = [[self.gir_file, False]]
+        repo_id = self.client.call('open', girs)
+        self.assertEqual(self.client.call('open', girs), repo_id)
+
+        write_file(self.gir_dir, 'Test-1.0.gir',
+                   make_gir(TEST_GIR_CONTENTS.replace('test_init',
+                                                      'test_setup')))
+        new_repo_id = self.client.call('open', girs)
+        self.assertNotEqual(new_repo_id, repo_id)
+        self.assertIsNone(
+            self.client.call('get_node', new_repo_id, 'test_init'))
+
+        # The stale repository is replaced, not kept alongside
+        with self.assertRaises(StaleRepositoryError):
+            self.client.call('get_node', repo_id, 'test_init')
+        self.assertEqual(self.client.call('open', girs), new_repo_id)
+        # pylint: disable=protected-access
+        self.assertEqual(len(self.server._GirIndexServer__repos), 1)
+
+    def test_changed_gir_other_repository(self):
+        girs_a = [[self.gir_file, False]]
+        girs_b = [[self.gir_file, False], [self.gio_gir_file, False]]
+        repo_a = self.client.call('open', girs_a)
+
+        write_file(self.gir_dir, 'Test-1.0.gir',
+                   make_gir(TEST_GIR_CONTENTS.replace('test_init',
+                                                      'test_setup')))
+        # B reloads the gir first, A must still see it changed
+        repo_b = self.client.call('open', girs_b)
+        self.assertIsNone(self.client.call('get_node', repo_b, 'test_init'))
+
+        new_repo_a = self.client.call('open', girs_a)
+        self.assertNotEqual(new_repo_a, repo_a)
+        self.assertIsNone(
+            self.client.call('get_node', new_repo_a, 'test_init'))
+        self.assertIsNotNone(
+            self.client.call('get_node', new_repo_a, 'test_setup'))
+
+    def test_replaced_repository(self):
+        repo = self.__open()
+        self.assertIsNotNone(repo.get_node('test_init'))
+
+        write_file(self.gir_dir, 'Test-1.0.gir',
+                   make_gir(TEST_GIR_CONTENTS.replace('test_init',
+                                                      'test_setup')))
+        other_client = self.__connect()
+        other_client.call('open', [[self.gir_file, False],
+                                   [self.gio_gir_file, True]])
+        # The repository of the first client was replaced, it opens the
+        # girs again
+        self.assertIsNotNone(repo.get_node('test_setup'))
+
+    def test_changed_books(self):
+        gtkdoc_dir = os.path.join(self.__tmp_dir, 'html')
+        write_devhelp_book(gtkdoc_dir, 'glib', GLIB_ONLINE, GLIB_LINKS)
+        self.__open()
+        link_index = RemoteLinkIndex(self.client, gtkdoc_dir)
+        self.assertIsNotNone(link_index.get('g_malloc'))
+
+        path = write_devhelp_book(gtkdoc_dir, 'glib', GLIB_ONLINE,
+                                  {'g_new': 'glib-Memory.html#g-new'})
+        mtime = os.path.getmtime(path) + 10
+        os.utime(path, (mtime, mtime))
+
+        # Books are checked again once per run, when girs are opened
+        self.__open()
+        link_index = RemoteLinkIndex(self.client, gtkdoc_dir)
+        self.assertIsNone(link_index.get('g_malloc'))
+        self.assertEqual(link_index.get('g_new'),
+                         GLIB_ONLINE + 'glib-Memory.html#g-new')
+
+    def test_changed_lazy_gir(self):
+        girs = [[self.gir_file, False], [self.gio_gir_file, True]]
+        repo_id = self.client.call('open', girs)
+
+        write_file(self.gir_dir, 'Gio-2.0.gir',
+                   make_gir(GIO_GIR_CONTENTS.replace('g_init', 'g_setup'),
+                            namespace='Gio', identifier_prefix='G',
+                            symbol_prefix='g'))
+        new_repo_id = self.client.call('open', girs)
+        self.assertNotEqual(new_repo_id, repo_id)
+        self.assertEqual(
+            self.client.call('get_node', new_repo_id, 'g_setup').gi_name,
+            'Gio.init')
+
+    def test_errors(self):
+        with self.assertRaises(GirServerError):
+            self.client.call('nope', 0)
+        with self.assertRaises(GirServerError):
+            self.client.call('get_node', 42, 'test_init')
+
+        # Garbage closes the connection, the server keeps serving
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.socket_path)
+        sock.sendall(b'\x04\x00\x00\x00nope')
+        self.assertEqual(sock.recv(1), b'')
+        sock.close()
+        self.assertIsNotNone(self.__open().get_node('test_init'))
+
+    def test_single_server(self):
+        with self.assertRaises(socket.error):
+            GirIndexServer(self.socket_path,
+                           os.path.join(self.__tmp_dir, 'cache'))
+
+    def test_private_socket_dir(self):
+        os.chmod(os.path.dirname(self.socket_path), 0o755)
+        with self.assertRaises(OSError):
+            self.__connect()
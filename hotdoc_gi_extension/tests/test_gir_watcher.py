@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+
+import os
+import select
+import shutil
+import tempfile
+import threading
+import unittest
+
+from hotdoc_gi_extension import gir_watcher
+from hotdoc_gi_extension.gir_watcher import GirWatcher
+from hotdoc_gi_extension.tests.girs import (
+    make_gir, write_file, TEST_GIR_CONTENTS)
+
+
+class _LateChangeSelect(object):
+    """Changes a file right after the watcher stopped waiting for events.
+    """
+    def __init__(self, folder, name):
+        self.__folder = folder
+        self.__name = name
+
+    def select(self, *args):
+        res = select.select(*args)
+        if not res[0] and self.__name is not None:
+            write_file(self.__folder, self.__name, 'changed late')
+            self.__name = None
+        return res
+
+
+class TestGirWatcher(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.gir_file = write_file(self.__tmp_dir, 'Test-1.0.gir',
+                                   make_gir(TEST_GIR_CONTENTS))
+        self.other_gir_file = write_file(self.__tmp_dir, 'Other-1.0.gir',
+                                         make_gir('', namespace='Other'))
+        self.watcher = GirWatcher([self.gir_file, self.other_gir_file],
+                                  poll_interval=0.05)
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def __wait(self):
+        # Don't hang if the change is missed
+        res = []
+        thread = threading.Thread(target=lambda: res.append(
+            self.watcher.wait()))
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+        self.assertEqual(len(res), 1, 'No change was reported')
+        return res[0]
+
+    def __poll(self):
+        # pylint: disable=protected-access
+        self.watcher._GirWatcher__inotify.close()
+        self.watcher._GirWatcher__inotify = None
+
+    def test_modified(self):
+        write_file(self.__tmp_dir, 'Test-1.0.gir', 'modified')
+        self.assertEqual(self.__wait(), set([self.gir_file]))
+
+    def test_replaced(self):
+        tmp_file = write_file(self.__tmp_dir, 'Test-1.0.gir.tmp', 'replaced')
+        os.rename(tmp_file, self.gir_file)
+        write_file(self.__tmp_dir, 'unrelated.txt', 'ignored')
+        self.assertEqual(self.__wait(), set([self.gir_file]))
+
+    def test_several(self):
+        write_file(self.__tmp_dir, 'Test-1.0.gir', 'modified')
+        write_file(self.__tmp_dir, 'Other-1.0.gir', 'modified')
+        self.assertEqual(self.__wait(),
+                         set([self.gir_file, self.other_gir_file]))
+
+    def test_late_change(self):
+        write_file(self.__tmp_dir, 'Test-1.0.gir', 'modified')
+        gir_watcher.select = _LateChangeSelect(self.__tmp_dir,
+                                               'Other-1.0.gir')
+        try:
+            self.assertEqual(self.__wait(), set([self.gir_file]))
+        finally:
+            gir_watcher.select = select
+
+        # The other gir changed after the events were read, the next
+        # wait reports it
+        self.assertEqual(self.__wait(), set([self.other_gir_file]))
+
+    def test_polling(self):
+        self.__poll()
+        write_file(self.__tmp_dir, 'Test-1.0.gir', 'modified')
+        self.assertEqual(self.__wait(), set([self.gir_file]))
+
+        # Removed files aren't reported until they are back
+        os.unlink(self.other_gir_file)
+        write_file(self.__tmp_dir, 'Test-1.0.gir', 'modified again')
+        self.assertEqual(self.__wait(), set([self.gir_file]))
+        write_file(self.__tmp_dir, 'Other-1.0.gir', 'back')
+        self.assertEqual(self.__wait(), set([self.other_gir_file]))
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from hotdoc_gi_extension import gtkdoc_links
+from hotdoc_gi_extension.gtkdoc_links import (
+    GtkDocLinkIndex, parse_devhelp_index, parse_sgml_index, parse_book)
+from hotdoc_gi_extension.tests.girs import write_file
+
+
+DEVHELP_TEMPLATE = '''<?xml version="1.0" encoding="utf-8" standalone="no"?>
+<book xmlns="http://www.devhelp.net/book" title="%(name)s Reference Manual"
+      link="index.html" author="" name="%(name)s" version="2" language="c"
+      online="%(online)s">
+  <chapters>
+    <sub name="API Reference" link="api.html">
+      <sub name="Memory" link="glib-Memory.html"/>
+    </sub>
+  </chapters>
+  <functions>
+    %(keywords)s
+  </functions>
+</book>
+'''
+
+
+def write_devhelp_book(gtkdoc_dir, name, online, links):
+    """Writes a book with a devhelp2 index listing `links`."""
+    dir_ = os.path.join(gtkdoc_dir, name)
+    if not os.path.isdir(dir_):
+        os.makedirs(dir_)
+    keywords = '\n    '.join(
+        '<keyword type="function" name="%s" link="%s"/>' % item
+        for item in sorted(links.items()))
+    return write_file(dir_, name + '.devhelp2', DEVHELP_TEMPLATE % {
+        'name': name, 'online': online, 'keywords': keywords})
+
+
+SGML_TEMPLATE = '''<ONLINE href="%(online)s">
+%(anchors)s
+'''
+
+
+def write_sgml_book(gtkdoc_dir, name, online, anchors):
+    """Writes a book with an index.sgml file listing `anchors`."""
+    dir_ = os.path.join(gtkdoc_dir, name)
+    if not os.path.isdir(dir_):
+        os.makedirs(dir_)
+    anchors = '\n'.join('<ANCHOR id="%s" href="%s/%s">' % (id_, name, link)
+                        for id_, link in sorted(anchors.items()))
+    return write_file(dir_, 'index.sgml', SGML_TEMPLATE % {
+        'online': online, 'anchors': anchors})
+
+
+GLIB_ONLINE = 'https://developer.gnome.org/glib/stable/'
+GLIB_LINKS = {
+    'g_malloc': 'glib-Memory.html#g-malloc',
+    'g_free': 'glib-Memory.html#g-free',
+    'GList': 'glib-Doubly-Linked-Lists.html#GList',
+    'G_MAXINT': 'glib-Limits.html#G-MAXINT:CAPS',
+}
+
+
+class TestGtkDocParsers(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.gtkdoc_dir = os.path.join(self.__tmp_dir, 'html')
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def test_devhelp(self):
+        path = write_devhelp_book(self.gtkdoc_dir, 'glib', GLIB_ONLINE,
+                                  GLIB_LINKS)
+        self.assertEqual(parse_devhelp_index(path),
+                         (GLIB_ONLINE, GLIB_LINKS))
+
+    def test_devhelp_offline(self):
+        path = write_devhelp_book(self.gtkdoc_dir, 'glib', '', GLIB_LINKS)
+        self.assertIsNone(parse_devhelp_index(path))
+
+    def test_sgml(self):
+        path = write_sgml_book(self.gtkdoc_dir, 'gtk3',
+                               'https://developer.gnome.org/gtk3/stable', {
+                                   'gtk-init': 'gtk3-General.html#gtk-init',
+                                   'GTK-MAJOR-VERSION:CAPS':
+                                   'gtk3-Feature-Test-Macros.html'
+                                   '#GTK-MAJOR-VERSION:CAPS'})
+        self.assertEqual(parse_sgml_index(path), (
+            'https://developer.gnome.org/gtk3/stable/', {
+                'gtk_init': 'gtk3-General.html#gtk-init',
+                'GTK_MAJOR_VERSION':
+                'gtk3-Feature-Test-Macros.html#GTK-MAJOR-VERSION:CAPS'}))
+
+    def test_sgml_fallback(self):
+        dir_ = os.path.join(self.gtkdoc_dir, 'glib')
+        write_devhelp_book(self.gtkdoc_dir, 'glib', '', GLIB_LINKS)
+        write_sgml_book(self.gtkdoc_dir, 'glib', GLIB_ONLINE[:-1],
+                        {'g-malloc': 'glib-Memory.html#g-malloc'})
+        self.assertEqual(parse_book(dir_), (
+            GLIB_ONLINE, {'g_malloc': 'glib-Memory.html#g-malloc'}))
+
+    def test_hrefs(self):
+        write_devhelp_book(self.gtkdoc_dir, 'glib', GLIB_ONLINE, GLIB_LINKS)
+        write_devhelp_book(self.gtkdoc_dir, 'gobject', GLIB_ONLINE, {
+            'g_object_new': 'gobject-The-Base-Object-Type.html#g-object-new'})
+        write_devhelp_book(self.gtkdoc_dir, 'gtk3',
+                           'https://developer.gnome.org/gtk3/stable/',
+                           {'gtk_init': 'gtk3-General.html#gtk-init'})
+
+        link_index = GtkDocLinkIndex(self.gtkdoc_dir)
+        link_index.gather()
+
+        # Links are stored relative to their prefix, kept once
+        entries = link_index.wait()
+        self.assertEqual(entries['g_malloc'][1], GLIB_LINKS['g_malloc'])
+        self.assertEqual(entries['g_malloc'][0], entries['g_object_new'][0])
+        self.assertNotEqual(entries['g_malloc'][0], entries['gtk_init'][0])
+
+        for name, link in GLIB_LINKS.items():
+            self.assertEqual(link_index.get(name), GLIB_ONLINE + link)
+        self.assertEqual(link_index.get('g_object_new'),
+                         GLIB_ONLINE +
+                         'gobject-The-Base-Object-Type.html#g-object-new')
+        self.assertEqual(link_index.get('gtk_init'),
+                         'https://developer.gnome.org/gtk3/stable/'
+                         'gtk3-General.html#gtk-init')
+        self.assertIsNone(link_index.get('gtk_main'))
+
+
+class TestGtkDocLinkCache(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.gtkdoc_dir = os.path.join(self.__tmp_dir, 'html')
+        self.cache_dir = os.path.join(self.__tmp_dir, 'cache')
+        os.makedirs(self.cache_dir)
+
+        write_devhelp_book(self.gtkdoc_dir, 'glib',
+                           'https://developer.gnome.org/glib/stable/',
+                           {'g_malloc': 'glib-Memory.html#g-malloc'})
+        write_devhelp_book(self.gtkdoc_dir, 'gtk3',
+                           'https://developer.gnome.org/gtk3/stable/',
+                           {'gtk_init': 'gtk3-General.html#gtk-init'})
+
+        # Count the books parsed
+        self.parsed = []
+        self.__parse_book = gtkdoc_links.parse_book
+
+        def _parse_book(dir_):
+            self.parsed.append(os.path.basename(dir_))
+            return self.__parse_book(dir_)
+        gtkdoc_links.parse_book = _parse_book
+
+    def tearDown(self):
+        gtkdoc_links.parse_book = self.__parse_book
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def __gather(self):
+        self.parsed = []
+        link_index = GtkDocLinkIndex(self.gtkdoc_dir, self.cache_dir)
+        link_index.gather()
+        return link_index
+
+    def test_unchanged(self):
+        self.__gather()
+        self.assertEqual(sorted(self.parsed), ['glib', 'gtk3'])
+
+        link_index = self.__gather()
+        self.assertEqual(self.parsed, [])
+        self.assertEqual(link_index.get('g_malloc'),
+                         'https://developer.gnome.org/glib/stable/'
+                         'glib-Memory.html#g-malloc')
+        self.assertEqual(link_index.get('gtk_init'),
+                         'https://developer.gnome.org/gtk3/stable/'
+                         'gtk3-General.html#gtk-init')
+
+    def test_changed(self):
+        self.__gather()
+        path = write_devhelp_book(self.gtkdoc_dir, 'gtk3',
+                                  'https://developer.gnome.org/gtk3/stable/',
+                                  {'gtk_main': 'gtk3-General.html#gtk-main'})
+        # Books are stamped with the mtime and size of their index
+        mtime = os.path.getmtime(path) + 10
+        os.utime(path, (mtime, mtime))
+
+        link_index = self.__gather()
+        self.assertEqual(self.parsed, ['gtk3'])
+        self.assertIsNotNone(link_index.get('g_malloc'))
+        self.assertIsNotNone(link_index.get('gtk_main'))
+        self.assertIsNone(link_index.get('gtk_init'))
+
+        self.__gather()
+        self.assertEqual(self.parsed, [])
+
+    def test_removed(self):
+        self.__gather()
+        shutil.rmtree(os.path.join(self.gtkdoc_dir, 'gtk3'))
+
+        link_index = self.__gather()
+        self.assertEqual(self.parsed, [])
+        self.assertIsNotNone(link_index.get('g_malloc'))
+        self.assertIsNone(link_index.get('gtk_init'))
+
+        # Adding it back parses it again
+        write_devhelp_book(self.gtkdoc_dir, 'gtk3',
+                           'https://developer.gnome.org/gtk3/stable/',
+                           {'gtk_init': 'gtk3-General.html#gtk-init'})
+        link_index = self.__gather()
+        self.assertEqual(self.parsed, ['gtk3'])
+        self.assertIsNotNone(link_index.get('gtk_init'))
+
+    def test_stale(self):
+        link_index = GtkDocLinkIndex(self.gtkdoc_dir, self.cache_dir)
+        self.assertFalse(link_index.is_stale())
+        link_index.gather()
+        self.assertFalse(link_index.is_stale())
+
+        path = write_devhelp_book(self.gtkdoc_dir, 'gtk3',
+                                  'https://developer.gnome.org/gtk3/stable/',
+                                  {'gtk_main': 'gtk3-General.html#gtk-main'})
+        mtime = os.path.getmtime(path) + 10
+        os.utime(path, (mtime, mtime))
+        self.assertTrue(link_index.is_stale())
+        link_index.gather()
+        self.assertFalse(link_index.is_stale())
+
+        shutil.rmtree(os.path.join(self.gtkdoc_dir, 'glib'))
+        self.assertTrue(link_index.is_stale())
+
+    def test_no_cache(self):
+        GtkDocLinkIndex(self.gtkdoc_dir).gather()
+        link_index = GtkDocLinkIndex(self.gtkdoc_dir)
+        link_index.gather()
+        self.assertEqual(len(self.parsed), 4)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+        self.assertIsNotNone(link_index.get('g_malloc'))
+
+    def test_lazy(self):
+        link_index = GtkDocLinkIndex(self.gtkdoc_dir, self.cache_dir)
+        self.assertEqual(self.parsed, [])
+        # Books are gathered on the first lookup
+        self.assertIn('g_malloc', link_index)
+        self.assertNotIn('g_free', link_index)
+        self.assertEqual(sorted(self.parsed), ['glib', 'gtk3'])
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from distutils.spawn import find_executable
+
+from hotdoc_gi_extension.gir_index import (
+    index_gir, get_record_state, PartialGirIndex, UnknownField)
+from hotdoc_gi_extension.typelib_index import (
+    index_typelib, index_gir_typelib, _HEADER, _MAGIC)
+from hotdoc_gi_extension.tests.girs import make_gir, write_file
+
+
+# Only introspectable nodes, which compile to a typelib as is, and only
+# types which typelibs tell apart: no aliases, no platform sized longs
+TYPELIB_GIR_CONTENTS = '''
+    <class name="Widget" c:type="TestWidget" c:symbol-prefix="widget"
+           parent="GObject.Object" glib:type-name="TestWidget"
+           glib:get-type="test_widget_get_type"
+           glib:type-struct="WidgetClass">
+      <implements name="Sizable"/>
+      <field name="parent_instance">
+        <type name="GObject.Object" c:type="GObject"/>
+      </field>
+      <constructor name="new" c:identifier="test_widget_new">
+        <return-value transfer-ownership="full">
+          <type name="Widget" c:type="TestWidget*"/>
+        </return-value>
+      </constructor>
+      <method name="show" c:identifier="test_widget_show" throws="1">
+        <return-value transfer-ownership="none">
+          <type name="gboolean" c:type="gboolean"/>
+        </return-value>
+        <parameters>
+          <instance-parameter name="widget" transfer-ownership="none">
+            <type name="Widget" c:type="TestWidget*"/>
+          </instance-parameter>
+          <parameter name="count" direction="out"
+                     caller-allocates="0" transfer-ownership="full">
+            <type name="gint" c:type="gint*"/>
+          </parameter>
+          <parameter name="mode" transfer-ownership="none">
+            <type name="Mode" c:type="TestMode"/>
+          </parameter>
+        </parameters>
+      </method>
+      <virtual-method name="draw">
+        <return-value transfer-ownership="none">
+          <type name="none" c:type="void"/>
+        </return-value>
+        <parameters>
+          <instance-parameter name="widget" transfer-ownership="none">
+            <type name="Widget" c:type="TestWidget*"/>
+          </instance-parameter>
+        </parameters>
+      </virtual-method>
+      <property name="label" writable="1" construct="1"
+                transfer-ownership="none">
+        <type name="utf8" c:type="gchar*"/>
+      </property>
+      <glib:signal name="clicked" when="last" no-hooks="1">
+        <return-value transfer-ownership="none">
+          <type name="none" c:type="void"/>
+        </return-value>
+        <parameters>
+          <parameter name="button" transfer-ownership="none">
+            <type name="guint" c:type="guint"/>
+          </parameter>
+        </parameters>
+      </glib:signal>
+    </class>
+    <interface name="Sizable" c:type="TestSizable" c:symbol-prefix="sizable"
+               glib:type-name="TestSizable"
+               glib:get-type="test_sizable_get_type">
+    </interface>
+    <record name="WidgetClass" c:type="TestWidgetClass"
+            glib:is-gtype-struct-for="Widget">
+      <field name="parent_class">
+        <type name="GObject.ObjectClass" c:type="GObjectClass"/>
+      </field>
+    </record>
+    <enumeration name="Mode" c:type="TestMode">
+      <member name="fast" value="0" c:identifier="TEST_MODE_FAST">
+      </member>
+    </enumeration>
+    <callback name="Callback" c:type="TestCallback">
+      <return-value transfer-ownership="none">
+        <type name="none" c:type="void"/>
+      </return-value>
+    </callback>
+    <function name="init" c:identifier="test_init">
+      <return-value transfer-ownership="none">
+        <type name="none" c:type="void"/>
+      </return-value>
+    </function>
+'''
+
+
+def _make_empty_typelib(namespace, version):
+    """Returns a typelib of namespace `namespace` without any entries."""
+    strings_offset = _HEADER.size
+    namespace_offset = strings_offset
+    version_offset = namespace_offset + len(namespace) + 1
+    header = _HEADER.pack(
+        _MAGIC, 4, 0, 0, 0, 0, _HEADER.size, 0, 0, 0,
+        version_offset + len(version) + 1, namespace_offset, version_offset,
+        0, 0, *([0] * 18))
+    return header + namespace + '\0' + version + '\0'
+
+
+class TestTypelibIndex(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.__typelib_path = os.environ.pop('GI_TYPELIB_PATH', None)
+        self.gir_dir = os.path.join(self.__tmp_dir, 'share', 'gir-1.0')
+        self.typelib_dir = os.path.join(self.__tmp_dir, 'lib',
+                                        'girepository-1.0')
+        os.makedirs(self.gir_dir)
+        os.makedirs(self.typelib_dir)
+        self.gir_file = write_file(self.gir_dir, 'Test-1.0.gir',
+                                   make_gir(TYPELIB_GIR_CONTENTS))
+
+    def tearDown(self):
+        if self.__typelib_path is not None:
+            os.environ['GI_TYPELIB_PATH'] = self.__typelib_path
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def __write_typelib(self, contents):
+        return write_file(self.typelib_dir, 'Test-1.0.typelib', contents)
+
+    def test_no_typelib(self):
+        self.assertIsNone(index_gir_typelib(self.gir_file))
+
+    def test_unreadable_typelibs(self):
+        typelib_file = self.__write_typelib('')
+        self.assertIsNone(index_typelib(typelib_file, self.gir_file))
+        typelib_file = self.__write_typelib('Not a typelib')
+        self.assertIsNone(index_typelib(typelib_file, self.gir_file))
+        typelib_file = self.__write_typelib(
+            _make_empty_typelib('Other', '1.0'))
+        self.assertIsNone(index_typelib(typelib_file, self.gir_file))
+        typelib_file = self.__write_typelib(
+            _make_empty_typelib('Test', '2.0'))
+        self.assertIsNone(index_typelib(typelib_file, self.gir_file))
+
+    def test_empty_typelib(self):
+        self.__write_typelib(_make_empty_typelib('Test', '1.0'))
+        mtime = os.path.getmtime(self.gir_file)
+
+        index = index_gir_typelib(self.gir_file)
+        self.assertIsInstance(index, PartialGirIndex)
+        self.assertEqual(index.gir_file, self.gir_file)
+        self.assertEqual(index.namespace, 'Test')
+        self.assertEqual(index.identifier_prefixes, ('Test',))
+        self.assertEqual(index.symbol_prefixes, ('test',))
+        self.assertEqual(index.includes, [('GObject', '2.0')])
+        self.assertEqual(index.nodes, {})
+
+        # Typelibs older than their gir aren't read
+        os.utime(self.gir_file, (mtime + 10, mtime + 10))
+        self.assertIsNone(index_gir_typelib(self.gir_file))
+
+
+def _matches(partial_state, state):
+    if partial_state is UnknownField:
+        return True
+    if isinstance(partial_state, tuple) and isinstance(state, tuple):
+        return len(partial_state) == len(state) and all(
+            _matches(*pair) for pair in zip(partial_state, state))
+    return partial_state == state
+
+
+@unittest.skipUnless(find_executable('g-ir-compiler'),
+                     'g-ir-compiler is needed to compile typelibs')
+class TestCompiledTypelibIndex(unittest.TestCase):
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.gir_file = write_file(self.__tmp_dir, 'Test-1.0.gir',
+                                   make_gir(TYPELIB_GIR_CONTENTS))
+        subprocess.check_call(
+            ['g-ir-compiler', self.gir_file, '--output',
+             os.path.join(self.__tmp_dir, 'Test-1.0.typelib')])
+        self.partial_index = index_gir_typelib(self.gir_file)
+        self.index = index_gir(self.gir_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+
+    def test_nodes(self):
+        self.assertIsInstance(self.partial_index, PartialGirIndex)
+        for name in ('TestWidget', 'TestWidget::TestWidget',
+                     'TestWidget::clicked', 'TestWidget:label',
+                     'TestWidget:::draw', 'TestSizable', 'TestWidgetClass',
+                     'TestMode', 'TestCallback', 'test_init',
+                     'test_widget_new', 'test_widget_show'):
+            self.assertIn(name, self.partial_index.nodes)
+
+        for name, node in self.partial_index.nodes.iteritems():
+            self.assertTrue(
+                _matches(get_record_state(node),
+                         get_record_state(self.index.nodes[name])),
+                name)
+
+    def test_tables(self):
+        for table_name in ('get_type_functions', 'smart_filters',
+                           'non_introspectable', 'foreign_type_refs'):
+            self.assertEqual(getattr(self.partial_index, table_name),
+                             getattr(self.index, table_name), table_name)
+        self.assertEqual(sorted(self.partial_index.class_nodes),
+                         sorted(self.index.class_nodes))
+
+        # Enumeration members are only known to the gir
+        for table_name in ('python_names', 'javascript_names'):
+            table = getattr(self.index, table_name)
+            for name, value in getattr(self.partial_index,
+                                       table_name).iteritems():
+                self.assertEqual(value, table[name], name)
+
+        self.assertTrue(set(['Test.Widget', 'Test.Sizable',
+                             'Test.WidgetClass', 'Test.Mode',
+                             'Test.Callback']) <=
+                        self.partial_index.type_names)
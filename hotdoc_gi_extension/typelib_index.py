@@ -0,0 +1,676 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015,2016 Mathieu Duponchelle <mathieu.duponchelle@opencreed.com>
+# Copyright © 2015,2016 Collabora Ltd
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Indexing of gir files from their compiled typelibs.
+
+A typelib is the binary form of the introspectable part of a gir file,
+laid out as fixed-size blobs which can be read without parsing any
+XML. This module reads the blobs of a typelib into the same records as
+`gir_index.index_gir`, in a fraction of the time.
+
+Typelibs don't carry everything the extension looks up in gir files:
+
+- nodes which aren't introspectable are left out of them, as are
+  aliases, constants and the members of enumerations, which are only
+  known by their C names in gir files.
+- the C types of parameters, the names of instance parameters and
+  whether records are disguised aren't known, these fields are
+  `gir_index.UnknownField`.
+- the C names of types are an identifier prefix of their namespace
+  followed by their name. When a namespace has several prefixes, the
+  prefix of a type is found from its GType name; types it can't be
+  found for are left out.
+
+The indexes of typelibs are thus `gir_index.PartialGirIndex` objects,
+which `gir_index.GirRepository` replaces with the index of their gir
+file when a lookup needs what they don't hold.
+
+Typelibs are mapped in memory rather than read.
+
+Only typelibs of format 4.0, whose namespace and version match those of
+their gir file, and which aren't older than it, are read.
+"""
+
+import os
+import re
+import glob
+import mmap
+import struct
+from collections import namedtuple
+
+from hotdoc.utils.loggable import debug
+
+from .gir_index import (GirParameter, GirCallable, GirProperty, GirType,
+                        PartialGirIndex, UnknownField, read_gir_header,
+                        finish_index)
+
+
+_MAGIC = b'GOBJ\nMETADATA\r\n\x1a'
+_MAJOR_VERSION = 4
+
+_Header = namedtuple('_Header', (
+    'magic', 'major_version', 'minor_version', 'reserved', 'n_entries',
+    'n_local_entries', 'directory', 'n_attributes', 'attributes',
+    'dependencies', 'size', 'namespace', 'nsversion', 'shared_library',
+    'c_prefix', 'entry_blob_size', 'function_blob_size',
+    'callback_blob_size', 'signal_blob_size', 'vfunc_blob_size',
+    'arg_blob_size', 'property_blob_size', 'field_blob_size',
+    'value_blob_size', 'attribute_blob_size', 'constant_blob_size',
+    'error_domain_blob_size', 'signature_blob_size', 'enum_blob_size',
+    'struct_blob_size', 'object_blob_size', 'interface_blob_size',
+    'union_blob_size'))
+
+_HEADER = struct.Struct('<16sBBHHHIIIIIIIII18H')
+
+# blob type, flags, name, offset
+_DIR_ENTRY = struct.Struct('<HHII')
+# blob type, flags, name, symbol, signature, flags
+_FUNCTION = struct.Struct('<HHIIIH')
+# blob type, flags, name, signature
+_CALLBACK = struct.Struct('<HHII')
+# flags, class closure, name, reserved, signature
+_SIGNAL = struct.Struct('<HHIII')
+# name, flags, signal, struct offset, invoker, reserved, signature
+_VFUNC = struct.Struct('<IHHHHII')
+# name, flags, reserved, type
+_PROPERTY = struct.Struct('<IIII')
+# name, flags, bits, struct offset, reserved, type
+_FIELD = struct.Struct('<IBBHII')
+# return type, flags, number of arguments
+_SIGNATURE = struct.Struct('<IHH')
+# name, flags, closure, destroy, padding, type
+_ARG = struct.Struct('<IIbbHI')
+# blob type, flags, name, gtype name, gtype init, size, n_fields, n_methods
+_STRUCT = struct.Struct('<HHIIIIHH')
+# blob type, flags, name, gtype name, gtype init, n_values, n_methods
+_ENUM = struct.Struct('<HHIIIHH')
+# blob type, flags, name, gtype name, gtype init, parent, gtype struct,
+# n_interfaces, n_fields, n_properties, n_methods, n_signals, n_vfuncs,
+# n_constants, n_field_callbacks
+_OBJECT = struct.Struct('<HHIIIHHHHHHHHHH')
+# blob type, flags, name, gtype name, gtype init, gtype struct,
+# n_prerequisites, n_properties, n_methods, n_signals, n_vfuncs,
+# n_constants
+_INTERFACE = struct.Struct('<HHIIIHHHHHHH')
+_UINT16 = struct.Struct('<H')
+_UINT32 = struct.Struct('<I')
+
+_BLOB_FUNCTION = 1
+_BLOB_CALLBACK = 2
+_BLOB_STRUCT = 3
+_BLOB_BOXED = 4
+_BLOB_ENUM = 5
+_BLOB_FLAGS = 6
+_BLOB_OBJECT = 7
+_BLOB_INTERFACE = 8
+_BLOB_UNION = 11
+
+_TAG_VOID = 0
+_TAG_ARRAY = 15
+_TAG_INTERFACE = 16
+
+# type tag -> gi type name
+_BASIC_TYPES = {
+    0: 'none',
+    1: 'gboolean',
+    2: 'gint8',
+    3: 'guint8',
+    4: 'gint16',
+    5: 'guint16',
+    6: 'gint',
+    7: 'guint',
+    8: 'gint64',
+    9: 'guint64',
+    10: 'gfloat',
+    11: 'gdouble',
+    12: 'GType',
+    13: 'utf8',
+    14: 'filename',
+    17: 'GLib.List',
+    18: 'GLib.SList',
+    19: 'GLib.HashTable',
+    20: 'GLib.Error',
+    21: 'gunichar',
+}
+
+_CAMEL_CASE_BOUNDARY = re.compile(r'([a-z0-9])([A-Z])')
+
+_SMART_FILTER_PATTERNS = ('%s_IS_%s', '%s_TYPE_%s', '%s_%s', '%s_%s_CLASS',
+                          '%s_IS_%s_CLASS', '%s_%s_GET_CLASS',
+                          '%s_%s_GET_IFACE')
+
+
+def _iter_typelib_dirs(gir_file):
+    yield os.path.dirname(gir_file)
+
+    for dir_ in (os.getenv('GI_TYPELIB_PATH') or '').split(os.pathsep):
+        if dir_:
+            yield dir_
+
+    # <prefix>/share/gir-1.0 -> <prefix>/lib*/[<triplet>/]girepository-1.0
+    prefix = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(gir_file))))
+    for pattern in ('lib*', os.path.join('lib*', '*')):
+        for dir_ in sorted(glob.glob(os.path.join(prefix, pattern,
+                                                  'girepository-1.0'))):
+            yield dir_
+
+
+def find_typelib(gir_file, header):
+    """Returns the typelib compiled from `gir_file`, or `None`.
+
+    Args:
+        gir_file: str, the path of the gir file.
+        header: gir_index.GirHeader, the header of `gir_file`.
+    """
+    name = '%s-%s.typelib' % (header.namespace, header.version)
+    for dir_ in _iter_typelib_dirs(gir_file):
+        typelib_file = os.path.join(dir_, name)
+        if os.path.exists(typelib_file):
+            return typelib_file
+    return None
+
+
+class _TypelibIndexer(object):
+    """Reads the blobs of a typelib into a `PartialGirIndex`."""
+    def __init__(self, data, header):
+        self.__data = data
+        self.__header = header
+        self.__strings = {}
+        self.__strings_at = {}
+        self.__identifier_prefixes = None
+        # names of the types of the namespace -> their C names
+        self.__c_types = {}
+        self.__sym_prefixes = None
+        self.__symbol_prefixes = ()
+        self.__ns_name = None
+        self.index = None
+
+    def __intern(self, string):
+        return self.__strings.setdefault(string, string)
+
+    def __string(self, offset):
+        """Returns the string at `offset`, `None` for offset 0."""
+        # Strings are stored once, and referred to by their offset
+        try:
+            return self.__strings_at[offset]
+        except KeyError:
+            pass
+        string = None
+        if offset:
+            data = self.__data
+            string = self.__intern(data[offset:data.find(b'\0', offset)])
+        self.__strings_at[offset] = string
+        return string
+
+    def __entry(self, index):
+        """Returns the blob type and name of 1-based directory `index`.
+
+        Names of entries of other namespaces are qualified.
+        """
+        header = self.__header
+        blob_type, flags, name, offset = _DIR_ENTRY.unpack_from(
+            self.__data, header.directory + (index - 1) *
+            header.entry_blob_size)
+        if flags & 1:
+            return blob_type, self.__string(name)
+        return blob_type, self.__intern(
+            '%s.%s' % (self.__string(offset), self.__string(name)))
+
+    def __make_parameter(self, name, direction, type_):
+        # Typelibs only hold type tags, which don't tell C types apart,
+        # eg. gchar* and const char* are both utf8
+        pointer = False
+        # The low 24 bits of simple types are 0, else they are the
+        # offset of a complex type blob
+        while type_ & 0xFFFFFF:
+            tag = ord(self.__data[type_]) >> 3
+            if tag == _TAG_ARRAY:
+                type_ = _UINT32.unpack_from(self.__data, type_ + 4)[0]
+                continue
+
+            if tag == _TAG_INTERFACE:
+                iface = _UINT16.unpack_from(self.__data, type_ + 2)[0]
+                _, type_name = self.__entry(iface)
+                return GirParameter(name, direction, UnknownField, type_name)
+            break
+        else:
+            tag = type_ >> 27
+            pointer = type_ & (1 << 24)
+
+        if tag == _TAG_VOID and pointer:
+            type_name = 'gpointer'
+        else:
+            type_name = _BASIC_TYPES.get(tag)
+        return GirParameter(name, direction, UnknownField, type_name)
+
+    def __make_callable(self, tag, name, gi_name, signature, c_identifier=None,
+                        c_type=None, instance_type=None):
+        node = GirCallable(tag, name, self.__ns_name, gi_name,
+                           c_identifier=c_identifier, c_type=c_type)
+        if instance_type is not None:
+            node.instance_parameter = GirParameter(
+                UnknownField, 'in', UnknownField, instance_type)
+
+        data = self.__data
+        arg_size = self.__header.arg_blob_size
+        return_type, flags, n_args = _SIGNATURE.unpack_from(data, signature)
+        node.return_value = self.__make_parameter(None, 'in', return_type)
+        node.throws = bool(flags & (1 << 5))
+
+        params = []
+        offset = signature + self.__header.signature_blob_size
+        for _ in range(n_args):
+            arg_name, arg_flags, _, _, _, type_ = _ARG.unpack_from(data,
+                                                                   offset)
+            direction = ('in', 'in', 'out', 'inout')[arg_flags & 3]
+            params.append(self.__make_parameter(self.__string(arg_name),
+                                                direction, type_))
+            offset += arg_size
+        node.parameters = tuple(params)
+        return node
+
+    def __index_functions(self, offset, count, parent_gi_name,
+                          instance_type=None):
+        data = self.__data
+        nodes = self.index.nodes
+        for _ in range(count):
+            _, flags, name, symbol, signature, static = \
+                _FUNCTION.unpack_from(data, offset)
+            offset += self.__header.function_blob_size
+
+            if flags & (1 << 3):
+                tag = 'constructor'
+            elif not static & 1:
+                tag = 'method'
+            else:
+                tag = 'function'
+            name = self.__string(name)
+            symbol = self.__string(symbol)
+            node = self.__make_callable(
+                tag, name, '%s.%s' % (parent_gi_name, name), signature,
+                c_identifier=symbol,
+                instance_type=instance_type if tag == 'method' else None)
+            # Older typelibs flag throwing functions here
+            node.throws = node.throws or bool(flags & (1 << 5))
+            nodes[symbol] = node
+        return offset
+
+    def __index_properties(self, offset, count, klass):
+        data = self.__data
+        properties = []
+        for _ in range(count):
+            name, flags, _, type_ = _PROPERTY.unpack_from(data, offset)
+            offset += self.__header.property_blob_size
+
+            name = self.__string(name)
+            node = GirProperty('property', name, self.__ns_name,
+                               '%s.%s' % (klass.gi_name, name))
+            node.type_ = self.__make_parameter(name, 'in', type_)
+            node.writable = bool(flags & (1 << 2))
+            node.construct = bool(flags & (1 << 3))
+            node.construct_only = bool(flags & (1 << 4))
+            self.index.nodes['%s:%s' % (klass.c_type, name)] = node
+            properties.append(node)
+        klass.properties = tuple(properties)
+        return offset
+
+    def __index_signals(self, offset, count, klass):
+        data = self.__data
+        signals = []
+        for _ in range(count):
+            flags, _, name, _, signature = _SIGNAL.unpack_from(data, offset)
+            offset += self.__header.signal_blob_size
+
+            name = self.__string(name)
+            node = self.__make_callable('signal', name, '%s.%s' % (
+                klass.gi_name, name), signature)
+            if flags & (1 << 2):
+                node.when = 'last'
+            elif flags & (1 << 1):
+                node.when = 'first'
+            elif flags & (1 << 3):
+                node.when = 'cleanup'
+            node.no_hooks = bool(flags & (1 << 7))
+            self.index.nodes['%s::%s' % (klass.c_type, name)] = node
+            signals.append(node)
+        klass.signals = tuple(signals)
+        return offset
+
+    def __index_vfuncs(self, offset, count, klass):
+        data = self.__data
+        vfuncs = []
+        for _ in range(count):
+            name, flags, _, _, _, _, signature = _VFUNC.unpack_from(data,
+                                                                    offset)
+            offset += self.__header.vfunc_blob_size
+
+            name = self.__string(name)
+            node = self.__make_callable(
+                'virtual-method', name, '%s.%s' % (klass.gi_name, name),
+                signature, instance_type=klass.name)
+            node.throws = node.throws or bool(flags & (1 << 4))
+            self.index.nodes['%s:::%s' % (klass.c_type, name)] = node
+            vfuncs.append(node)
+        klass.virtual_methods = tuple(vfuncs)
+        return offset
+
+    def __get_c_type(self, name, gtype_name):
+        prefixes = self.__identifier_prefixes
+        if len(prefixes) == 1:
+            return self.__intern(prefixes[0] + name)
+
+        # The GType name of a type usually is its C name
+        for prefix in prefixes:
+            if gtype_name == prefix + name:
+                return gtype_name
+        return None
+
+    def __make_type(self, tag, name, gtype_name):
+        """Returns the `GirType` of type `name`, or `None` if its C name
+        isn't known."""
+        gi_name = '%s.%s' % (self.__ns_name, name)
+        self.index.type_names.add(gi_name)
+        c_type = self.__get_c_type(name, gtype_name)
+        if c_type is None:
+            return None
+
+        node = GirType(tag, name, self.__ns_name, gi_name, c_type=c_type)
+        node.type_name = gtype_name
+        self.__c_types[name] = c_type
+        self.index.nodes[c_type] = node
+        return node
+
+    def __get_class_sym_prefix(self, name, gtype_init):
+        # eg. g_file_get_type -> file
+        if gtype_init and gtype_init.endswith('_get_type'):
+            sym_prefix = gtype_init[:-len('_get_type')]
+            for prefix in self.__symbol_prefixes:
+                if sym_prefix.startswith(prefix + '_'):
+                    return sym_prefix[len(prefix) + 1:]
+
+        # Fundamental types have no get_type function, eg. ParamSpecInt
+        return _CAMEL_CASE_BOUNDARY.sub(r'\1_\2', name).lower()
+
+    def __add_smart_filters(self, name, gtype_init):
+        sym_prefix = self.__get_class_sym_prefix(name, gtype_init)
+        for pattern in _SMART_FILTER_PATTERNS:
+            self.index.smart_filters.add(
+                (pattern % (self.__sym_prefixes, sym_prefix)).upper())
+
+    def __index_class(self, tag, name, gtype_name, gtype_init):
+        index = self.index
+        gtype_init = self.__string(gtype_init)
+        index.get_type_functions.add(gtype_init)
+        self.__add_smart_filters(name, gtype_init)
+
+        node = self.__make_type(tag, name, self.__string(gtype_name))
+        if node is not None:
+            index.nodes['%s::%s' % (node.c_type, node.c_type)] = node
+            index.class_nodes[node.gi_name] = node
+        return node
+
+    def __skip_fields(self, offset, count):
+        header = self.__header
+        for _ in range(count):
+            _, flags, _, _, _, _ = _FIELD.unpack_from(self.__data, offset)
+            offset += header.field_blob_size
+            # Fields of callback types are followed by their callback
+            if flags & (1 << 2):
+                offset += header.callback_blob_size
+        return offset
+
+    def __index_object(self, offset):
+        data = self.__data
+        header = self.__header
+        _, _, name, gtype_name, gtype_init, parent, gtype_struct, \
+            n_interfaces, n_fields, n_properties, n_methods, n_signals, \
+            n_vfuncs, _, n_field_callbacks = _OBJECT.unpack_from(data, offset)
+
+        node = self.__index_class('class', self.__string(name), gtype_name,
+                                  gtype_init)
+        # Its members are looked up in the gir file
+        if node is None:
+            return None
+
+        if parent:
+            node.parent = self.__entry(parent)[1]
+        if gtype_struct:
+            node.type_struct = self.__entry(gtype_struct)[1]
+
+        offset += header.object_blob_size
+        node.implements = tuple(
+            self.__entry(_UINT16.unpack_from(data, offset + 2 * i)[0])[1]
+            for i in range(n_interfaces))
+        offset += 2 * (n_interfaces + n_interfaces % 2)
+        offset += n_fields * header.field_blob_size + \
+            n_field_callbacks * header.callback_blob_size
+
+        offset = self.__index_properties(offset, n_properties, node)
+        offset = self.__index_functions(offset, n_methods, node.gi_name,
+                                        node.name)
+        offset = self.__index_signals(offset, n_signals, node)
+        self.__index_vfuncs(offset, n_vfuncs, node)
+        return node
+
+    def __index_interface(self, offset):
+        data = self.__data
+        header = self.__header
+        _, _, name, gtype_name, gtype_init, gtype_struct, n_prerequisites, \
+            n_properties, n_methods, n_signals, n_vfuncs, _ = \
+            _INTERFACE.unpack_from(data, offset)
+
+        node = self.__index_class('interface', self.__string(name),
+                                  gtype_name, gtype_init)
+        if node is None:
+            return None
+
+        if gtype_struct:
+            node.type_struct = self.__entry(gtype_struct)[1]
+
+        offset += header.interface_blob_size
+        offset += 2 * (n_prerequisites + n_prerequisites % 2)
+
+        offset = self.__index_properties(offset, n_properties, node)
+        offset = self.__index_functions(offset, n_methods, node.gi_name,
+                                        node.name)
+        offset = self.__index_signals(offset, n_signals, node)
+        self.__index_vfuncs(offset, n_vfuncs, node)
+        return node
+
+    def __index_struct(self, blob_type, offset):
+        header = self.__header
+        _, flags, name, gtype_name, _, _, n_fields, n_methods = \
+            _STRUCT.unpack_from(self.__data, offset)
+        name = self.__string(name)
+
+        # Boxed types which aren't records have no C type in gir files
+        if blob_type != _BLOB_BOXED:
+            tag = 'record' if blob_type == _BLOB_STRUCT else 'union'
+            # Only registered types have a gtype name
+            node = self.__make_type(tag, name, None if flags & 2 else
+                                    self.__string(gtype_name))
+            if node is not None:
+                node.disguised = UnknownField
+
+        if blob_type == _BLOB_UNION:
+            offset += header.union_blob_size
+        else:
+            offset += header.struct_blob_size
+        offset = self.__skip_fields(offset, n_fields)
+
+        instance_type = None if blob_type == _BLOB_BOXED else name
+        self.__index_functions(offset, n_methods,
+                               '%s.%s' % (self.__ns_name, name),
+                               instance_type)
+
+    def __index_enum(self, blob_type, offset):
+        header = self.__header
+        _, flags, name, gtype_name, _, n_values, n_methods = \
+            _ENUM.unpack_from(self.__data, offset)
+
+        tag = 'enumeration' if blob_type == _BLOB_ENUM else 'bitfield'
+        name = self.__string(name)
+        self.__make_type(tag, name, None if flags & 2
+                         else self.__string(gtype_name))
+
+        offset += header.enum_blob_size + n_values * header.value_blob_size
+        self.__index_functions(offset, n_methods,
+                               '%s.%s' % (self.__ns_name, name))
+
+    def __index_callback(self, offset):
+        _, _, name, signature = _CALLBACK.unpack_from(self.__data, offset)
+        name = self.__string(name)
+        gi_name = '%s.%s' % (self.__ns_name, name)
+        self.index.type_names.add(gi_name)
+        c_type = self.__get_c_type(name, None)
+        if c_type is None:
+            return
+
+        node = self.__make_callable('callback', name, gi_name, signature,
+                                    c_type=c_type)
+        self.index.nodes[c_type] = node
+
+    def run(self, gir_file, gir_header):
+        data = self.__data
+        header = self.__header
+
+        self.__ns_name = gir_header.namespace
+        self.__identifier_prefixes = gir_header.identifier_prefixes or ('',)
+        self.__sym_prefixes = ','.join(gir_header.symbol_prefixes)
+        self.__symbol_prefixes = gir_header.symbol_prefixes
+
+        index = PartialGirIndex(gir_file, gir_header.namespace,
+                                gir_header.version,
+                                gir_header.identifier_prefixes,
+                                gir_header.symbol_prefixes)
+        index.includes = gir_header.includes
+        self.index = index
+
+        is_gtype_struct_for = {}
+        classes = []
+        for i in range(header.n_local_entries):
+            blob_type, _, _, offset = _DIR_ENTRY.unpack_from(
+                data, header.directory + i * header.entry_blob_size)
+
+            if blob_type == _BLOB_FUNCTION:
+                self.__index_functions(offset, 1, self.__ns_name)
+            elif blob_type == _BLOB_CALLBACK:
+                self.__index_callback(offset)
+            elif blob_type in (_BLOB_STRUCT, _BLOB_BOXED, _BLOB_UNION):
+                self.__index_struct(blob_type, offset)
+            elif blob_type in (_BLOB_ENUM, _BLOB_FLAGS):
+                self.__index_enum(blob_type, offset)
+            elif blob_type == _BLOB_OBJECT:
+                classes.append(self.__index_object(offset))
+            elif blob_type == _BLOB_INTERFACE:
+                classes.append(self.__index_interface(offset))
+
+        # Class structures only know they are, not which class they're for
+        for klass in classes:
+            if klass is not None and klass.type_struct:
+                is_gtype_struct_for[klass.type_struct] = klass.name
+        for type_struct, klass_name in is_gtype_struct_for.iteritems():
+            node = index.nodes.get(self.__c_types.get(type_struct))
+            if node is not None:
+                node.is_gtype_struct_for = klass_name
+
+        finish_index(index)
+        return index
+
+
+def _read_header(data):
+    if len(data) < _HEADER.size or data[:len(_MAGIC)] != _MAGIC:
+        return None
+    header = _Header._make(_HEADER.unpack_from(data, 0))
+    if header.major_version != _MAJOR_VERSION:
+        return None
+    return header
+
+
+def index_typelib(typelib_file, gir_file, gir_header=None):
+    """Reads `typelib_file` and returns its `gir_index.PartialGirIndex`.
+
+    Args:
+        typelib_file: str, the typelib compiled from `gir_file`.
+        gir_file: str, the gir file whose index is partially read.
+        gir_header: gir_index.GirHeader, the header of `gir_file`, which
+            holds what typelibs don't: prefixes and versioned includes.
+
+    Returns:
+        gir_index.PartialGirIndex: the index, or `None` if the typelib
+            isn't one that can be read, or wasn't compiled from
+            `gir_file`.
+    """
+    if gir_header is None:
+        gir_header = read_gir_header(gir_file)
+
+    with open(typelib_file, 'rb') as _:
+        # Empty files can't be mapped
+        if not os.fstat(_.fileno()).st_size:
+            return None
+        data = mmap.mmap(_.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        header = _read_header(data)
+        if header is None:
+            debug('Not reading %s, unknown typelib format' % typelib_file,
+                  'gi-extension')
+            return None
+
+        ns_end = data.find(b'\0', header.namespace)
+        version_end = data.find(b'\0', header.nsversion)
+        if (data[header.namespace:ns_end],
+                data[header.nsversion:version_end]) != \
+                (gir_header.namespace, gir_header.version):
+            debug('Not reading %s, it is not compiled from %s' % (
+                typelib_file, gir_file), 'gi-extension')
+            return None
+
+        # Strings are copied out of the map, nothing refers to it
+        return _TypelibIndexer(data, header).run(gir_file, gir_header)
+    finally:
+        data.close()
+
+
+def index_gir_typelib(gir_file):
+    """Returns the `gir_index.PartialGirIndex` of `gir_file`, or `None`.
+
+    The index is read from the typelib compiled from `gir_file`, if one
+    is found and is at least as recent as `gir_file`.
+    """
+    gir_header = read_gir_header(gir_file)
+    if gir_header is None:
+        return None
+
+    typelib_file = find_typelib(gir_file, gir_header)
+    if typelib_file is None:
+        return None
+
+    if os.path.getmtime(typelib_file) < os.path.getmtime(gir_file):
+        debug('Not reading %s, it is older than %s' % (typelib_file,
+                                                        gir_file),
+              'gi-extension')
+        return None
+
+    # pylint: disable=broad-except
+    try:
+        return index_typelib(typelib_file, gir_file, gir_header)
+    except Exception as exc:
+        debug('Reading %s failed: %s' % (typelib_file, exc), 'gi-extension')
+        return None